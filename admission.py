@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Controllo di ammissione per le richieste che avviano uno scraping.
+
+Al massimo MAX_CONCURRENT_SCRAPES scraping sono eseguiti insieme; le altre
+richieste attendono in coda (al massimo MAX_QUEUE_DEPTH) per non più di
+MAX_QUEUE_WAIT secondi. Oltre questi limiti la richiesta viene rifiutata
+subito con Overloaded, che l'API traduce in un 503 con Retry-After.
+
+Anche le richieste che attendono uno scraping già avviato da un'altra
+(single-flight, vedi snapshot_cache.py) occupano un posto in coda, ma
+attendono fino alla propria scadenza e non MAX_QUEUE_WAIT: lo scraping
+che le unisce può durare più dell'attesa per uno slot.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+MAX_CONCURRENT_SCRAPES = int(os.environ.get("MAX_CONCURRENT_SCRAPES", "2"))
+MAX_QUEUE_DEPTH = int(os.environ.get("MAX_QUEUE_DEPTH", "4"))
+MAX_QUEUE_WAIT = float(os.environ.get("MAX_QUEUE_WAIT", "5"))
+RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "30"))
+
+
+class Overloaded(RuntimeError):
+    """Sollevata quando uno scraping non può essere ammesso."""
+
+    def __init__(self, message: str, retry_after: int = RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Semaforo con coda limitata e contatori per il monitoraggio."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_SCRAPES,
+                 max_queue_depth: int = MAX_QUEUE_DEPTH,
+                 max_queue_wait: float = MAX_QUEUE_WAIT,
+                 retry_after: int = RETRY_AFTER):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._followers = 0
+        self._peak_queued = 0
+        self._admitted = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        Occupa uno slot di scraping per la durata del blocco with.
+
+        Raises:
+            Overloaded se la coda è piena o l'attesa supera max_queue_wait
+        """
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                if self._queued >= self.max_queue_depth:
+                    self._rejected_queue_full += 1
+                    raise Overloaded("Troppe richieste in coda", self.retry_after)
+                self._queued += 1
+                self._peak_queued = max(self._peak_queued, self._queued)
+
+            acquired = self._semaphore.acquire(timeout=self.max_queue_wait)
+
+            with self._lock:
+                self._queued -= 1
+                if not acquired:
+                    self._rejected_timeout += 1
+                    raise Overloaded("Tempo di attesa in coda superato", self.retry_after)
+
+        with self._lock:
+            self._active += 1
+            self._admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._semaphore.release()
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> None:
+        """
+        Attende event (uno scraping avviato da un'altra richiesta) occupando
+        un posto in coda.
+
+        Args:
+            event: Evento impostato al termine dello scraping
+            timeout: Secondi di attesa al massimo (None = senza limite)
+
+        Raises:
+            Overloaded se la coda è piena o l'attesa supera timeout
+        """
+        if event.is_set():
+            return
+        with self._lock:
+            if self._queued >= self.max_queue_depth:
+                self._rejected_queue_full += 1
+                raise Overloaded("Troppe richieste in coda", self.retry_after)
+            self._queued += 1
+            self._followers += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+
+        done = event.wait(timeout=timeout)
+
+        with self._lock:
+            self._queued -= 1
+            self._followers -= 1
+            if not done:
+                self._rejected_timeout += 1
+                raise Overloaded("Tempo di attesa dello scraping in corso superato", self.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue_depth": self.max_queue_depth,
+                "max_queue_wait": self.max_queue_wait,
+                "active": self._active,
+                "queued": self._queued,
+                "following": self._followers,
+                "peak_queued": self._peak_queued,
+                "admitted": self._admitted,
+                "rejected": self._rejected_queue_full + self._rejected_timeout,
+                "rejected_queue_full": self._rejected_queue_full,
+                "rejected_timeout": self._rejected_timeout,
+            }
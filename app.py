@@ -1,60 +1,444 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Server Flask per esporre lo scraper dei cinema di Matera come API HTTP.
+Server Flask per esporre lo scraper dei cinema del registro (cinemas.json) come API HTTP.
 Può essere chiamato da Make.com o altri servizi web.
 """
 
-from flask import Flask, jsonify, Response, request
+from flask import Flask, g, jsonify, Response, request
 from flask_cors import CORS
-from scraper import scrape_cinema, CINEMA_URLS, format_telegram_message
-from trakt_enrich import enrich_with_trakt, MissingTraktCredentials
-from datetime import datetime
+from scraper import (scrape_cinema, scrape_all_cinemas, scrape_film, iter_scrape, film_slug, deadline_after,
+                     CINEMA_URLS, DETAILS, DETAILS_ALL, INCOMPLETE, DeadlineExceeded)
+from trakt_enrich import enrich_with_trakt, MissingTraktCredentials, TRAKT_DEADLINE
+import changes
+import http_cache
+import http_client
+import metrics
+import pipeline
+import profiling
+import registry
+from snapshot_cache import MISS, SnapshotCache
+from admission import AdmissionController, Overloaded
+from responses import Encoded, EncodedCache, JSON_MIMETYPE, dumps
+import showtimes
+import title_search
+import telegram_render
+from datetime import date, datetime, timedelta
+import hmac
+import json
+import os
+import time
 import traceback
 
 app = Flask(__name__)
 CORS(app)  # Abilita CORS per permettere chiamate da Make.com
 
+# Limite agli scraping contemporanei: le richieste in eccesso ricevono un 503
+admission = AdmissionController()
+# Secondi entro cui rispondere a una richiesta che attende uno scraping, dal suo arrivo (0 = nessun limite):
+# allo scadere la risposta contiene i dati raccolti fino a quel momento
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", "25"))
+
+
+def _follow_scrape(event):
+    """Attesa di uno scraping già in corso: in coda, fino alla scadenza della richiesta."""
+    deadline = _request_deadline()
+    admission.wait(event, None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+
+# Ultimi risultati dello scraping, serviti subito e aggiornati in background;
+# chi attende uno scraping già in corso occupa un posto nella coda di ammissione
+snapshots = SnapshotCache(follower_wait=_follow_scrape)
+# Versioni dei risultati serviti, per /api/films/changes
+history = changes.VersionHistory()
+# Corpi serializzati (con ETag e versioni compresse) degli snapshot serviti
+encoded = EncodedCache()
+
+# Statistiche già tenute da cache HTTP, controllo di ammissione e risposte, lette da /metrics
+metrics.callback(
+    "scraper_http_cache_events_total", "Eventi della cache HTTP e del parsing per tipo", "counter",
+    ("event",), lambda: {(event,): value for event, value in http_cache.get_stats().items()}
+)
+metrics.callback(
+    "api_admission", "Stato del controllo di ammissione degli scraping", "gauge",
+    ("field",), lambda: {(field,): value for field, value in admission.stats().items()}
+)
+metrics.callback(
+    "api_responses_total", "Corpi serializzati, riusati, 304 e byte inviati", "counter",
+    ("event",), lambda: {
+        (event,): value for event, value in encoded.stats().items()
+        if isinstance(value, (int, float)) and event != "entries"
+    }
+)
+metrics.callback(
+    "api_responses_cached", "Corpi serializzati tenuti in cache", "gauge",
+    (), lambda: {(): encoded.stats()["entries"]}
+)
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    """Durata della richiesta per route (il modello della route, non il percorso)."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+def _profile_token_error():
+    """Risposta 403 se la profilazione è disabilitata o il token non corrisponde, altrimenti None."""
+    if not profiling.PROFILE_TOKEN:
+        return jsonify({"error": "Profilazione disabilitata: PROFILE_TOKEN non impostato"}), 403
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile_token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), profiling.PROFILE_TOKEN.encode('utf-8')):
+        return jsonify({"error": "Token di profilazione non valido"}), 403
+    return None
+
+
+PROFILE_MODES = ("1", profiling.TREE, profiling.FOLDED)
+
+
+@app.before_request
+def _start_profile():
+    """
+    Con ?profile=1|tree|folded (e il token) la richiesta viene profilata:
+    gli snapshot vengono ricaricati, così il profilo comprende lo scraping.
+    """
+    mode = request.args.get('profile')
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        return jsonify({"error": f"Parametro profile non valido: '{mode}'", "expected": list(PROFILE_MODES)}), 400
+    error = _profile_token_error()
+    if error is not None:
+        return error
+    query = "&".join(f"{key}={value}" for key, value in request.args.items(multi=True) if key != 'profile_token')
+    g.profile_mode = mode
+    g.profile = profiling.Session(f"{request.method} {request.path}?{query}").start()
+    return None
+
+
+@app.after_request
+def _finish_profile(response):
+    """Salva i report del profilo; con ?profile=tree|folded il report sostituisce la risposta."""
+    session = g.pop('profile', None)
+    if session is None:
+        return response
+    session.stop()
+    reports = session.reports()
+    try:
+        profile_id = session.save()
+    except OSError as exc:
+        print(f"Salvataggio del profilo fallito: {exc}")
+        profile_id = None
+    mode = g.pop('profile_mode')
+    if mode in (profiling.TREE, profiling.FOLDED):
+        response = Response(reports[mode], content_type=profiling.FORMATS[mode][1])
+    if profile_id is not None:
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Url'] = f"/api/profiles/{profile_id}"
+    return response
+
+
+@app.teardown_request
+def _abort_profile(exc):
+    # Eccezione non gestita: after_request non è stato eseguito
+    session = g.pop('profile', None)
+    if session is not None:
+        session.stop()
+
+
+def _request_deadline():
+    """Scadenza (time.monotonic()) dello scraping della richiesta corrente, None senza limite."""
+    if REQUEST_DEADLINE <= 0:
+        return None
+    started = g.get('request_started')
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    return deadline_after(REQUEST_DEADLINE - elapsed)
+
+
+def _count_incomplete(cinemas):
+    """Numero di cinema e di film rimasti senza dati alla scadenza dello scraping."""
+    return (
+        sum(1 for cinema in cinemas if cinema.get(INCOMPLETE)),
+        sum(1 for cinema in cinemas for film in cinema["film"] if film.get(INCOMPLETE)),
+    )
+
+
+def _snapshot(key, loader, refresh=None):
+    """
+    Snapshot per la chiave; le richieste profilate ne caricano sempre uno nuovo.
+
+    Uno snapshot parziale (scraping o arricchimento Trakt arrivato alla
+    scadenza) viene servito ma aggiornato in background, con refresh, alla
+    richiesta successiva.
+    """
+    if 'profile' in g:
+        value, age, status = snapshots.reload(key, loader)
+    else:
+        value, age, status = snapshots.get(key, loader, refresh)
+    payload = value[0] if isinstance(value, tuple) else value
+    if status == MISS and payload.get(INCOMPLETE):
+        snapshots.invalidate(key)
+    return value, age, status
+
+
 def _parse_bool(value):
     if value is None:
         return False
     return value.lower() in {"1", "true", "yes", "on"}
 
 
-def _scrape_all_cinemas(enrich=False):
+def _parse_details():
+    """Livello di dettaglio richiesto con ?details= (default "all"); ValueError se non valido."""
+    details = request.args.get('details', DETAILS_ALL)
+    if details not in DETAILS:
+        raise ValueError(f"Parametro details non valido: '{details}'")
+    return details
+
+
+def _details_error(exc):
+    return jsonify({"error": str(exc), "expected": list(DETAILS)}), 400
+
+
+def _link_details(cinema):
+    """Aggiunge a ogni film il link all'endpoint con la programmazione completa."""
+    cinema_slug = film_slug(cinema["cinema"])
+    for film in cinema["film"]:
+        film["dettagli"] = f"/api/films/{cinema_slug}/{film_slug(film['titolo'])}"
+    return cinema
+
+
+def _scrape_all_cinemas(enrich=False, details=DETAILS_ALL, deadline=None):
     data = {
         "timestamp": datetime.now().isoformat(),
-        "cinema": [],
+        "cinema": scrape_all_cinemas(CINEMA_URLS, details=details, deadline=deadline),
     }
-
-    for cinema_name, url in CINEMA_URLS.items():
-        cinema_data = scrape_cinema(url, cinema_name)
-        data["cinema"].append(cinema_data)
+    incomplete_cinema, incomplete_films = _count_incomplete(data["cinema"])
+    partial = bool(incomplete_cinema or incomplete_films)
+    report = None
+    if details != DETAILS_ALL:
+        for cinema in data["cinema"]:
+            _link_details(cinema)
+    elif not partial:
+        # Versioni e modifiche si riferiscono alla programmazione completa: in uno
+        # scraping parziale i film senza dati risulterebbero rimossi. Il confronto
+        # con l'esecuzione precedente avviene una sola volta per programmazione
+        # diversa: gli snapshot con e senza Trakt ricevono lo stesso report
+        data["version"] = history.record(
+            data["cinema"], data["timestamp"], report=lambda: changes.record_run(data["cinema"])
+        )
+        report = history.report_of(data["version"])
 
     aggregated = None
+    cache_stats = {}
+    incomplete_trakt = 0
     if enrich:
-        aggregated = enrich_with_trakt(data["cinema"])
+        # Nell'API Trakt ha sempre un limite: TRAKT_DEADLINE, o il tempo che resta della scadenza se minore
+        budget = TRAKT_DEADLINE if deadline is None else min(TRAKT_DEADLINE, max(0.0, deadline - time.monotonic()))
+        aggregated = enrich_with_trakt(data["cinema"], stats=cache_stats, deadline=budget)
+        # Film non risolti entro il budget: lo snapshot va aggiornato come uno scraping parziale
+        incomplete_trakt = sum(1 for info in aggregated.values() if info.get("trakt_incomplete"))
 
     total_films = sum(len(c['film']) for c in data["cinema"])
     data["statistics"] = {
         "total_cinema": len(data["cinema"]),
         "total_films": total_films,
     }
+    if report is not None:
+        data["modifiche"] = report
+        data["statistics"]["changes"] = changes.summarize(report)
+    if enrich:
+        data["statistics"]["trakt_cache"] = cache_stats
+    if partial or incomplete_trakt:
+        data[INCOMPLETE] = True
+        data["statistics"]["incomplete"] = {"cinema": incomplete_cinema, "film": incomplete_films}
+        if enrich:
+            data["statistics"]["incomplete"]["trakt"] = incomplete_trakt
 
     return data, aggregated
 
+
+def _admitted(loader):
+    """Esegue il loader solo dopo aver ottenuto uno slot di scraping."""
+    def run():
+        with admission.slot():
+            return loader()
+    return run
+
+
+def _cached_all_cinemas(enrich=False, details=DETAILS_ALL):
+    """Snapshot di tutti i cinema: (data, aggregated, età, stato cache)."""
+    deadline = _request_deadline()
+    (data, aggregated), age, status = _snapshot(
+        ("all", enrich, details),
+        _admitted(lambda: _scrape_all_cinemas(enrich=enrich, details=details, deadline=deadline)),
+        refresh=_admitted(lambda: _scrape_all_cinemas(enrich=enrich, details=details)),
+    )
+    return data, aggregated, age, status
+
+
+def _overloaded_response(exc):
+    """Risposta 503 immediata quando lo scraping non può essere ammesso."""
+    response = jsonify({
+        "error": str(exc),
+        "admission": admission.stats()
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+# Formati dello streaming di /api/films
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _stream_format():
+    """Formato di streaming richiesto con ?stream= o con l'header Accept (None = JSON)."""
+    fmt = request.args.get('stream')
+    if fmt:
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"Formato di streaming sconosciuto: '{fmt}'")
+        return fmt
+    best = request.accept_mimetypes.best_match(["application/json"] + list(STREAM_FORMATS.values()))
+    for name, mimetype in STREAM_FORMATS.items():
+        if best == mimetype:
+            return name
+    return None
+
+
+def _encode_record(fmt, kind, data):
+    """Un record NDJSON (una riga) o un evento SSE."""
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"type": kind, "data": data}, ensure_ascii=False) + "\n"
+
+
+def _stream_records(fmt, unit, snapshot, city=None, deadline=None):
+    """
+    Record dello streaming: "start", poi un record per cinema (o per film
+    con unit="film") appena pronto, infine "statistics".
+
+    Con uno snapshot fresco i record vengono prodotti da quello, altrimenti
+    da uno scraping in corso (dei soli cinema della città, se indicata); in
+    nessun caso si accumula l'intero payload. Lo scraping in corso si ferma
+    alla scadenza: i film e i cinema rimasti senza dati arrivano con
+    INCOMPLETE, contati in "statistics".
+    """
+    started = time.monotonic()
+    cinema_urls = registry.default().urls(city) if city is not None else CINEMA_URLS
+    yield _encode_record(fmt, "start", {
+        "timestamp": datetime.now().isoformat(),
+        "cinema": list(cinema_urls),
+        "unit": unit,
+        "source": "snapshot" if snapshot is not None else "live",
+    })
+
+    if snapshot is not None:
+        # Stessa sequenza di eventi di iter_scrape
+        events = (
+            event
+            for cinema in snapshot["cinema"] if cinema["cinema"] in cinema_urls
+            for event in [("film", {"cinema": cinema["cinema"], "film": film}) for film in cinema["film"]]
+            + [("cinema", cinema)]
+        )
+    else:
+        events = iter_scrape(cinema_urls, deadline=deadline)
+
+    total_cinema = total_films = incomplete_cinema = incomplete_films = 0
+    try:
+        for kind, payload in events:
+            if kind == "film":
+                total_films += 1
+                incomplete_films += bool(payload["film"].get(INCOMPLETE))
+            else:
+                total_cinema += 1
+                incomplete_cinema += bool(payload.get(INCOMPLETE))
+            if kind == unit:
+                yield _encode_record(fmt, kind, payload)
+    except Exception as exc:
+        yield _encode_record(fmt, "error", {"error": str(exc)})
+
+    statistics = {
+        "total_cinema": total_cinema,
+        "total_films": total_films,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+    if incomplete_cinema or incomplete_films:
+        statistics["incomplete"] = {"cinema": incomplete_cinema, "film": incomplete_films}
+    yield _encode_record(fmt, "statistics", statistics)
+
+
+def _streaming_response(fmt, unit, city=None):
+    """
+    Risposta in streaming di /api/films.
+
+    Lo slot di scraping viene occupato prima di iniziare la risposta (così
+    un sovraccarico produce ancora un 503) e rilasciato alla chiusura dello
+    stream, anche se il client si disconnette.
+    """
+    cached = snapshots.peek(("all", False, DETAILS_ALL))
+    data = cached[0][0] if cached is not None else None
+    slot = None
+    if data is None:
+        slot = admission.slot()
+        slot.__enter__()
+
+    # Calcolata qui: il generatore viene eseguito fuori dal contesto della richiesta
+    deadline = _request_deadline()
+    response = Response(
+        _stream_records(fmt, unit, data, city, deadline),
+        mimetype=STREAM_FORMATS[fmt],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    if slot is not None:
+        response.call_on_close(lambda: slot.__exit__(None, None, None))
+    return response
+
+
+def _with_cache_headers(response, age, status):
+    """Aggiunge alla risposta l'età dello snapshot e lo stato della cache."""
+    response.headers['X-Cache'] = status
+    response.headers['X-Snapshot-Age'] = str(int(age))
+    response.headers['Age'] = str(int(age))
+    return response
+
+
+def _snapshot_response(entry, age, status, headers=None):
+    """Risposta con il corpo serializzato di uno snapshot (304 se il client lo ha già)."""
+    return _with_cache_headers(encoded.respond(entry, request, headers), age, status)
+
 @app.route('/')
 def index():
     """Endpoint di benvenuto."""
     return jsonify({
         "service": "Matera Film Scraper API",
-        "description": "API per ottenere i film in programmazione nei cinema di Matera",
+        "description": "API per ottenere i film in programmazione nei cinema del registro",
         "endpoints": {
-            "/api/films": "GET - Ottiene tutti i film dai 3 cinema (JSON)",
-            "/api/films/telegram": "GET - Ottiene messaggio formattato per Telegram",
-            "/api/films/<cinema_name>": "GET - Ottiene i film di un cinema specifico",
-            "/health": "GET - Controlla lo stato del servizio"
+            "/api/films": "GET - Ottiene tutti i film dei cinema del registro (JSON, oppure ?stream=ndjson|sse; ?city= per una città)",
+            "/api/films/telegram": "GET - Ottiene messaggio formattato per Telegram (?city=, ?cinema=, ?date=, ?links=0, ?chunks=1)",
+            "/api/films/search": "GET - Ricerca approssimata dei titoli con i loro orari (?q=<titolo>)",
+            "/api/films/changes": "GET - Modifiche da una versione (?since=<versione>) o da un istante (?since=<ISO 8601>)",
+            "/api/films/<cinema_name>": "GET - Ottiene i film di un cinema specifico (?details=none|today|all)",
+            "/api/films/<cinema_name>/<film>": "GET - Programmazione completa di un film",
+            "/api/showtimes": "GET - Proiezioni filtrate per data, fascia oraria, città, cinema e titolo (?date=&from=&to=&city=&cinema=&title=)",
+            "/api/cities": "GET - Città del registro con i loro cinema",
+            "/health": "GET - Controlla lo stato del servizio",
+            "/metrics": "GET - Metriche nel formato testuale di Prometheus",
+            "/api/profiles/<id>": "GET - Report di una richiesta profilata con ?profile=1 (?format=tree|folded|prof, richiede il token)"
         },
+        "cities": registry.default().cities(),
         "cinema": list(CINEMA_URLS.keys())
     })
 
@@ -63,18 +447,84 @@ def health():
     """Endpoint per controllare lo stato del servizio."""
     return jsonify({
         "status": "ok",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "http": http_client.get_stats(),
+        "cache": http_cache.get_stats(),
+        "admission": admission.stats(),
+        "responses": encoded.stats(),
+        "pipeline": pipeline.last_stats()
     })
 
+@app.route('/metrics')
+def get_metrics():
+    """Contatori e istogrammi degli stadi nel formato testuale di Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Report salvato di una richiesta profilata: albero delle chiamate, stack folded o dump di pstats."""
+    error = _profile_token_error()
+    if error is not None:
+        return error
+    fmt = request.args.get('format', profiling.TREE)
+    if fmt not in profiling.FORMATS:
+        return jsonify({"error": f"Formato non valido: '{fmt}'", "expected": list(profiling.FORMATS)}), 400
+    report = profiling.load_report(profile_id, fmt)
+    if report is None:
+        return jsonify({"error": f"Profilo '{profile_id}' non trovato"}), 404
+    return Response(report, content_type=profiling.FORMATS[fmt][1])
+
 @app.route('/api/films', methods=['GET'])
 def get_all_films():
-    """Restituisce tutti i film; usa ?enrich=1 per includere metadata Trakt."""
+    """
+    Restituisce tutti i film; usa ?enrich=1 per includere metadata Trakt.
+
+    Con ?details=none|today la risposta si ferma alle pagine dei cinema
+    (orari di oggi) e ogni film ha il link "dettagli" all'endpoint con tutte
+    le date.
+
+    Con ?stream=ndjson o ?stream=sse (o Accept: application/x-ndjson /
+    text/event-stream) ogni cinema viene inviato appena estratto; con
+    &unit=film ogni film.
+
+    Con ?city= la risposta contiene solo i cinema di quella città del
+    registro (con statistiche, modifiche e metadata Trakt della città).
+    """
     try:
         enrich = _parse_bool(request.args.get('enrich'))
-        data, aggregated = _scrape_all_cinemas(enrich=enrich)
-        if aggregated is not None:
-            data["trakt_enriched"] = aggregated
-        return jsonify(data), 200
+        try:
+            city = _parse_city()
+        except LookupError:
+            return _city_not_found(request.args['city'])
+        try:
+            details = _parse_details()
+        except ValueError as exc:
+            return _details_error(exc)
+        try:
+            fmt = _stream_format()
+        except ValueError as exc:
+            return jsonify({"error": str(exc), "formats": list(STREAM_FORMATS)}), 400
+        if fmt is not None:
+            unit = request.args.get('unit', 'cinema')
+            if unit not in ("cinema", "film"):
+                return jsonify({"error": f"Parametro unit non valido: '{unit}'", "expected": ["cinema", "film"]}), 400
+            if enrich or details != DETAILS_ALL:
+                return jsonify({"error": "enrich e details non sono supportati in streaming"}), 400
+            return _streaming_response(fmt, unit, city)
+
+        data, aggregated, age, status = _cached_all_cinemas(enrich=enrich, details=details)
+
+        def build():
+            if city is not None:
+                return _city_payload(data, aggregated, city)
+            payload = dict(data)
+            if aggregated is not None:
+                payload["trakt_enriched"] = aggregated
+            return payload
+
+        return _snapshot_response(encoded.json(data, ("films", city), build), age, status)
+    except Overloaded as exc:
+        return _overloaded_response(exc)
     except MissingTraktCredentials as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception as e:
@@ -83,42 +533,374 @@ def get_all_films():
             "traceback": traceback.format_exc()
         }), 500
 
+def _city_payload(data, aggregated, city):
+    """Snapshot di /api/films ristretto ai cinema di una città."""
+    names = _city_cinemas(city)
+    cinemas = [cinema for cinema in data["cinema"] if cinema["cinema"] in names]
+    payload = dict(data, citta=city, cinema=cinemas)
+    payload["statistics"] = dict(
+        data["statistics"],
+        total_cinema=len(cinemas),
+        total_films=sum(len(cinema["film"]) for cinema in cinemas),
+    )
+    if "modifiche" in data:
+        payload["modifiche"] = changes.filter_report(data["modifiche"], names)
+        payload["statistics"]["changes"] = changes.summarize(payload["modifiche"])
+    if aggregated is not None:
+        titles = {film["titolo"] for cinema in cinemas for film in cinema["film"]}
+        payload["trakt_enriched"] = {title: info for title, info in aggregated.items() if title in titles}
+    return payload
+
+def _parse_since(value):
+    """Versione (intero) o istante ISO 8601 del parametro since; ValueError se non valido."""
+    if value.isdigit():
+        return int(value), None
+    when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if when.tzinfo is not None:
+        # I timestamp degli snapshot sono nell'ora locale del server
+        when = when.astimezone().replace(tzinfo=None)
+    return None, when
+
+@app.route('/api/films/changes', methods=['GET'])
+def get_film_changes():
+    """
+    Restituisce solo film, date e orari aggiunti o rimossi dalla versione
+    indicata con ?since=<versione> o ?since=<ISO 8601>.
+
+    Se la versione non è più conservata (o manca since) la risposta contiene
+    l'intera programmazione, con "full": true.
+    """
+    try:
+        since = request.args.get('since')
+        since_version = since_time = None
+        if since:
+            try:
+                since_version, since_time = _parse_since(since)
+            except ValueError:
+                return jsonify({
+                    "error": f"Parametro since non valido: '{since}'",
+                    "expected": "numero di versione o timestamp ISO 8601"
+                }), 400
+
+        data, _, age, status = _cached_all_cinemas()
+        if since_time is not None:
+            since_version = history.version_at(since_time)
+
+        def build():
+            delta = history.delta(since_version) if since_version is not None else None
+            if delta is None:
+                payload = dict(data)
+                payload["full"] = True
+                return payload
+            version, timestamp, report = delta
+            return {
+                "version": version,
+                "since": since_version,
+                "timestamp": timestamp,
+                "full": False,
+                "modifiche": report,
+            }
+
+        entry = encoded.json(data, ("changes", since_version, history.current), build)
+        return _snapshot_response(entry, age, status)
+    except Overloaded as exc:
+        return _overloaded_response(exc)
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+# Risultati massimi di /api/films/search
+SEARCH_MAX_LIMIT = 50
+
+@app.route('/api/films/search', methods=['GET'])
+def search_films():
+    """
+    Ricerca approssimata dei titoli in programmazione con ?q=<titolo>
+    (anche parziale o con errori di battitura; &limit=, default 10).
+
+    Ogni risultato ha punteggio, cinema e proiezioni ordinate per data e ora.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        try:
+            limit = int(request.args.get('limit', '10'))
+        except ValueError:
+            limit = 0
+        if not title_search.trigrams(query) or not 1 <= limit <= SEARCH_MAX_LIMIT:
+            return jsonify({
+                "error": "Parametri di ricerca non validi",
+                "expected": {"q": "titolo o parte di esso", "limit": f"1-{SEARCH_MAX_LIMIT}"}
+            }), 400
+
+        data, _, age, status = _cached_all_cinemas()
+        index = title_search.index_for(data)
+        by_title = showtimes.index_for(data).by_title
+        results = []
+        for score, position in index.search(query, limit=limit):
+            slug = index.slugs[position]
+            bucket = by_title.get(slug)
+            results.append({
+                "titolo": index.titles[position],
+                "slug": slug,
+                "score": round(score, 3),
+                "cinema": index.cinemas[position],
+                "showtimes": [showtime.to_dict() for showtime in bucket.showtimes] if bucket else [],
+            })
+        payload = {
+            "timestamp": data["timestamp"],
+            "version": data.get("version"),
+            "query": query,
+            "count": len(results),
+            "results": results,
+        }
+        return _snapshot_response(Encoded(data, dumps(payload), JSON_MIMETYPE), age, status)
+    except Overloaded as exc:
+        return _overloaded_response(exc)
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+def _match_cinema(cinema_name):
+    """Nome e URL del cinema corrispondente al nome nell'URL, (None, None) se non trovato."""
+    # Normalizza il nome del cinema per la ricerca
+    cinema_name_normalized = cinema_name.lower().replace('-', ' ').replace('_', ' ')
+    
+    for name, url in CINEMA_URLS.items():
+        if cinema_name_normalized in name.lower() or name.lower() in cinema_name_normalized:
+            return name, url
+    return None, None
+
+def _cinema_not_found(cinema_name):
+    return jsonify({
+        "error": f"Cinema '{cinema_name}' non trovato",
+        "available_cinema": list(CINEMA_URLS.keys())
+    }), 404
+
+def _match_city(city_name):
+    """Città del registro corrispondente al nome (maiuscole, accenti e trattini ignorati), None se non trovata."""
+    slug = film_slug(city_name)
+    for city in registry.default().cities():
+        if film_slug(city) == slug:
+            return city
+    return None
+
+def _parse_city():
+    """Città del parametro city, None se assente; LookupError se non è nel registro."""
+    value = request.args.get('city')
+    if not value:
+        return None
+    city = _match_city(value)
+    if city is None:
+        raise LookupError(value)
+    return city
+
+def _city_not_found(city_name):
+    return jsonify({
+        "error": f"Città '{city_name}' non trovata",
+        "available_cities": registry.default().cities()
+    }), 404
+
+def _city_cinemas(city):
+    """Nomi dei cinema di una città del registro."""
+    return set(registry.default().urls(city))
+
+@app.route('/api/cities', methods=['GET'])
+def get_cities():
+    """Città del registro, ognuna con i suoi cinema (nome, URL e nome breve)."""
+    reg = registry.default()
+    return jsonify({
+        "cities": [
+            {"citta": city, "cinema": [entry.to_dict() for entry in reg if entry.city == city]}
+            for city in reg.cities()
+        ]
+    })
+
 @app.route('/api/films/<cinema_name>', methods=['GET'])
 def get_cinema_films(cinema_name):
     """
     Endpoint per ottenere i film di un cinema specifico.
     
+    Con ?details=none|today basta la sola pagina del cinema (orari di oggi);
+    la programmazione completa di un film è su /api/films/<cinema>/<film>.
+    
     Args:
         cinema_name: Nome del cinema (normalizzato)
     """
     try:
-        # Normalizza il nome del cinema per la ricerca
-        cinema_name_normalized = cinema_name.lower().replace('-', ' ').replace('_', ' ')
+        try:
+            details = _parse_details()
+        except ValueError as exc:
+            return _details_error(exc)
         
-        # Trova il cinema corrispondente
-        matched_cinema = None
-        matched_url = None
+        matched_cinema, matched_url = _match_cinema(cinema_name)
+        if not matched_cinema:
+            return _cinema_not_found(cinema_name)
         
-        for name, url in CINEMA_URLS.items():
-            if cinema_name_normalized in name.lower() or name.lower() in cinema_name_normalized:
-                matched_cinema = name
-                matched_url = url
-                break
+        def load(deadline=None):
+            cinema = scrape_cinema(matched_url, matched_cinema, details=details, deadline=deadline)
+            if details != DETAILS_ALL:
+                _link_details(cinema)
+            payload = {
+                "timestamp": datetime.now().isoformat(),
+                "cinema": [cinema]
+            }
+            if any(_count_incomplete([cinema])):
+                payload[INCOMPLETE] = True
+            return payload
         
+        # Scrape il cinema specifico (o usa lo snapshot in cache)
+        deadline = _request_deadline()
+        payload, age, status = _snapshot(
+            ("cinema", matched_cinema, details), _admitted(lambda: load(deadline)), refresh=_admitted(load)
+        )
+        
+        return _snapshot_response(encoded.json(payload, "cinema", lambda: payload), age, status)
+        
+    except Overloaded as exc:
+        return _overloaded_response(exc)
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+@app.route('/api/films/<cinema_name>/<film>', methods=['GET'])
+def get_film_details(cinema_name, film):
+    """
+    Programmazione completa (tutte le date) di un solo film: scarica soltanto
+    la pagina del cinema e la pagina ticket di quel film.
+    
+    Args:
+        cinema_name: Nome del cinema (normalizzato)
+        film: Identificativo del film, come nel campo "dettagli"
+    """
+    try:
+        matched_cinema, matched_url = _match_cinema(cinema_name)
         if not matched_cinema:
+            return _cinema_not_found(cinema_name)
+        
+        slug = film_slug(film)
+
+        def load(deadline=None):
+            payload = {
+                "timestamp": datetime.now().isoformat(),
+                "film": scrape_film(matched_url, matched_cinema, slug, deadline=deadline)
+            }
+            if payload["film"] is not None and payload["film"].get(INCOMPLETE):
+                payload[INCOMPLETE] = True
+            return payload
+
+        deadline = _request_deadline()
+        payload, age, status = _snapshot(
+            ("film", matched_cinema, slug), _admitted(lambda: load(deadline)), refresh=_admitted(load)
+        )
+        if payload["film"] is None:
             return jsonify({
-                "error": f"Cinema '{cinema_name}' non trovato",
-                "available_cinema": list(CINEMA_URLS.keys())
+                "error": f"Film '{film}' non in programmazione al cinema {matched_cinema}"
             }), 404
         
-        # Scrape il cinema specifico
-        cinema_data = scrape_cinema(matched_url, matched_cinema)
+        return _snapshot_response(encoded.json(payload, "film", lambda: payload), age, status)
         
+    except DeadlineExceeded:
         return jsonify({
-            "timestamp": datetime.now().isoformat(),
-            "cinema": [cinema_data]
-        }), 200
-        
+            "error": f"La pagina del cinema {matched_cinema} non è arrivata entro {REQUEST_DEADLINE:g} secondi"
+        }), 504
+    except Overloaded as exc:
+        return _overloaded_response(exc)
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+def _parse_day():
+    """Data del parametro date (YYYY-MM-DD, today o tomorrow), None se assente; ValueError se non valida."""
+    value = request.args.get('date')
+    if not value:
+        return None
+    if value == 'today':
+        return date.today()
+    if value == 'tomorrow':
+        return date.today() + timedelta(days=1)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Parametro date non valido: '{value}'") from None
+
+def _parse_showtime_filters():
+    """Filtri di /api/showtimes dalla query string; ValueError se non validi."""
+    day = _parse_day()
+
+    bounds = {}
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        bounds[name] = None
+        if value:
+            bounds[name] = showtimes.parse_clock(value, strict=True)
+            if bounds[name] is None:
+                raise ValueError(f"Parametro {name} non valido: '{value}'")
+    if bounds['from'] and bounds['to'] and bounds['from'] > bounds['to']:
+        raise ValueError("Il parametro from deve precedere to")
+
+    return day, bounds['from'], bounds['to']
+
+@app.route('/api/showtimes', methods=['GET'])
+def get_showtimes():
+    """
+    Proiezioni di tutti i cinema ordinate per data e ora, filtrate con
+    ?date=YYYY-MM-DD|today|tomorrow, ?from=HH:MM, ?to=HH:MM, ?city=,
+    ?cinema= e ?title= (anche parziale). Senza date, from/to valgono per
+    ogni giorno.
+
+    Le query usano l'indice dello snapshot corrente (showtimes.py), costruito
+    una volta per snapshot.
+    """
+    try:
+        try:
+            day, start, end = _parse_showtime_filters()
+        except ValueError as exc:
+            return jsonify({
+                "error": str(exc),
+                "expected": {"date": "YYYY-MM-DD, today o tomorrow", "from": "HH:MM", "to": "HH:MM"}
+            }), 400
+
+        cinema = request.args.get('cinema')
+        matched_cinema = None
+        if cinema:
+            matched_cinema, _ = _match_cinema(cinema)
+            if not matched_cinema:
+                return _cinema_not_found(cinema)
+        title = request.args.get('title') or None
+        try:
+            city = _parse_city()
+        except LookupError:
+            return _city_not_found(request.args['city'])
+
+        data, _, age, status = _cached_all_cinemas()
+        results = showtimes.index_for(data).query(
+            day, start, end, matched_cinema, title, city=city
+        )
+        payload = {
+            "timestamp": data["timestamp"],
+            "version": data.get("version"),
+            "filters": {
+                "date": day.isoformat() if day else None,
+                "from": start.strftime('%H:%M') if start else None,
+                "to": end.strftime('%H:%M') if end else None,
+                "city": city,
+                "cinema": matched_cinema,
+                "title": title,
+            },
+            "count": len(results),
+            "showtimes": [showtime.to_dict() for showtime in results],
+        }
+        return _snapshot_response(Encoded(data, dumps(payload), JSON_MIMETYPE), age, status)
+    except Overloaded as exc:
+        return _overloaded_response(exc)
     except Exception as e:
         return jsonify({
             "error": str(e),
@@ -127,16 +909,51 @@ def get_cinema_films(cinema_name):
 
 @app.route('/api/films/telegram', methods=['GET'])
 def get_telegram_message():
-    """Restituisce il messaggio formattato per Telegram. Usa ?enrich=1 per includere link IMDb."""
+    """
+    Restituisce il messaggio formattato per Telegram. Usa ?enrich=1 per includere link IMDb.
+
+    Varianti: ?city= (una sola città), ?cinema= (un solo cinema), ?date=YYYY-MM-DD|today|tomorrow
+    (un solo giorno), ?links=0 (senza link IMDb). Con ?chunks=1 la risposta
+    è JSON con il messaggio diviso in parti entro il limite di Telegram,
+    separate tra un film e l'altro.
+    """
     try:
         enrich = _parse_bool(request.args.get('enrich'))
-        data, _ = _scrape_all_cinemas(enrich=enrich)
-        telegram_msg = format_telegram_message(data)
-        return Response(
-            telegram_msg,
-            mimetype='text/plain; charset=utf-8',
-            headers={'Content-Disposition': 'inline'}
-        ), 200
+        links = request.args.get('links') is None or _parse_bool(request.args.get('links'))
+        chunked = _parse_bool(request.args.get('chunks'))
+        try:
+            day = _parse_day()
+        except ValueError as exc:
+            return jsonify({"error": str(exc), "expected": "YYYY-MM-DD, today o tomorrow"}), 400
+        cinema = request.args.get('cinema')
+        matched_cinema = None
+        if cinema:
+            matched_cinema, _ = _match_cinema(cinema)
+            if not matched_cinema:
+                return _cinema_not_found(cinema)
+        try:
+            city = _parse_city()
+        except LookupError:
+            return _city_not_found(request.args['city'])
+
+        data, _, age, status = _cached_all_cinemas(enrich=enrich)
+        renderer = telegram_render.renderer_for(data)
+        variant = ("telegram", matched_cinema, day, links, city)
+        if chunked:
+            def build():
+                messages = renderer.chunks(matched_cinema, day, links, city)
+                return {
+                    "timestamp": data["timestamp"],
+                    "limit": telegram_render.TELEGRAM_MAX_LENGTH,
+                    "count": len(messages),
+                    "messages": messages,
+                }
+            return _snapshot_response(encoded.json(data, variant + ("chunks",), build), age, status)
+
+        entry = encoded.text(data, variant, lambda: renderer.render(matched_cinema, day, links, city))
+        return _snapshot_response(entry, age, status, headers={'Content-Disposition': 'inline'})
+    except Overloaded as exc:
+        return _overloaded_response(exc)
     except MissingTraktCredentials as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception as e:
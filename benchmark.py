@@ -0,0 +1,1980 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dello scraper contro un server locale che simula comingsoon.it.
+
+Esempi:
+    python benchmark.py fanout --cinemas 3 --films 15 --latency 0.2
+    python benchmark.py session --requests 30 --connect-latency 0.05
+    python benchmark.py cache --films 15 --days 30
+    python benchmark.py trakt --titles 30 --latency 0.1 --rate-limit-every 10
+    python benchmark.py parse --repeat 5
+    python benchmark.py extract --repeat 20
+    python benchmark.py incremental --films 15 --days 30
+    python benchmark.py replay --latency 0.1
+    python benchmark.py stream --latency 0.2
+    python benchmark.py micro --save-baseline
+    python benchmark.py micro --films 300 --days 42 --repeat 3
+    python benchmark.py models --cinemas 40 --films 30 --days 28
+    python benchmark.py responses --cinemas 10 --films 30 --days 28
+    python benchmark.py showtimes --cinemas 40 --films 30 --days 28
+    python benchmark.py search --titles 3000
+    python benchmark.py telegram --cinemas 10 --films 30 --days 28
+    python benchmark.py shards --cinemas 60 --processes 1 2 4
+    python benchmark.py pipeline --cinemas 40 --parsers 0 1 2
+    python benchmark.py metrics --cinemas 10 --films 15
+    python benchmark.py deadline --stragglers 0.05 --straggler-latency 3 --deadline 2
+"""
+
+import argparse
+import contextlib
+import gc
+import gzip
+import io
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+
+import changes
+import http_cache
+import http_client
+import metrics
+import models
+import parsing
+import pipeline
+import responses
+import scraper
+import showtimes
+import telegram_render
+import title_search
+import trakt_enrich
+import trakt_search
+import transport
+from rate_limit import TokenBucket
+from trakt_cache import TraktCache
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "comingsoon")
+# Baseline del benchmark micro (dipende dalla macchina, quindi non versionata)
+BASELINE_PATH = os.path.join(".cache", "benchmark-baseline.json")
+
+WEEKDAYS = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+MONTHS = ["GEN", "FEB", "MAR", "APR", "MAG", "GIU", "LUG", "AGO", "SET", "OTT", "NOV", "DIC"]
+
+
+def load_fixtures() -> List[Tuple[str, str, str]]:
+    """
+    Carica le pagine di fixtures/comingsoon.
+
+    Returns:
+        Lista di (url, tipo di pagina, html) con tipo parsing.LISTING o parsing.TICKET
+    """
+    with open(os.path.join(FIXTURES_DIR, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+
+    pages = []
+    for url, filename in sorted(index.items(), key=lambda item: item[1]):
+        page_type = parsing.LISTING if filename.startswith("cinema-") else parsing.TICKET
+        with open(os.path.join(FIXTURES_DIR, filename), encoding="utf-8") as f:
+            pages.append((url, page_type, f.read()))
+    return pages
+
+
+def extract_page(page_type: str, soup):
+    """Applica a una pagina l'estrattore del suo tipo."""
+    if page_type == parsing.LISTING:
+        return scraper._parse_film_listing(soup)
+    return scraper.extract_dates_and_times_from_ticket_page(soup)
+
+
+# --- Estrattori precedenti, usati come riferimento per output e tempi ---
+
+def reference_extract_dates_and_times(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    """Implementazione precedente (più scansioni find/find_all), usata come riferimento."""
+    dates_times = []
+    
+    if soup is None:
+        return dates_times
+    
+    # Cerca tutti i div con classe "media mbm" che rappresentano un giorno
+    media_elements = soup.find_all('div', class_=re.compile(r'media.*mbm', re.I))
+    
+    # Converti mese in numero
+    month_map = {
+        'GEN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
+        'MAG': '05', 'GIU': '06', 'LUG': '07', 'AGO': '08',
+        'SET': '09', 'OTT': '10', 'NOV': '11', 'DIC': '12'
+    }
+    
+    # Usa un dict per raggruppare per data (evita duplicati)
+    dates_dict = {}
+    
+    for media_elem in media_elements:
+        # Estrai la data da media-left
+        media_left = media_elem.find('div', class_='media-left')
+        if not media_left:
+            continue
+        
+        weekday_elem = media_left.find('span', class_='weekday')
+        day_elem = media_left.find('span', class_='day')
+        month_elem = media_left.find('span', class_='month')
+        
+        if not (weekday_elem and day_elem and month_elem):
+            continue
+        
+        day_name = weekday_elem.get_text(strip=True)
+        day_num = day_elem.get_text(strip=True)
+        month = month_elem.get_text(strip=True)
+        
+        # Converti mese
+        month_num = month_map.get(month.upper(), '01')
+        
+        # Costruisci la data (anno corrente)
+        current_year = datetime.now().year
+        now = datetime.now()
+        # Se il mese è passato rispetto ad oggi, probabilmente è dell'anno prossimo
+        if int(month_num) < now.month:
+            current_year += 1
+        elif int(month_num) == now.month and int(day_num) < now.day:
+            current_year += 1
+        
+        date_str = f"{current_year}-{month_num}-{day_num.zfill(2)}"
+        
+        # Estrai gli orari da media-body
+        media_body = media_elem.find('div', class_='media-body')
+        times = []
+        
+        if media_body:
+            # Cerca tutti i pulsanti con orari
+            time_buttons = media_body.find_all('button', class_=re.compile(r'btn-fab', re.I))
+            for btn in time_buttons:
+                btn_text = btn.get_text(strip=True)
+                # Estrai orari nel formato HH:MM
+                if re.match(r'\d{1,2}:\d{2}', btn_text):
+                    try:
+                        h, m = map(int, btn_text.split(':'))
+                        if 0 <= h < 24 and 0 <= m < 60:
+                            times.append(btn_text)
+                    except:
+                        continue
+        
+        # Raggruppa per data (unisce orari se stessa data appare più volte)
+        if date_str in dates_dict:
+            # Unisci gli orari, rimuovi duplicati
+            dates_dict[date_str]['orari'].extend(times)
+            dates_dict[date_str]['orari'] = sorted(list(set(dates_dict[date_str]['orari'])))
+        else:
+            dates_dict[date_str] = {
+                "data": date_str,
+                "giorno": day_name,
+                "orari": sorted(list(set(times))) if times else []
+            }
+    
+    # Converti dict in lista, filtra solo quelli con orari
+    dates_times = [dt for dt in dates_dict.values() if dt['orari']]
+    
+    # Ordina per data
+    dates_times.sort(key=lambda x: x['data'])
+    
+    return dates_times
+
+
+def reference_parse_film_listing(soup: BeautifulSoup) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """Implementazione precedente (più scansioni find/find_all), usata come riferimento."""
+    films = []
+    
+    if soup is None:
+        return films
+    
+    # Cerca tutte le sezioni film usando la classe specifica identificata
+    # Ogni film è in un div con classe "header-scheda streaming min no-bg container-fluid pbl"
+    film_sections = soup.find_all('div', class_=re.compile(r'header-scheda.*streaming', re.I))
+    
+    # Se non trova con quella classe, prova a cercare in modo diverso
+    if not film_sections:
+        # Cerca la sezione "Film in programmazione" e poi tutti i div seguenti
+        film_heading = soup.find('h2', string=re.compile(r'Film in programmazione', re.I))
+        if film_heading:
+            # Trova il section parent
+            section = film_heading.find_parent('section')
+            if section:
+                film_sections = section.find_all('div', class_=re.compile(r'header-scheda', re.I))
+    
+    # Processa ogni sezione film trovata
+    for section in film_sections:
+        # Estrai il titolo del film - è in un <a> con classe "tit_olo h1"
+        title_elem = section.find('a', class_=re.compile(r'tit_olo', re.I))
+        
+        if not title_elem:
+            continue
+        
+        title = title_elem.get_text(strip=True)
+        
+        if not title:
+            continue
+        
+        # Estrai gli orari e la sala
+        # Gli orari sono in un div con classe "cs-btn col primary ico sala"
+        schedule_elem = section.find('div', class_=re.compile(r'cs-btn.*sala', re.I))
+        
+        times = []
+        sala_info = None
+        
+        if schedule_elem:
+            # Estrai la sala (prima dello span con clock)
+            sala_span = schedule_elem.find('span', string=re.compile(r'Sala', re.I))
+            if sala_span:
+                sala_text = sala_span.get_text(strip=True)
+                # Estrai "Sala X | Posti Y" o solo "Sala X"
+                sala_match = re.search(r'Sala\s+(\d+)[^|]*', sala_text)
+                if sala_match:
+                    sala_info = f"Sala {sala_match.group(1)}"
+            
+            # Estrai gli orari (dallo span con icona clock o qualsiasi span con orari)
+            spans = schedule_elem.find_all('span')
+            schedule_text = ""
+            
+            # Cerca lo span con gli orari (di solito il secondo span o quello con icona clock)
+            for span in spans:
+                span_text = span.get_text(strip=True)
+                # Se contiene pattern di orari, è quello che cerchiamo
+                if re.search(r'\d{1,2}[.:]\d{2}', span_text):
+                    schedule_text = span_text
+                    break
+            
+            # Se non trova in uno span specifico, prendi tutto il testo del div
+            if not schedule_text:
+                schedule_text = schedule_elem.get_text(strip=True)
+            
+            if schedule_text:
+                times = scraper.extract_times_from_text(schedule_text)
+        
+        # Se non ha trovato orari, prova a cercare in tutto il testo della sezione
+        if not times:
+            all_text = section.get_text()
+            times = scraper.extract_times_from_text(all_text)
+            # Cerca anche la sala nel testo completo
+            sala_match = re.search(r'Sala\s+(\d+)', all_text)
+            if sala_match:
+                sala_info = f"Sala {sala_match.group(1)}"
+        
+        # Cerca il link "Acquista biglietto e vedi tutte le date"
+        ticket_link = None
+        # Prova prima con una ricerca per href che contiene "ticket"
+        ticket_elem = section.find('a', href=re.compile(r'ticket', re.I))
+        if not ticket_elem:
+            # Prova a cercare per testo (potrebbe essere su più righe)
+            ticket_elem = section.find('a', string=re.compile(r'Acquista.*biglietto', re.I))
+        
+        if ticket_elem:
+            ticket_href = ticket_elem.get('href', '')
+            if ticket_href:
+                # Costruisci l'URL completo se è relativo
+                if ticket_href.startswith('/'):
+                    ticket_link = f"https://www.comingsoon.it{ticket_href}"
+                elif ticket_href.startswith('http'):
+                    ticket_link = ticket_href
+                else:
+                    ticket_link = f"https://www.comingsoon.it{ticket_href}"
+        
+        # Crea struttura dati per il film
+        # (la programmazione viene riempita dopo, scaricando le pagine dei ticket in parallelo)
+        if title:  # Aggiungi anche se non ci sono orari (potrebbe essere programmazione futura)
+            film_data = {
+                "titolo": title,
+                "orari": times if times else [],  # Orari dalla pagina principale (per retrocompatibilità)
+                "sala": sala_info,
+                "programmazione": []  # Date e orari dettagliati
+            }
+            films.append((film_data, ticket_link))
+    
+    return films
+
+
+def reference_format_telegram_message(data: Dict[str, Any]) -> str:
+    """Implementazione precedente (dizionari e date stringa), usata come riferimento."""
+    from collections import defaultdict, OrderedDict
+    from datetime import datetime as dt_class
+
+    lines = ["🎬 FILM IN PROGRAMMAZIONE - MATERA\n"]
+
+    cinema_short_names = {
+        "Cinema Comunale Guerrieri": "Guerrieri",
+        "Il Piccolo": "Piccolo",
+        "UCI Cinemas Red Carpet": "Red Carpet",
+    }
+
+    mesi_italiano = {
+        '01': 'gennaio', '02': 'febbraio', '03': 'marzo', '04': 'aprile',
+        '05': 'maggio', '06': 'giugno', '07': 'luglio', '08': 'agosto',
+        '09': 'settembre', '10': 'ottobre', '11': 'novembre', '12': 'dicembre'
+    }
+
+    def format_date(date_str: str) -> str:
+        anno, mese, giorno = date_str.split('-')
+        return f"{int(giorno)} {mesi_italiano.get(mese, mese)}"
+
+    def format_range(start_date: str, end_date: str) -> str:
+        if start_date == end_date:
+            return format_date(start_date)
+        a_y, a_m, a_d = start_date.split('-')
+        b_y, b_m, b_d = end_date.split('-')
+        if a_y == b_y and a_m == b_m:
+            return f"{int(a_d)}-{int(b_d)} {mesi_italiano.get(a_m, a_m)}"
+        return f"{format_date(start_date)} → {format_date(end_date)}"
+
+    films = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+    film_meta = {}
+
+    for cinema in data.get('cinema', []):
+        cinema_name = cinema.get('cinema', '')
+        cinema_short = cinema_short_names.get(cinema_name, cinema_name)
+        for film in cinema.get('film', []):
+            title = film.get('titolo')
+            if not title:
+                continue
+            imdb_id = film.get('imdb')
+            imdb_url = film.get('imdb_url')
+            if imdb_url:
+                film_meta.setdefault(title, {})['imdb_url'] = imdb_url
+            elif imdb_id:
+                film_meta.setdefault(title, {})['imdb_url'] = f"https://www.imdb.com/title/{imdb_id}/"
+
+            for prog in film.get('programmazione', []):
+                date = prog.get('data')
+                for time in prog.get('orari', []):
+                    if not date or not time:
+                        continue
+                    films[title][cinema_short][date].add(time.replace('.', ':'))
+
+    for title in sorted(films):
+        imdb_url = film_meta.get(title, {}).get('imdb_url')
+        if imdb_url:
+            lines.append(f"📽️ {title} · {imdb_url}")
+        else:
+            lines.append(f"📽️ {title}")
+
+        cinema_map = films[title]
+        for cinema_short in sorted(cinema_map):
+            date_map = cinema_map[cinema_short]
+            ordered_dates = sorted(date_map)
+            normalized = OrderedDict((d, sorted(date_map[d])) for d in ordered_dates)
+
+            groups = []
+            current_start = current_end = None
+            current_times = None
+            for date in normalized:
+                times = normalized[date]
+                date_obj = dt_class.fromisoformat(date)
+                if current_times is None:
+                    current_start = current_end = date
+                    current_times = times
+                elif times == current_times and (date_obj - dt_class.fromisoformat(current_end)).days == 1:
+                    current_end = date
+                else:
+                    groups.append((current_start, current_end, current_times))
+                    current_start = current_end = date
+                    current_times = times
+            if current_times is not None:
+                groups.append((current_start, current_end, current_times))
+
+            for start_date, end_date, times in groups:
+                date_label = format_range(start_date, end_date)
+                orari_str = " • ".join(times)
+                lines.append(f"   📅 {date_label} · {cinema_short}")
+                lines.append(f"      🕐 {orari_str}")
+        lines.append("")
+
+    timestamp = data.get('timestamp')
+    if timestamp:
+        try:
+            dt_obj = dt_class.fromisoformat(timestamp.replace('Z', '+00:00'))
+            lines.append(f"Aggiornato il {dt_obj.strftime('%d/%m/%Y alle %H:%M')}")
+        except Exception:
+            pass
+
+    return "\n".join(lines)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Server che ignora gli errori dei client che chiudono la connessione (es. a deadline scaduta)."""
+
+    daemon_threads = True
+    # Con la coda predefinita (5) le raffiche di nuove connessioni perdono il
+    # SYN e il client lo ritrasmette dopo 1 s e 3 s, come una pagina lenta
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def make_listing_page(cinema_idx: int, n_films: int, base_url: str) -> str:
+    """Genera una pagina cinema con la stessa struttura di comingsoon.it."""
+    sections = []
+    for film_idx in range(n_films):
+        sections.append(
+            '<div class="header-scheda streaming min no-bg container-fluid pbl">'
+            f'<a class="tit_olo h1" href="/film/film-{film_idx}/{film_idx}/">Film {cinema_idx}-{film_idx}</a>'
+            '<div class="cs-btn col primary ico sala">'
+            f'<span>Sala {film_idx % 5 + 1} | Posti 120</span>'
+            '<span><i class="fa fa-clock-o"></i>17.30 / 7,00€ - 19.35 / 7,00€ - 21.40 / 7,00€</span>'
+            '</div>'
+            f'<a class="btn" href="{base_url}/ticket/{cinema_idx}/{film_idx}/">Acquista biglietto e vedi tutte le date</a>'
+            '</div>'
+        )
+    return (
+        "<html><body><section><h2>Film in programmazione</h2>"
+        + "".join(sections)
+        + "</section></body></html>"
+    )
+
+
+def make_ticket_page(n_days: int, month_idx: int = 10, seed: int = 0) -> str:
+    """Genera una pagina ticket con n_days giorni di programmazione (orari variati da seed)."""
+    first_hour = 15 + seed % 4
+    days = []
+    for day in range(n_days):
+        day_num = day % 28 + 1
+        month = MONTHS[(month_idx + day // 28) % 12]
+        days.append(
+            '<div class="media mbm">'
+            '<div class="media-left">'
+            f'<span class="weekday">{WEEKDAYS[day % 7]}</span>'
+            f'<span class="day">{day_num}</span>'
+            f'<span class="month">{month}</span>'
+            '</div>'
+            '<div class="media-body">'
+            f'<button class="btn-fab c">{first_hour}:20</button>'
+            f'<button class="btn-fab c">{first_hour + 2}:50</button>'
+            '<button class="btn-fab c">21:40</button>'
+            '</div>'
+            '</div>'
+        )
+    return "<html><body>" + "".join(days) + "</body></html>"
+
+
+class FakeComingSoon:
+    """
+    Server HTTP/1.1 locale che serve pagine cinema/ticket con una latenza fissa.
+
+    connect_latency simula il costo dell'handshake TCP/TLS per ogni nuova connessione.
+    Con etag=True le risposte includono un ETag e le richieste condizionali
+    ricevono 304 Not Modified. Con volatile=True ogni risposta contiene uno
+    script e un commento diversi, come i token e i timestamp delle pagine reali.
+    Una frazione stragglers delle richieste (estratta a caso per ognuna)
+    attende straggler_latency secondi in più.
+    """
+
+    def __init__(self, n_cinemas: int, n_films: int, n_days: int, latency: float,
+                 connect_latency: float = 0.0, etag: bool = False, volatile: bool = False,
+                 stragglers: float = 0.0, straggler_latency: float = 0.0, seed: int = 0):
+        self.n_cinemas = n_cinemas
+        self.n_films = n_films
+        self.n_days = n_days
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.etag = etag
+        self.volatile = volatile
+        self.stragglers = stragglers
+        self.straggler_latency = straggler_latency
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.slow_requests = 0
+        self.connections = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def cinema_urls(self) -> Dict[str, str]:
+        return {
+            f"Cinema {idx}": f"{self.base_url}/cinema/{idx}/"
+            for idx in range(self.n_cinemas)
+        }
+
+    def _render(self, path: str):
+        parts = [p for p in path.split("/") if p]
+        if len(parts) == 2 and parts[0] == "cinema":
+            body = make_listing_page(int(parts[1]), self.n_films, self.base_url)
+        elif len(parts) == 3 and parts[0] == "ticket":
+            body = make_ticket_page(self.n_days, seed=int(parts[1]) * 31 + int(parts[2]))
+        else:
+            return None
+        if self.volatile:
+            with self._lock:
+                serial = self.requests
+            body = body.replace(
+                "<body>",
+                f'<body><script nonce="n{serial}">window.requestId = "{serial}";</script>'
+                f"<!-- generata alle {time.time():.6f} -->",
+                1,
+            )
+        return body
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Evita il ritardo Nagle/delayed-ACK tra header e corpo
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with fake._lock:
+                    fake.connections += 1
+                time.sleep(fake.connect_latency)
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                    slow = fake.stragglers > 0 and fake._random.random() < fake.stragglers
+                    if slow:
+                        fake.slow_requests += 1
+                time.sleep(fake.latency + (fake.straggler_latency if slow else 0.0))
+                body = fake._render(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                etag = f'"{hashlib.md5(payload).hexdigest()}"' if fake.etag else None
+                if etag and self.headers.get("If-None-Match") == etag:
+                    with fake._lock:
+                        fake.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    payload = gzip.compress(payload)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeTrakt:
+    """
+    Server locale che simula l'endpoint /search/movie di Trakt.
+
+    Ogni risposta ha una latenza fissa; una richiesta ogni rate_limit_every
+    riceve 429 con Retry-After: retry_after.
+    """
+
+    def __init__(self, latency: float, rate_limit_every: int = 0, retry_after: float = 1):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _send_json(self, status: int, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                    throttled = fake.rate_limit_every and fake.requests % fake.rate_limit_every == 0
+                    if throttled:
+                        fake.rate_limited += 1
+                if throttled:
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": str(fake.retry_after)})
+                    return
+
+                time.sleep(fake.latency)
+                query = parse_qs(urlsplit(self.path).query).get("query", [""])[0]
+                slug = query.lower().replace(" ", "-")
+                ident = int(hashlib.md5(query.encode("utf-8")).hexdigest()[:6], 16)
+                self._send_json(200, [{
+                    "type": "movie",
+                    "score": 1000,
+                    "movie": {
+                        "title": query,
+                        "year": 2025,
+                        "ids": {"trakt": ident, "slug": slug, "imdb": f"tt{ident:07d}", "tmdb": ident},
+                    },
+                }])
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _QuietHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.3f}s")
+    return result, elapsed
+
+
+def bench_fanout(args: argparse.Namespace) -> int:
+    """Confronta lo scraping seriale con il fan-out parallelo."""
+    scraper.PER_HOST_CONCURRENCY = args.per_host
+    http_cache.configure(None)
+
+    with FakeComingSoon(args.cinemas, args.films, args.days, args.latency) as fake:
+        urls = fake.cinema_urls()
+        print(
+            f"{args.cinemas} cinema x {args.films} film, latenza {args.latency}s, "
+            f"workers={args.workers}, per-host={args.per_host}"
+        )
+
+        serial, serial_time = _timed("seriale", lambda: scraper.scrape_all_cinemas(urls, max_workers=1))
+        parallel, parallel_time = _timed(
+            "parallelo", lambda: scraper.scrape_all_cinemas(urls, max_workers=args.workers)
+        )
+
+    if serial != parallel:
+        print("ERRORE: l'output parallelo differisce da quello seriale")
+        return 1
+
+    print(f"speedup      {serial_time / parallel_time:8.2f}x (output identico)")
+    return 0
+
+
+def bench_session(args: argparse.Namespace) -> int:
+    """Confronta una connessione nuova per richiesta con la Session condivisa."""
+    with FakeComingSoon(1, 1, args.days, args.latency, args.connect_latency) as fake:
+        urls = [f"{fake.base_url}/ticket/0/{idx}/" for idx in range(args.requests)]
+        print(
+            f"{args.requests} richieste, latenza {args.latency}s, "
+            f"handshake simulato {args.connect_latency}s"
+        )
+
+        def fresh_connections():
+            for url in urls:
+                response = requests.get(url, headers={"Accept-Encoding": "identity", "Connection": "close"}, timeout=10)
+                response.raise_for_status()
+
+        def pooled_session():
+            for url in urls:
+                http_client.fetch(url).raise_for_status()
+
+        connections_before = fake.connections
+        _, fresh_time = _timed("fresh", fresh_connections)
+        fresh_connections_count = fake.connections - connections_before
+
+        http_client.reset_stats()
+        connections_before = fake.connections
+        _, pooled_time = _timed("pooled", pooled_session)
+        pooled_connections_count = fake.connections - connections_before
+
+    stats = next(iter(http_client.get_stats().values()))
+    print(f"connessioni  fresh={fresh_connections_count} pooled={pooled_connections_count}")
+    print(
+        f"pooled       connect {stats['avg_connect_ms']}ms, wait {stats['avg_wait_ms']}ms, "
+        f"transfer {stats['avg_transfer_ms']}ms per richiesta"
+    )
+    print(f"byte         {stats['bytes']} decompressi, {stats['wire_bytes']} in rete ({http_client.ACCEPT_ENCODING})")
+    print(f"speedup      {fresh_time / pooled_time:8.2f}x")
+    return 0
+
+
+def bench_cache(args: argparse.Namespace) -> int:
+    """Confronta un'esecuzione a cache vuota con una a cache calda (ETag / 304)."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        http_cache.configure(cache_dir)
+        with FakeComingSoon(args.cinemas, args.films, args.days, args.latency, etag=True) as fake:
+            urls = fake.cinema_urls()
+            print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, latenza {args.latency}s")
+
+            cold, cold_time = _timed("fredda", lambda: scraper.scrape_all_cinemas(urls))
+            cold_stats = http_cache.get_stats()
+            warm, warm_time = _timed("calda", lambda: scraper.scrape_all_cinemas(urls))
+            warm_stats = http_cache.get_stats()
+
+    warm_delta = {key: warm_stats[key] - cold_stats[key] for key in warm_stats}
+    print(f"fredda       {cold_stats}")
+    print(f"calda        {warm_delta} (304 dal server: {fake.not_modified})")
+    if cold != warm:
+        print("ERRORE: l'output dalla cache differisce")
+        return 1
+    print(f"speedup      {cold_time / warm_time:8.2f}x (output identico)")
+    return 0
+
+
+def bench_incremental(args: argparse.Namespace) -> int:
+    """
+    Esecuzioni orarie "tranquille": ogni risposta ha byte diversi (script e
+    commenti variabili) ma gli stessi dati. Misura il tempo CPU di una
+    esecuzione a freddo e di una con le impronte già salvate, poi aggiunge un
+    giorno di programmazione e mostra il report delle modifiche.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        http_cache.configure(cache_dir, ttl=0)
+        snapshot_path = os.path.join(cache_dir, "last_snapshot.json")
+        with FakeComingSoon(args.cinemas, args.films, args.days, args.latency, volatile=True) as fake:
+            urls = fake.cinema_urls()
+            print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, pagine volatili")
+
+            def run():
+                start = time.process_time()
+                cinemas = scraper.scrape_all_cinemas(urls)
+                return cinemas, time.process_time() - start
+
+            cold, cold_cpu = run()
+            changes.record_run(cold, snapshot_path)
+            cold_stats = http_cache.get_stats()
+            warm, warm_cpu = run()
+            report = changes.record_run(warm, snapshot_path)
+            warm_stats = http_cache.get_stats()
+
+            fake.n_days += 1
+            changed, changed_cpu = run()
+            changed_report = changes.record_run(changed, snapshot_path)
+
+    warm_delta = {key: warm_stats[key] - cold_stats[key] for key in warm_stats}
+    # Il tempo CPU include anche il server locale, che gira nello stesso processo
+    print(f"fredda       {cold_cpu * 1000:8.1f} ms CPU")
+    print(f"invariata    {warm_cpu * 1000:8.1f} ms CPU  {warm_delta}")
+    print(f"+1 giorno    {changed_cpu * 1000:8.1f} ms CPU  {changes.summarize(changed_report)}")
+    if cold != warm or changes.has_changes(report):
+        print("ERRORE: l'esecuzione invariata differisce dalla precedente")
+        return 1
+    print(f"risparmio    {100 * (1 - warm_cpu / cold_cpu):7.1f}% di CPU (output identico)")
+    return 0
+
+
+def bench_replay(args: argparse.Namespace) -> int:
+    """
+    Registra uno scraping contro il server locale e lo riproduce dall'archivio,
+    con la latenza originale e alla massima velocità, verificando che l'output
+    sia identico.
+    """
+    http_cache.configure(None)
+    with tempfile.TemporaryDirectory() as archive:
+        with FakeComingSoon(args.cinemas, args.films, args.days, args.latency) as fake:
+            urls = fake.cinema_urls()
+            print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, latenza {args.latency}s")
+            http_client.set_transport(transport.RECORD, archive)
+            recorded, record_time = _timed("registra", lambda: scraper.scrape_all_cinemas(urls))
+            server_requests = fake.requests
+
+        # Il server è spento: le risposte arrivano solo dall'archivio
+        http_client.set_transport(transport.REPLAY, archive, latency=1.0)
+        original, original_time = _timed("replay x1", lambda: scraper.scrape_all_cinemas(urls))
+        http_client.set_transport(transport.REPLAY, archive, latency=0.0)
+        fast, fast_time = _timed("replay x0", lambda: scraper.scrape_all_cinemas(urls))
+        http_client.set_transport(transport.LIVE)
+        archived = len(os.listdir(archive))
+
+    print(f"richieste    {server_requests} al server, {archived} risposte nell'archivio")
+    if not (recorded == original == fast):
+        print("ERRORE: l'output del replay differisce dalla registrazione")
+        return 1
+    print(f"speedup      {record_time / fast_time:8.2f}x a massima velocità (output identico)")
+    return 0
+
+
+def bench_stream(args: argparse.Namespace) -> int:
+    """Tempo al primo film e al primo cinema con iter_scrape rispetto allo scraping completo."""
+    http_cache.configure(None)
+    with FakeComingSoon(args.cinemas, args.films, args.days, args.latency) as fake:
+        urls = fake.cinema_urls()
+        print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, latenza {args.latency}s")
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            complete = scraper.scrape_all_cinemas(urls)
+            complete_time = time.perf_counter() - start
+
+            first = {}
+            streamed = {}
+            start = time.perf_counter()
+            for kind, payload in scraper.iter_scrape(urls):
+                first.setdefault(kind, time.perf_counter() - start)
+                if kind == "cinema":
+                    streamed[payload["cinema"]] = payload
+            stream_time = time.perf_counter() - start
+
+    print(f"completo     {complete_time:8.3f}s al primo byte")
+    print(f"primo film   {first['film']:8.3f}s")
+    print(f"primo cinema {first['cinema']:8.3f}s")
+    print(f"stream       {stream_time:8.3f}s in totale")
+    if [streamed[c["cinema"]] for c in complete] != complete:
+        print("ERRORE: i cinema in streaming differiscono dallo scraping completo")
+        return 1
+    print(f"primo cinema {complete_time / first['cinema']:8.2f}x prima (output identico)")
+    return 0
+
+
+def bench_trakt(args: argparse.Namespace) -> int:
+    """
+    Arricchimento Trakt seriale vs parallelo contro un server locale con latenza e 429.
+
+    Fallisce se l'output parallelo differisce dal seriale, se i dati non
+    arrivano a tutti i film con lo stesso titolo, se un 429 non viene
+    ritentato, se alla scadenza i film non risolti non hanno
+    trakt_incomplete o se un 429 finisce nella cache.
+    """
+    os.environ.setdefault("TRAKT_CLIENT_ID", "benchmark")
+    # Il secondo cinema ripete un titolo su due: i dati vanno propagati a entrambi i film
+    cinemas = [
+        {"cinema": "Cinema 0", "film": [{"titolo": f"Film {idx}", "programmazione": []} for idx in range(args.titles)]},
+        {"cinema": "Cinema 1", "film": [{"titolo": f"Film {idx}", "programmazione": []} for idx in range(0, args.titles, 2)]},
+    ]
+
+    def run(label: str, fake: FakeTrakt, titles: Optional[int] = None, **kwargs):
+        stats: Dict[str, int] = {}
+        limiter = TokenBucket(args.rate, args.burst)
+        cache = TraktCache(":memory:")
+        copy = [dict(c, film=[dict(f) for f in c["film"][:titles]]) for c in cinemas]
+        aggregated, elapsed = _timed(label, lambda: trakt_enrich.enrich_with_trakt(
+            copy, cache=cache, stats=stats, limiter=limiter, **kwargs
+        ))
+        stats.pop("stored", None)
+        print(f"{'':<12} {stats}")
+        return copy, aggregated, stats, cache, elapsed
+
+    errors = []
+    with FakeTrakt(args.latency, args.rate_limit_every, args.retry_after) as fake:
+        trakt_search.TRAKT_API_URL = fake.base_url
+        print(
+            f"{args.titles} titoli, latenza {args.latency}s, 429 ogni {args.rate_limit_every} richieste "
+            f"(Retry-After {args.retry_after}s), limite {args.rate}/s burst {args.burst}"
+        )
+        serial, serial_aggregated, serial_stats, _, serial_time = run("seriale", fake, max_workers=1)
+        parallel, parallel_aggregated, parallel_stats, _, parallel_time = run("parallelo", fake, max_workers=args.workers)
+        _, deadline_aggregated, _, _, _ = run("deadline", fake, max_workers=args.workers, deadline=args.deadline)
+
+    if (parallel, parallel_aggregated) != (serial, serial_aggregated):
+        errors.append("output parallelo diverso da quello seriale")
+    for cinema in serial:
+        for film in cinema["film"]:
+            info = serial_aggregated[film["titolo"]]
+            if info["tmdb"] is None or any(film.get(key) != info[key] for key in ("tmdb", "imdb", "imdb_url", "trakt")):
+                errors.append(f"dati Trakt non propagati a '{film['titolo']}' di {cinema['cinema']}")
+                break
+    for label, stats in (("seriale", serial_stats), ("parallelo", parallel_stats)):
+        if args.rate_limit_every and not stats["rate_limited"]:
+            errors.append(f"{label}: nessun 429 ricevuto")
+        if stats["trakt_calls"] != stats["misses"] + stats["rate_limited"]:
+            errors.append(f"{label}: {stats['rate_limited']} 429 ma {stats['trakt_calls']} richieste per {stats['misses']} titoli")
+    unresolved = [info for info in deadline_aggregated.values() if info["tmdb"] is None]
+    if any(not info.get("trakt_incomplete") for info in unresolved):
+        errors.append("deadline: film non risolti senza trakt_incomplete")
+    if parallel_time > args.deadline and not unresolved:
+        errors.append(f"deadline: nessun film con trakt_incomplete dopo {args.deadline}s")
+
+    # Solo 429: finiti i tentativi il film ha un errore, ma la cache resta vuota
+    with FakeTrakt(0, 1, 0.01) as fake:
+        trakt_search.TRAKT_API_URL = fake.base_url
+        _, aggregated, _, cache, _ = run("solo 429", fake, titles=2, max_workers=1)
+    if any(info.get("trakt_error", {}).get("status") != 429 for info in aggregated.values()):
+        errors.append("solo 429: atteso trakt_error con status 429")
+    if any(cache.get(title) is not None for title in aggregated):
+        errors.append("solo 429: l'errore è stato salvato in cache")
+
+    print(f"speedup      {serial_time / parallel_time:8.2f}x")
+    for error in errors:
+        print(f"ERRORE: {error}")
+    return 1 if errors else 0
+
+
+def bench_parse(args: argparse.Namespace) -> int:
+    """Tempo di parsing e picco di memoria per strategia sulle fixture registrate."""
+    pages = load_fixtures()
+    strategies = [s for s in parsing.STRATEGIES if s != "lxml" or parsing.HAS_LXML]
+    print(f"{len(pages)} pagine, {args.repeat} ripetizioni, backend strained: {parsing.BACKEND}")
+    print(f"{'tipo':<8} {'strategia':<10} {'parse ms':>10} {'picco KiB':>10}")
+
+    failures = 0
+    for page_type in (parsing.LISTING, parsing.TICKET):
+        typed = [html for _, kind, html in pages if kind == page_type]
+        expected = [extract_page(page_type, parsing.make_soup(html, strategy="full")) for html in typed]
+
+        for strategy in strategies:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                for html in typed:
+                    parsing.make_soup(html, page_type, strategy)
+                timings.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            for html in typed:
+                soup = parsing.make_soup(html, page_type, strategy)
+                del soup
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            outputs = [extract_page(page_type, parsing.make_soup(html, page_type, strategy)) for html in typed]
+            identical = outputs == expected
+            failures += not identical
+            per_page = statistics.median(timings) / len(typed) * 1000
+            print(
+                f"{page_type:<8} {strategy:<10} {per_page:10.2f} {peak / 1024:10.0f}"
+                + ("" if identical else "  ERRORE: output diverso da 'full'")
+            )
+
+    return 1 if failures else 0
+
+
+def bench_extract(args: argparse.Namespace) -> int:
+    """Tempo CPU per pagina degli estrattori a passata singola rispetto ai precedenti."""
+    pages = load_fixtures()
+    extractors = {
+        parsing.LISTING: (reference_parse_film_listing, scraper._parse_film_listing),
+        parsing.TICKET: (reference_extract_dates_and_times, scraper.extract_dates_and_times_from_ticket_page),
+    }
+    print(f"{len(pages)} pagine, {args.repeat} ripetizioni, parser {args.parser}")
+    print(f"{'tipo':<8} {'prima ms':>10} {'dopo ms':>10} {'risparmio':>10}")
+
+    failures = 0
+    for page_type, (reference, current) in extractors.items():
+        soups = [parsing.make_soup(html, page_type, args.parser) for _, kind, html in pages if kind == page_type]
+
+        identical = [reference(soup) for soup in soups] == [current(soup) for soup in soups]
+        failures += not identical
+
+        timings = {}
+        for label, extractor in (("prima", reference), ("dopo", current)):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.process_time()
+                for soup in soups:
+                    extractor(soup)
+                samples.append(time.process_time() - start)
+            timings[label] = statistics.median(samples) / len(soups) * 1000
+
+        saved = 1 - timings["dopo"] / timings["prima"] if timings["prima"] else 0.0
+        print(
+            f"{page_type:<8} {timings['prima']:10.3f} {timings['dopo']:10.3f} {saved:10.0%}"
+            + ("" if identical else "  ERRORE: output diverso")
+        )
+
+    return 1 if failures else 0
+
+# --- Micro-benchmark delle funzioni di estrazione e formattazione ---
+
+@contextlib.contextmanager
+def _serve_pages(pages: Dict[str, str]):
+    """
+    Fa rispondere a scraper._download con le pagine indicate (url -> html),
+    senza rete e senza cache, così ogni chiamata rifà l'estrazione.
+    """
+    original = scraper._download
+    http_cache.configure(None)
+
+    def download(url: str, deadline: Optional[float] = None) -> Optional[http_cache.CachedPage]:
+        html = pages.get(url)
+        if html is None:
+            return None
+        return http_cache.CachedPage(url, html, "", "hit")
+
+    scraper._download = download
+    try:
+        yield
+    finally:
+        scraper._download = original
+
+
+def _measure(func, repeat: int) -> Dict[str, float]:
+    """
+    Tempo mediano per chiamata, blocchi di memoria ancora allocati dopo la
+    chiamata (risultato compreso) e picco di memoria durante la chiamata.
+
+    Le funzioni molto veloci vengono ripetute più volte per campione, così
+    ogni campione dura almeno 20 ms e il rumore del timer resta trascurabile.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        func()  # riscaldamento
+        number = max(1, int(0.02 / max(time.perf_counter() - start, 1e-6)))
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            samples.append((time.perf_counter() - start) / number)
+
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        result = func()
+        blocks = sys.getallocatedblocks() - blocks_before
+        del result
+
+        gc.collect()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "ms": statistics.median(samples) * 1000,
+        "blocks": blocks,
+        "peak_kib": peak / 1024,
+    }
+
+
+def _micro_cases(args: argparse.Namespace) -> List[Tuple[str, Dict[str, str], Any]]:
+    """
+    Casi del benchmark micro: (nome, pagine servite, funzione da misurare).
+
+    Le fixture registrate coprono i tre cinema e le loro pagine ticket; le
+    pagine sintetiche scalano a args.films film per cinema e args.days giorni.
+    """
+    cases = []
+    fixtures = load_fixtures()
+    fixture_pages = {url: html for url, _, html in fixtures}
+    listings = {url: html for url, kind, html in fixtures if kind == parsing.LISTING}
+    names = {url: name for name, url in scraper.CINEMA_URLS.items()}
+    ticket_soups = [parsing.make_soup(html, parsing.TICKET) for _, kind, html in fixtures if kind == parsing.TICKET]
+
+    for url, html in sorted(listings.items()):
+        soup = parsing.make_soup(html, parsing.LISTING)
+        name = names.get(url, url)
+        cases.append((
+            f"fixture extract_film_data [{name}]", fixture_pages,
+            lambda soup=soup, name=name: scraper.extract_film_data(soup, name, max_workers=1),
+        ))
+    cases.append((
+        f"fixture extract_dates_and_times x{len(ticket_soups)}", fixture_pages,
+        lambda: [scraper.extract_dates_and_times_from_ticket_page(soup) for soup in ticket_soups],
+    ))
+
+    schedule_texts = []
+    for html in listings.values():
+        soup = parsing.make_soup(html, strategy="full")
+        schedule_texts.extend(div.get_text(strip=True) for div in soup.find_all('div', class_=scraper.SCHEDULE_RE))
+    cases.append((
+        f"fixture extract_times_from_text x{len(schedule_texts)}", fixture_pages,
+        lambda: [scraper.extract_times_from_text(text) for text in schedule_texts],
+    ))
+
+    with _serve_pages(fixture_pages), contextlib.redirect_stdout(io.StringIO()):
+        fixture_data = {
+            "timestamp": "2025-11-02T10:00:00",
+            "cinema": scraper.scrape_all_cinemas(scraper.CINEMA_URLS, max_workers=1),
+        }
+    cases.append((
+        "fixture format_telegram_message", fixture_pages,
+        lambda: scraper.format_telegram_message(fixture_data),
+    ))
+
+    # Pagine sintetiche: args.films film per cinema, args.days giorni per ticket
+    base_url = "https://synthetic.invalid"
+    synthetic_pages = {}
+    synthetic_urls = {}
+    for cinema_idx in range(3):
+        url = f"{base_url}/cinema/{cinema_idx}/"
+        synthetic_urls[f"Cinema {cinema_idx}"] = url
+        synthetic_pages[url] = make_listing_page(cinema_idx, args.films, base_url)
+        for film_idx in range(args.films):
+            synthetic_pages[f"{base_url}/ticket/{cinema_idx}/{film_idx}/"] = make_ticket_page(
+                args.days, seed=cinema_idx * 31 + film_idx
+            )
+
+    listing_soup = parsing.make_soup(synthetic_pages[synthetic_urls["Cinema 0"]], parsing.LISTING)
+    ticket_soup = parsing.make_soup(make_ticket_page(args.days), parsing.TICKET)
+    long_text = " - ".join(f"{15 + i % 8}.{i % 6}0 / 7,00€" for i in range(args.days * 4))
+    with _serve_pages(synthetic_pages), contextlib.redirect_stdout(io.StringIO()):
+        synthetic_data = {
+            "timestamp": "2025-11-02T10:00:00",
+            "cinema": scraper.scrape_all_cinemas(synthetic_urls, max_workers=1),
+        }
+
+    cases.extend([
+        (f"synthetic extract_film_data [{args.films} film x {args.days} giorni]", synthetic_pages,
+         lambda: scraper.extract_film_data(listing_soup, "Cinema 0", max_workers=1)),
+        (f"synthetic extract_dates_and_times [{args.days} giorni]", synthetic_pages,
+         lambda: scraper.extract_dates_and_times_from_ticket_page(ticket_soup)),
+        (f"synthetic extract_times_from_text [{args.days * 4} orari]", synthetic_pages,
+         lambda: scraper.extract_times_from_text(long_text)),
+        (f"synthetic format_telegram_message [3 x {args.films} film]", synthetic_pages,
+         lambda: scraper.format_telegram_message(synthetic_data)),
+    ])
+    return cases
+
+
+def bench_micro(args: argparse.Namespace) -> int:
+    """
+    Micro-benchmark offline di extract_film_data, extract_dates_and_times_from_ticket_page,
+    extract_times_from_text e format_telegram_message, con confronto rispetto a una baseline.
+    """
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+
+    print(f"{args.repeat} ripetizioni, parser {parsing.resolve_strategy(parsing.LISTING)}"
+          + (f", baseline {args.baseline} (tolleranza {args.tolerance:.0%})" if baseline else ""))
+    print(f"{'caso':<58} {'ms/chiamata':>11} {'blocchi':>9} {'picco KiB':>10}")
+
+    results = {}
+    regressions = []
+    for name, pages, func in _micro_cases(args):
+        with _serve_pages(pages):
+            result = _measure(func, args.repeat)
+        results[name] = result
+
+        note = ""
+        reference = baseline.get(name) if baseline else None
+        if reference:
+            slower = result["ms"] / reference["ms"] - 1 if reference["ms"] else 0.0
+            larger = result["peak_kib"] / reference["peak_kib"] - 1 if reference["peak_kib"] else 0.0
+            note = f"  {slower:+6.0%} tempo {larger:+6.0%} memoria"
+            if slower > args.tolerance or larger > args.tolerance:
+                regressions.append(name)
+                note += "  REGRESSIONE"
+        print(f"{name:<58} {result['ms']:11.3f} {result['blocks']:9d} {result['peak_kib']:10.0f}{note}")
+
+    if args.save_baseline:
+        directory = os.path.dirname(args.baseline)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "python": sys.version.split()[0],
+                "repeat": args.repeat,
+                "cases": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Baseline salvata in {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regressioni oltre il {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+# --- Modello dati: dizionari vs record con __slots__ ---
+
+def make_regional_data(n_cinemas: int, n_films: int, n_days: int) -> Dict[str, Any]:
+    """
+    Programmazione sintetica su scala regionale, nel formato JSON dello scraper.
+
+    I film si ripetono tra i cinema (come nelle uscite reali) e circa metà
+    ha gli id Trakt/IMDb dell'arricchimento.
+    """
+    titles = [f"Film regionale {i}" for i in range(n_films * 2)]
+    slots = ["15:00", "16:30", "17:45", "18:30", "19:10", "20:30", "21:15", "22:40"]
+    cinemas = []
+    for cinema_idx in range(n_cinemas):
+        films = []
+        for film_idx in range(n_films):
+            seed = cinema_idx * 7 + film_idx
+            times = [slots[(seed + k) % len(slots)] for k in range(1 + seed % 4)]
+            programmazione = []
+            for day in range(n_days):
+                current = datetime(2025, 11, 1) + timedelta(days=day)
+                programmazione.append({
+                    "data": current.date().isoformat(),
+                    "giorno": WEEKDAYS[current.weekday()],
+                    "orari": times if day % 5 else times[:1],
+                })
+            film = {
+                "titolo": titles[(cinema_idx + film_idx) % len(titles)],
+                "orari": [t.replace(':', '.') for t in times],
+                "sala": f"Sala {1 + film_idx % 6}",
+                "programmazione": programmazione,
+            }
+            if seed % 2:
+                film.update(tmdb=1000 + seed, trakt=f"film-{seed}", imdb=f"tt{seed:07d}",
+                            imdb_url=f"https://www.imdb.com/title/tt{seed:07d}/")
+            films.append(film)
+        cinemas.append({"cinema": f"Cinema {cinema_idx}", "url": f"https://synthetic.invalid/cinema/{cinema_idx}/", "film": films})
+    return {"timestamp": "2025-11-02T10:00:00", "cinema": cinemas}
+
+
+def _retained_kib(build) -> float:
+    """Memoria ancora allocata dal risultato di build (KiB)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / 1024
+
+
+def bench_models(args: argparse.Namespace) -> int:
+    """
+    Memoria e tempo di formattazione dei dizionari JSON rispetto ai record
+    di models, verificando round-trip senza perdite e messaggio identico.
+    """
+    with _serve_pages({url: html for url, _, html in load_fixtures()}), contextlib.redirect_stdout(io.StringIO()):
+        fixture_data = {
+            "timestamp": "2025-11-02T10:00:00",
+            "cinema": scraper.scrape_all_cinemas(scraper.CINEMA_URLS, max_workers=1),
+        }
+    regional = make_regional_data(args.cinemas, args.films, args.days)
+    # I dati arrivano da JSON (file o cache): stringhe e liste non condivise
+    raw = json.dumps(regional["cinema"], ensure_ascii=False)
+
+    failures = 0
+    for label, data in (("fixture", fixture_data), ("regionale", regional)):
+        records = models.cinemas_from_json(data["cinema"])
+        if models.cinemas_to_json(records) != data["cinema"]:
+            print(f"{label}: round-trip dizionari -> record -> dizionari DIVERSO")
+            failures += 1
+        expected = reference_format_telegram_message(data)
+        if scraper.format_telegram_message(data) != expected:
+            print(f"{label}: messaggio Telegram DIVERSO dal riferimento")
+            failures += 1
+        if scraper.format_telegram_message({"timestamp": data["timestamp"], "cinema": records}) != expected:
+            print(f"{label}: messaggio Telegram dai record DIVERSO dal riferimento")
+            failures += 1
+
+    # Le fixture senza i campi opzionali (e con un cinema incompleto): to_dict non li deve aggiungere
+    reduced = [
+        {"cinema": cinema["cinema"], "film": [
+            {"titolo": film["titolo"], "programmazione": [
+                {key: value for key, value in screening.items() if key != "giorno"}
+                for screening in film["programmazione"]
+            ]}
+            for film in cinema["film"]
+        ]}
+        for cinema in fixture_data["cinema"]
+    ] + [{"cinema": "Cinema incompleto", "url": "https://example.invalid", "film": [], scraper.INCOMPLETE: True}]
+    if models.cinemas_to_json(models.cinemas_from_json(reduced)) != reduced:
+        print("fixture ridotte: round-trip dizionari -> record -> dizionari DIVERSO")
+        failures += 1
+
+    n_screenings = sum(len(film["programmazione"]) for cinema in regional["cinema"] for film in cinema["film"])
+    print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni "
+          f"({n_screenings} date), {args.repeat} ripetizioni")
+
+    dict_kib = _retained_kib(lambda: json.loads(raw))
+    record_kib = _retained_kib(lambda: models.cinemas_from_json(json.loads(raw)))
+    print(f"{'memoria dizionari':<40} {dict_kib:10.0f} KiB")
+    print(f"{'memoria record':<40} {record_kib:10.0f} KiB  ({1 - record_kib / dict_kib:.0%} in meno)")
+
+    records = {"timestamp": regional["timestamp"], "cinema": models.cinemas_from_json(json.loads(raw))}
+    timings = [
+        ("formattazione precedente (dizionari)", lambda: reference_format_telegram_message(regional)),
+        ("formattazione dai dizionari", lambda: scraper.format_telegram_message(regional)),
+        ("formattazione dai record", lambda: scraper.format_telegram_message(records)),
+        ("conversione JSON -> record", lambda: models.cinemas_from_json(regional["cinema"])),
+        ("conversione record -> JSON", lambda: models.cinemas_to_json(records["cinema"])),
+    ]
+    for label, func in timings:
+        print(f"{label:<40} {_measure(func, args.repeat)['ms']:10.1f} ms")
+
+    if failures:
+        print(f"{failures} verifiche fallite")
+        return 1
+    print("Round-trip e messaggio Telegram identici su fixture e dati regionali")
+    return 0
+
+
+# --- Serializzazione delle risposte dell'API ---
+
+def bench_responses(args: argparse.Namespace) -> int:
+    """
+    Tempo di serializzazione e byte trasferiti per /api/films e
+    /api/films/telegram: jsonify di Flask a ogni richiesta rispetto al corpo
+    serializzato una volta, con ETag/304 e compressione negoziata.
+    """
+    import app as api
+    from flask import jsonify
+
+    data = make_regional_data(args.cinemas, args.films, args.days)
+    api.snapshots.clear()
+    api.encoded.clear()
+    api.snapshots.get(("all", False, scraper.DETAILS_ALL), lambda: (data, None))
+    client = api.app.test_client()
+
+    def jsonify_body():
+        with api.app.test_request_context():
+            return jsonify(dict(data)).get_data()
+
+    def cold_request():
+        api.encoded.clear()
+        return client.get("/api/films").data
+
+    etag = client.get("/api/films").headers["ETag"]
+    if json.loads(client.get("/api/films").data) != json.loads(jsonify_body()):
+        print("Il corpo servito è diverso da quello di jsonify")
+        return 1
+
+    cases = [
+        ("jsonify (prima, a ogni richiesta)", jsonify_body),
+        (f"responses.dumps ({'orjson' if responses.HAS_ORJSON else 'json'})", lambda: responses.dumps(dict(data))),
+        ("GET /api/films, primo dopo lo scraping", cold_request),
+        ("GET /api/films, corpo già serializzato", lambda: client.get("/api/films").data),
+        ("GET /api/films, gzip", lambda: client.get("/api/films", headers={"Accept-Encoding": "gzip"}).data),
+    ]
+    if "br" in responses.ENCODINGS:
+        cases.append(("GET /api/films, br", lambda: client.get("/api/films", headers={"Accept-Encoding": "br"}).data))
+    cases.extend([
+        ("GET /api/films, If-None-Match (304)", lambda: client.get("/api/films", headers={"If-None-Match": etag}).data),
+        ("GET /api/films/telegram", lambda: client.get("/api/films/telegram").data),
+        ("GET /api/films/telegram, gzip",
+         lambda: client.get("/api/films/telegram", headers={"Accept-Encoding": "gzip"}).data),
+    ])
+
+    print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, {args.repeat} ripetizioni")
+    print(f"{'caso':<50} {'ms':>9} {'byte':>11}")
+    for label, func in cases:
+        size = len(func())
+        print(f"{label:<50} {_measure(func, args.repeat)['ms']:9.2f} {size:11d}")
+
+    for encoding in responses.ENCODINGS:
+        body = responses.dumps(dict(data))
+        start = time.perf_counter()
+        compressed = responses.compress(body, encoding)
+        print(f"compressione {encoding} (una volta per snapshot): {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"{len(body)} -> {len(compressed)} byte")
+    api.snapshots.clear()
+    api.encoded.clear()
+    return 0
+
+
+# --- Indice delle proiezioni ---
+
+def reference_showtimes(data: Dict[str, Any], day=None, start=None, end=None, cinema=None, title=None,
+                        cinemas=None) -> List[Tuple]:
+    """Scansione della programmazione di ogni film, usata come riferimento per /api/showtimes."""
+    slug = scraper.film_slug(title) if title else None
+    results = []
+    for item in data["cinema"]:
+        if cinema is not None and item["cinema"] != cinema:
+            continue
+        if cinemas is not None and item["cinema"] not in cinemas:
+            continue
+        for film in item["film"]:
+            if slug is not None and slug not in scraper.film_slug(film["titolo"]):
+                continue
+            for prog in film["programmazione"]:
+                current = datetime.fromisoformat(prog["data"]).date()
+                if day is not None and current != day:
+                    continue
+                for text in prog["orari"]:
+                    clock = showtimes.parse_clock(text)
+                    if clock is None or (start and clock < start) or (end and clock > end):
+                        continue
+                    results.append((datetime.combine(current, clock), item["cinema"], film["titolo"]))
+    results.sort()
+    return results
+
+
+def bench_showtimes(args: argparse.Namespace) -> int:
+    """Query di /api/showtimes: indice con ricerca binaria vs scansione di tutta la programmazione."""
+    data = make_regional_data(args.cinemas, args.films, args.days)
+    first_day = datetime(2025, 11, 1).date()
+    saturday = first_day + timedelta(days=(5 - first_day.weekday()) % 7)
+    cinema = data["cinema"][args.cinemas // 2]["cinema"]
+    queries = [
+        ("stasera dopo le 20:00", dict(day=first_day, start=datetime.strptime("20:00", "%H:%M").time())),
+        (f"sabato a {cinema}", dict(day=saturday, cinema=cinema)),
+        ("ogni giorno 21:00-21:30", dict(start=datetime.strptime("21:00", "%H:%M").time(),
+                                         end=datetime.strptime("21:30", "%H:%M").time())),
+        ("un titolo, tutte le date", dict(title="Film regionale 7")),
+        ("una città, sabato", dict(day=saturday, city="Città 1")),
+    ]
+    # Cinema distribuiti a turno tra 5 città, come nel registro regionale
+    cities = {item["cinema"]: f"Città {idx % 5}" for idx, item in enumerate(data["cinema"])}
+
+    start = time.perf_counter()
+    index = showtimes.ShowtimeIndex(data["cinema"], cities.get)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni: {len(index)} proiezioni, "
+          f"indice costruito in {build_ms:.0f} ms (una volta per snapshot)")
+    print(f"{'query':<32} {'risultati':>9} {'scansione ms':>13} {'indice ms':>10}")
+
+    failures = 0
+    for label, filters in queries:
+        reference = dict(filters)
+        if "city" in reference:
+            city = reference.pop("city")
+            reference["cinemas"] = {name for name, value in cities.items() if value == city}
+        expected = reference_showtimes(data, **reference)
+        found = [s.sort_key() for s in index.query(**filters)]
+        if found != expected:
+            print(f"{label}: risultati diversi dalla scansione")
+            failures += 1
+        scan = _measure(lambda: reference_showtimes(data, **reference), args.repeat)["ms"]
+        indexed = _measure(lambda: index.query(**filters), args.repeat)["ms"]
+        print(f"{label:<32} {len(found):9d} {scan:13.2f} {indexed:10.3f}")
+    return 1 if failures else 0
+
+
+# --- Ricerca approssimata dei titoli ---
+
+_SYLLABLES = ["ba", "ca", "da", "fe", "gi", "lo", "ma", "ne", "po", "ri", "sa", "te", "vi", "zo", "ra",
+              "to", "mi", "no", "pe", "lu", "ro", "se", "ta", "ve", "co", "li", "ge", "pa", "du", "bo"]
+_ARTICLES = ["il", "la", "lo", "di", "del", "della", "e", "un", "una", "le"]
+
+
+def make_titles(n_titles: int) -> List[str]:
+    """
+    Titoli sintetici distinti di 2-5 parole: un vocabolario di qualche
+    migliaio di parole inventate, articoli frequenti e qualche numero romano.
+    """
+    titles = []
+    seen = set()
+    seed = 0
+    while len(titles) < n_titles:
+        seed += 1
+        words = []
+        for k in range(2 + seed % 4):
+            value = seed * 7919 + k * 104729
+            if k and value % 3 == 0:
+                words.append(_ARTICLES[value % len(_ARTICLES)])
+                continue
+            length = 2 + value % 3
+            words.append("".join(_SYLLABLES[(value // 31 ** i) % len(_SYLLABLES)] for i in range(length)))
+        if seed % 13 == 0:
+            words.append("II")
+        title = " ".join(words).capitalize()
+        if title not in seen:
+            seen.add(title)
+            titles.append(title)
+    return titles
+
+
+def _misspell(title: str, seed: int) -> str:
+    """Il titolo con un errore di battitura, senza maiuscole e accenti come lo scriverebbe un utente."""
+    text = scraper.film_slug(title).replace('-', ' ')
+    position = 1 + seed % max(1, len(text) - 2)
+    if seed % 2:
+        return text[:position] + text[position + 1:]  # lettera mancante
+    return text[:position] + text[position + 1] + text[position] + text[position + 2:]  # lettere invertite
+
+
+def bench_search(args: argparse.Namespace) -> int:
+    """Ricerca su /api/films/search: indice a trigrammi vs confronto con ogni titolo (difflib)."""
+    import difflib
+
+    titles = make_titles(args.titles)
+    per_cinema = max(1, len(titles) // args.cinemas)
+    data = {"cinema": [
+        {"cinema": f"Cinema {i}", "film": [{"titolo": title} for title in titles[i * per_cinema:(i + 1) * per_cinema]]}
+        for i in range(args.cinemas)
+    ]}
+    start = time.perf_counter()
+    index = title_search.TitleIndex(data["cinema"])
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(index)} titoli, {len(index.postings)} trigrammi, indice costruito in {build_ms:.0f} ms")
+
+    queries = []
+    for i, title in enumerate(titles[::max(1, len(titles) // args.queries)][:args.queries]):
+        words = title.split()
+        queries.append(("errore di battitura", _misspell(title, i), title))
+        queries.append(("titolo parziale", " ".join(words[1:-1]) if len(words) > 3 else words[0], title))
+
+    found = {"errore di battitura": [0, 0], "titolo parziale": [0, 0]}
+    for kind, query, title in queries:
+        top = [index.titles[position] for _, position in index.search(query, limit=10)]
+        found[kind][0] += bool(top) and top[0] == title
+        found[kind][1] += title in top
+    for kind, (first, in_top) in found.items():
+        total = sum(1 for q in queries if q[0] == kind)
+        print(f"{kind:<22} primo risultato corretto {first}/{total}, nei primi 10 {in_top}/{total}")
+
+    lowered = [scraper.film_slug(title).replace('-', ' ') for title in titles]
+    sample = [query for _, query, _ in queries]
+    indexed = _measure(lambda: [index.search(query) for query in sample], args.repeat)["ms"] / len(sample)
+    scan = _measure(lambda: [difflib.get_close_matches(query, lowered, n=10, cutoff=0.35) for query in sample[:5]],
+                    args.repeat)["ms"] / 5
+    print(f"{'indice a trigrammi':<22} {indexed * 1000:9.0f} us per ricerca")
+    print(f"{'difflib su ogni titolo':<22} {scan * 1000:9.0f} us per ricerca")
+    return 0
+
+
+# --- Messaggio Telegram: varianti e suddivisione ---
+
+def bench_telegram(args: argparse.Namespace) -> int:
+    """
+    Formattazione a ogni richiesta vs renderer per snapshot (rappresentazione
+    intermedia costruita una volta, varianti memorizzate) e suddivisione in
+    messaggi entro il limite di Telegram.
+    """
+    data = make_regional_data(args.cinemas, args.films, args.days)
+    cinema = data["cinema"][0]["cinema"]
+    day = datetime(2025, 11, 8).date()
+
+    failures = 0
+    renderer = telegram_render.TelegramRenderer(data)
+    if renderer.render() != reference_format_telegram_message(data):
+        print("Il messaggio completo è diverso dal riferimento")
+        failures += 1
+
+    limit = telegram_render.TELEGRAM_MAX_LENGTH
+    blocks = renderer.blocks()
+    chunks = renderer.chunks()
+    longest = max(telegram_render.message_length(chunk) for chunk in chunks)
+    films = sum(chunk.count("📽️ ") for chunk in chunks)
+    # Solo i film più lunghi di un intero messaggio possono essere divisi
+    split = sum(1 for block in blocks[1:]
+                if telegram_render.message_length(block) <= limit
+                and not any(block.rstrip("\n") in chunk for chunk in chunks))
+    if longest > limit or films != len(renderer.films) or split:
+        print(f"Suddivisione non valida: {longest} caratteri, {films}/{len(renderer.films)} film, {split} film spezzati")
+        failures += 1
+    print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni: "
+          f"{telegram_render.message_length(renderer.render())} caratteri, {len(chunks)} messaggi "
+          f"(il più lungo {longest}/{limit})")
+
+    cases = [
+        ("formattazione precedente, a ogni richiesta", lambda: reference_format_telegram_message(data)),
+        ("renderer: rappresentazione intermedia", lambda: telegram_render.TelegramRenderer(data)),
+        ("variante completa, prima volta",
+         lambda: _fresh_variants(renderer).render()),
+        ("variante completa, memorizzata", lambda: renderer.render()),
+        (f"variante un cinema ({cinema}), prima volta",
+         lambda: _fresh_variants(renderer).render(cinema=cinema)),
+        (f"variante un giorno ({day}), prima volta", lambda: _fresh_variants(renderer).render(day=day)),
+        ("suddivisione in messaggi, prima volta", lambda: _fresh_variants(renderer).chunks()),
+        ("suddivisione in messaggi, memorizzata", lambda: renderer.chunks()),
+    ]
+    print(f"{'caso':<48} {'ms':>9}")
+    for label, func in cases:
+        print(f"{label:<48} {_measure(func, args.repeat)['ms']:9.3f}")
+    return 1 if failures else 0
+
+
+def _fresh_variants(renderer):
+    """Il renderer con le varianti già formattate dimenticate (la rappresentazione intermedia resta)."""
+    renderer._blocks.clear()
+    renderer._chunks.clear()
+    return renderer
+
+
+@contextlib.contextmanager
+def _quiet_processes():
+    """Silenzia l'output di avanzamento del processo corrente e dei processi che avvia."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def bench_shards(args: argparse.Namespace) -> int:
+    """Scraping di un registro regionale diviso in shard tra più processi."""
+    scraper.PER_HOST_CONCURRENCY = args.per_host
+    http_cache.configure(None)
+
+    with FakeComingSoon(args.cinemas, args.films, args.days, args.latency) as fake:
+        urls = fake.cinema_urls()
+        print(
+            f"{args.cinemas} cinema x {args.films} film ({args.cinemas * (args.films + 1)} pagine), "
+            f"latenza {args.latency}s, workers={args.workers}, per-host={args.per_host} per processo, "
+            f"{os.cpu_count()} CPU"
+        )
+        reference = None
+        baseline = None
+        for processes in args.processes:
+            start = time.perf_counter()
+            with _quiet_processes():
+                result = scraper.scrape_all_cinemas(urls, max_workers=args.workers, processes=processes)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{processes:>2} processi {elapsed:8.3f}s  {args.cinemas / elapsed:7.1f} cinema/s  "
+                  f"speedup {baseline / elapsed:5.2f}x")
+            if reference is None:
+                reference = result
+            elif result != reference:
+                print(f"ERRORE: l'output con {processes} processi differisce da quello con {args.processes[0]}")
+                return 1
+
+    print("Output identico per ogni numero di processi")
+    return 0
+
+
+def bench_pipeline(args: argparse.Namespace) -> int:
+    """Scraping con thread (download e parsing insieme) vs pipeline a stadi."""
+    scraper.PER_HOST_CONCURRENCY = args.per_host
+    http_cache.configure(None)
+
+    with FakeComingSoon(args.cinemas, args.films, args.days, args.latency) as fake:
+        urls = fake.cinema_urls()
+        page_bytes = (
+            len(make_listing_page(0, args.films, fake.base_url))
+            + args.films * len(make_ticket_page(args.days))
+        ) * args.cinemas
+        print(
+            f"{args.cinemas} cinema x {args.films} film x {args.days} giorni "
+            f"({args.cinemas * (args.films + 1)} pagine, {page_bytes / 1024 / 1024:.1f} MiB di HTML), "
+            f"latenza {args.latency}s, fetcher={args.workers}, per-host={args.per_host}, {os.cpu_count()} CPU"
+        )
+
+        start = time.perf_counter()
+        with _quiet_processes():
+            reference = scraper._scrape_threaded(urls, args.workers, scraper.DETAILS_ALL)
+        baseline = time.perf_counter() - start
+        print(f"{'thread (download + parsing)':<30} {baseline:8.3f}s")
+
+        for parsers in args.parsers:
+            runner = pipeline.Pipeline(fetchers=args.workers, parsers=parsers, queue_size=args.queue)
+            start = time.perf_counter()
+            with _quiet_processes():
+                result = runner.run(urls)
+            elapsed = time.perf_counter() - start
+            stats = runner.stats()
+            label = f"pipeline, {parsers} processi" if parsers else "pipeline, parsing in thread"
+            print(f"{label:<30} {elapsed:8.3f}s  speedup {baseline / elapsed:5.2f}x")
+            for name, stage in stats["stages"].items():
+                print(
+                    f"    {name:<10} {stage['workers']:>2} worker  {stage['items']:>5} elementi  "
+                    f"utilizzo {stage['utilization']:6.1%}  attesa input {stage['starved_seconds']:7.2f}s  "
+                    f"bloccati {stage['blocked_seconds']:6.2f}s"
+                )
+            queue_stats = stats["queue"]
+            print(
+                f"    coda       {queue_stats['max_depth']}/{queue_stats['capacity']} pagine al massimo, "
+                f"{queue_stats['max_bytes'] / 1024:.0f} KiB"
+            )
+            if result != reference:
+                print("ERRORE: l'output della pipeline differisce da quello con i thread")
+                return 1
+
+    print("Output identico")
+    return 0
+
+
+def bench_metrics(args: argparse.Namespace) -> int:
+    """
+    Costo della strumentazione: nanosecondi per osservazione e tempo CPU di
+    uno scraping con le metriche attive e disattivate, più il riepilogo per
+    stadio che si leggerebbe da /metrics.
+    """
+    histogram = metrics.Histogram("bench_seconds", "bench", ("label",))
+    counter = metrics.Counter("bench_total", "bench", ("label",))
+
+    def timed_block():
+        with histogram.labels("a").time():
+            pass
+
+    operations = {
+        "Histogram.observe": lambda: histogram.labels("a").observe(0.003),
+        "Counter.inc": lambda: counter.labels("a").inc(),
+        "Histogram.time()": timed_block,
+        "chiamata vuota": lambda: None,
+    }
+    for name, operation in operations.items():
+        start = time.perf_counter()
+        for _ in range(args.operations):
+            operation()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {elapsed / args.operations * 1e9:8.0f} ns")
+
+    http_cache.configure(None)
+    with FakeComingSoon(args.cinemas, args.films, args.days, 0) as fake:
+        urls = fake.cinema_urls()
+        print(f"{args.cinemas} cinema x {args.films} film x {args.days} giorni, {args.repeat} ripetizioni")
+        cpu = {}
+        for enabled in (False, True, False, True):
+            metrics.METRICS_ENABLED = enabled
+            start = time.process_time()
+            for _ in range(args.repeat):
+                with _quiet_processes():
+                    scraper.scrape_all_cinemas(urls)
+            cpu.setdefault(enabled, []).append(time.process_time() - start)
+        metrics.METRICS_ENABLED = True
+
+    off, on = min(cpu[False]), min(cpu[True])
+    # Il tempo CPU include anche il server locale, che gira nello stesso processo
+    print(f"metriche off {off * 1000:8.1f} ms CPU")
+    print(f"metriche on  {on * 1000:8.1f} ms CPU  ({100 * (on / off - 1):+.1f}%)")
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"/metrics     {(time.perf_counter() - start) * 1000:8.2f} ms, {len(text) / 1024:.1f} KiB")
+    for metric in (metrics.FETCH_SECONDS, metrics.PARSE_SECONDS, metrics.EXTRACT_SECONDS):
+        for values, series in metric._items():
+            counts, total = series.snapshot()
+            if sum(counts):
+                print(f"    {metric.name}{{{','.join(values)}}}  {sum(counts):>6}  "
+                      f"media {total / sum(counts) * 1000:7.3f} ms")
+    return 0
+
+
+def bench_deadline(args: argparse.Namespace) -> int:
+    """
+    Code di latenza con pagine lente: scraping senza protezioni, con le
+    richieste duplicate (hedging) e con hedging più scadenza. Per ogni
+    configurazione riporta la mediana e il massimo delle esecuzioni, i film
+    segnati come incompleti e le richieste in più inviate al server.
+    """
+    http_cache.configure(None)
+    hedge_after, hedge_max, timeout = scraper.HEDGE_AFTER, scraper.HEDGE_MAX_PER_HOST, scraper.REQUEST_TIMEOUT
+    scraper.HEDGE_MAX_PER_HOST = args.hedge_max
+    scraper.REQUEST_TIMEOUT = max(timeout, args.straggler_latency + 1)
+    configs = [
+        ("nessuna protezione", 0.0, None),
+        (f"hedging dopo {args.hedge_after:g} s", args.hedge_after, None),
+        (f"hedging + scadenza {args.deadline:g} s", args.hedge_after, args.deadline),
+    ]
+    print(f"{args.cinemas} cinema x {args.films} film, latenza {args.latency * 1000:.0f} ms, "
+          f"{args.stragglers:.0%} richieste lente di {args.straggler_latency:g} s, "
+          f"{args.hedge_max} duplicati per host, {args.runs} esecuzioni")
+    try:
+        for name, hedge, budget in configs:
+            scraper.HEDGE_AFTER = hedge
+            with FakeComingSoon(args.cinemas, args.films, args.days, args.latency,
+                                stragglers=args.stragglers, straggler_latency=args.straggler_latency,
+                                seed=args.seed) as fake:
+                urls = fake.cinema_urls()
+                hedges_before = {winner: metrics.HEDGED_REQUESTS.labels(winner).value
+                                 for winner in ("primary", "hedge")}
+                times, incomplete = [], 0
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    with _quiet_processes():
+                        data = scraper.scrape_all_cinemas(urls, deadline=scraper.deadline_after(budget))
+                    times.append(time.perf_counter() - start)
+                    incomplete += sum(
+                        1 for cinema in data for film in cinema["film"] if film.get(scraper.INCOMPLETE)
+                    )
+                baseline = args.runs * args.cinemas * (args.films + 1)
+                won = {winner: metrics.HEDGED_REQUESTS.labels(winner).value - before
+                       for winner, before in hedges_before.items()}
+            print(f"{name:<26} mediana {statistics.median(times):6.2f} s  max {max(times):6.2f} s  "
+                  f"incompleti {incomplete:>4}  richieste {fake.requests - baseline:<+4d} "
+                  f"(hedge vinti {won['hedge']:.0f}/{won['hedge'] + won['primary']:.0f})")
+    finally:
+        scraper.HEDGE_AFTER, scraper.HEDGE_MAX_PER_HOST, scraper.REQUEST_TIMEOUT = hedge_after, hedge_max, timeout
+    return 0
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark dello scraper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fanout = subparsers.add_parser("fanout", help="Fan-out parallelo vs seriale su server locale")
+    fanout.add_argument("--cinemas", type=int, default=3)
+    fanout.add_argument("--films", type=int, default=15)
+    fanout.add_argument("--days", type=int, default=7)
+    fanout.add_argument("--latency", type=float, default=0.2, help="Latenza simulata per richiesta (s)")
+    fanout.add_argument("--workers", type=int, default=scraper.MAX_WORKERS)
+    fanout.add_argument("--per-host", type=int, default=scraper.PER_HOST_CONCURRENCY)
+    fanout.set_defaults(func=bench_fanout)
+
+    session = subparsers.add_parser("session", help="Connessioni nuove vs Session keep-alive")
+    session.add_argument("--requests", type=int, default=30)
+    session.add_argument("--days", type=int, default=7)
+    session.add_argument("--latency", type=float, default=0.0)
+    session.add_argument("--connect-latency", type=float, default=0.05,
+                         help="Costo simulato dell'handshake per connessione (s)")
+    session.set_defaults(func=bench_session)
+
+    cache = subparsers.add_parser("cache", help="Cache HTTP su disco: esecuzione fredda vs calda")
+    cache.add_argument("--cinemas", type=int, default=3)
+    cache.add_argument("--films", type=int, default=15)
+    cache.add_argument("--days", type=int, default=30)
+    cache.add_argument("--latency", type=float, default=0.0)
+    cache.set_defaults(func=bench_cache)
+
+    incremental = subparsers.add_parser("incremental", help="Impronte delle pagine: esecuzione invariata vs fredda (tempo CPU)")
+    incremental.add_argument("--cinemas", type=int, default=3)
+    incremental.add_argument("--films", type=int, default=15)
+    incremental.add_argument("--days", type=int, default=30)
+    incremental.add_argument("--latency", type=float, default=0.0)
+    incremental.set_defaults(func=bench_incremental)
+
+    replay = subparsers.add_parser("replay", help="Registrazione e replay del trasporto HTTP")
+    replay.add_argument("--cinemas", type=int, default=3)
+    replay.add_argument("--films", type=int, default=15)
+    replay.add_argument("--days", type=int, default=7)
+    replay.add_argument("--latency", type=float, default=0.1, help="Latenza simulata per richiesta (s)")
+    replay.set_defaults(func=bench_replay)
+
+    stream = subparsers.add_parser("stream", help="Streaming dei risultati: tempo al primo cinema/film")
+    stream.add_argument("--cinemas", type=int, default=3)
+    stream.add_argument("--films", type=int, default=15)
+    stream.add_argument("--days", type=int, default=7)
+    stream.add_argument("--latency", type=float, default=0.2, help="Latenza simulata per richiesta (s)")
+    stream.set_defaults(func=bench_stream)
+
+    trakt = subparsers.add_parser("trakt", help="Arricchimento Trakt contro un server locale con 429")
+    trakt.add_argument("--titles", type=int, default=30)
+    trakt.add_argument("--latency", type=float, default=0.1)
+    trakt.add_argument("--rate-limit-every", type=int, default=10, help="Un 429 ogni N richieste (0 = mai)")
+    trakt.add_argument("--retry-after", type=float, default=0.5)
+    trakt.add_argument("--rate", type=float, default=50.0, help="Token al secondo del limiter")
+    trakt.add_argument("--burst", type=int, default=10)
+    trakt.add_argument("--workers", type=int, default=trakt_enrich.TRAKT_MAX_WORKERS)
+    trakt.add_argument("--deadline", type=float, default=0.5, help="Budget della terza esecuzione (s)")
+    trakt.set_defaults(func=bench_trakt)
+
+    parse = subparsers.add_parser("parse", help="Strategie di parsing sulle fixture registrate")
+    parse.add_argument("--repeat", type=int, default=5)
+    parse.set_defaults(func=bench_parse)
+
+    extract = subparsers.add_parser("extract", help="Estrattori a passata singola vs precedenti (tempo CPU)")
+    extract.add_argument("--repeat", type=int, default=20)
+    extract.add_argument("--parser", choices=parsing.STRATEGIES, default="full",
+                         help="Strategia di parsing delle fixture")
+    extract.set_defaults(func=bench_extract)
+
+    micro = subparsers.add_parser("micro", help="Micro-benchmark offline di estrattori e formattazione con baseline")
+    micro.add_argument("--repeat", type=int, default=5)
+    micro.add_argument("--films", type=int, default=200, help="Film per cinema nelle pagine sintetiche")
+    micro.add_argument("--days", type=int, default=28, help="Giorni di programmazione nelle pagine sintetiche")
+    micro.add_argument("--baseline", default=BASELINE_PATH, help="File della baseline")
+    micro.add_argument("--save-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    micro.add_argument("--tolerance", type=float, default=0.25,
+                       help="Peggioramento relativo oltre il quale un caso è una regressione")
+    micro.set_defaults(func=bench_micro)
+
+    models_parser = subparsers.add_parser("models", help="Memoria e formattazione: dizionari vs record con __slots__")
+    models_parser.add_argument("--cinemas", type=int, default=40)
+    models_parser.add_argument("--films", type=int, default=30)
+    models_parser.add_argument("--days", type=int, default=28)
+    models_parser.add_argument("--repeat", type=int, default=5)
+    models_parser.set_defaults(func=bench_models)
+
+    responses_parser = subparsers.add_parser("responses", help="Serializzazione, ETag/304 e compressione delle risposte dell'API")
+    responses_parser.add_argument("--cinemas", type=int, default=10)
+    responses_parser.add_argument("--films", type=int, default=30)
+    responses_parser.add_argument("--days", type=int, default=28)
+    responses_parser.add_argument("--repeat", type=int, default=5)
+    responses_parser.set_defaults(func=bench_responses)
+
+    showtimes_parser = subparsers.add_parser("showtimes", help="Query delle proiezioni: indice vs scansione")
+    showtimes_parser.add_argument("--cinemas", type=int, default=40)
+    showtimes_parser.add_argument("--films", type=int, default=30)
+    showtimes_parser.add_argument("--days", type=int, default=28)
+    showtimes_parser.add_argument("--repeat", type=int, default=5)
+    showtimes_parser.set_defaults(func=bench_showtimes)
+
+    search = subparsers.add_parser("search", help="Ricerca approssimata dei titoli: trigrammi vs difflib")
+    search.add_argument("--titles", type=int, default=3000)
+    search.add_argument("--cinemas", type=int, default=40)
+    search.add_argument("--queries", type=int, default=100)
+    search.add_argument("--repeat", type=int, default=5)
+    search.set_defaults(func=bench_search)
+
+    telegram = subparsers.add_parser("telegram", help="Messaggio Telegram: renderer per snapshot e suddivisione")
+    telegram.add_argument("--cinemas", type=int, default=10)
+    telegram.add_argument("--films", type=int, default=30)
+    telegram.add_argument("--days", type=int, default=28)
+    telegram.add_argument("--repeat", type=int, default=5)
+    telegram.set_defaults(func=bench_telegram)
+
+    shards = subparsers.add_parser("shards", help="Registro regionale diviso in shard tra processi")
+    shards.add_argument("--cinemas", type=int, default=60)
+    shards.add_argument("--films", type=int, default=10)
+    shards.add_argument("--days", type=int, default=14)
+    shards.add_argument("--latency", type=float, default=0.05, help="Latenza simulata per richiesta (s)")
+    shards.add_argument("--workers", type=int, default=scraper.MAX_WORKERS, help="Thread per processo")
+    shards.add_argument("--per-host", type=int, default=scraper.PER_HOST_CONCURRENCY)
+    shards.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    shards.set_defaults(func=bench_shards)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Download e parsing in stadi separati con coda limitata")
+    pipeline_parser.add_argument("--cinemas", type=int, default=40)
+    pipeline_parser.add_argument("--films", type=int, default=10)
+    pipeline_parser.add_argument("--days", type=int, default=28)
+    pipeline_parser.add_argument("--latency", type=float, default=0.02, help="Latenza simulata per richiesta (s)")
+    pipeline_parser.add_argument("--workers", type=int, default=scraper.MAX_WORKERS, help="Thread di download")
+    pipeline_parser.add_argument("--per-host", type=int, default=8)
+    pipeline_parser.add_argument("--parsers", type=int, nargs="+", default=[0, 1, 2],
+                                 help="Processi di parsing da provare (0 = parsing in thread)")
+    pipeline_parser.add_argument("--queue", type=int, default=pipeline.PIPELINE_QUEUE_SIZE,
+                                 help="Pagine in attesa di parsing")
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Costo delle metriche di /metrics")
+    metrics_parser.add_argument("--cinemas", type=int, default=10)
+    metrics_parser.add_argument("--films", type=int, default=15)
+    metrics_parser.add_argument("--days", type=int, default=14)
+    metrics_parser.add_argument("--repeat", type=int, default=3, help="Scraping per misura")
+    metrics_parser.add_argument("--operations", type=int, default=200000, help="Osservazioni per il costo unitario")
+    metrics_parser.set_defaults(func=bench_metrics)
+
+    deadline = subparsers.add_parser("deadline", help="Pagine lente: hedging e scadenza dello scraping")
+    deadline.add_argument("--cinemas", type=int, default=3)
+    deadline.add_argument("--films", type=int, default=15)
+    deadline.add_argument("--days", type=int, default=7)
+    deadline.add_argument("--latency", type=float, default=0.05, help="Latenza simulata per richiesta (s)")
+    deadline.add_argument("--stragglers", type=float, default=0.05, help="Frazione di richieste lente")
+    deadline.add_argument("--straggler-latency", type=float, default=3.0, help="Latenza in più delle richieste lente (s)")
+    deadline.add_argument("--hedge-after", type=float, default=0.5, help="Secondi prima di duplicare una richiesta")
+    deadline.add_argument("--hedge-max", type=int, default=scraper.HEDGE_MAX_PER_HOST,
+                          help="Duplicati contemporanei massimi per host")
+    deadline.add_argument("--deadline", type=float, default=2.0, help="Scadenza dello scraping (s)")
+    deadline.add_argument("--runs", type=int, default=5)
+    deadline.add_argument("--seed", type=int, default=0)
+    deadline.set_defaults(func=bench_deadline)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Confronto tra due snapshot della programmazione.
+
+Il report elenca film, date e orari aggiunti o rimossi per ogni cinema,
+senza ripetizioni: le date di un film nuovo non compaiono anche tra le
+date aggiunte, né gli orari di una data nuova tra gli orari aggiunti.
+I film presenti in entrambi gli snapshot la cui sala o i cui orari di
+oggi sono cambiati compaiono tra i film "modificati", con il valore
+precedente e quello nuovo.
+
+L'ultimo snapshot di ogni esecuzione è salvato in LAST_SNAPSHOT_PATH,
+così anche esecuzioni in processi diversi (es. cron orario) vengono
+confrontate con la precedente. VersionHistory numera invece i risultati
+serviti dall'API e calcola le modifiche rispetto a una versione passata.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import AbstractSet, Any, Callable, Dict, List, Optional, Set, Tuple
+
+# File con i cinema dell'ultima esecuzione (vuoto o "0" per non salvarlo)
+LAST_SNAPSHOT_PATH = os.environ.get("SCRAPER_LAST_SNAPSHOT", ".cache/last_snapshot.json")
+
+# Campi di un film confrontati oltre alla programmazione (orari = orari di oggi della pagina del cinema)
+DETAIL_FIELDS = ("sala", "orari")
+
+_lock = threading.Lock()
+
+_Indexed = Tuple[Dict[str, Set[str]], Dict[str, Any]]
+
+
+def _index(cinemas: List[Dict[str, Any]]) -> Dict[Tuple[str, str], _Indexed]:
+    """(cinema, titolo) -> (data -> insieme degli orari, campi di DETAIL_FIELDS)."""
+    index: Dict[Tuple[str, str], _Indexed] = {}
+    for cinema in cinemas:
+        cinema_name = cinema.get("cinema", "")
+        for film in cinema.get("film", []):
+            title = film.get("titolo")
+            if not title:
+                continue
+            dates, details = index.setdefault((cinema_name, title), ({}, {}))
+            for prog in film.get("programmazione", []):
+                date = prog.get("data")
+                if date:
+                    dates.setdefault(date, set()).update(prog.get("orari", []))
+            for field in DETAIL_FIELDS:
+                if field in film:
+                    details[field] = film[field]
+    return index
+
+
+def diff_cinemas(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    """
+    Confronta due liste di cinema nel formato di scrape_all_cinemas.
+
+    Returns:
+        {"film": {"aggiunti": [...], "rimossi": [...], "modificati": [...]},
+        "date": {...}, "orari": {...}} con voci {"cinema", "titolo"[, "data"[, "orario"]]}
+        in ordine stabile; le voci dei film modificati sono
+        {"cinema", "titolo", "campo", "prima", "dopo"}, una per campo cambiato
+    """
+    before = _index(previous)
+    after = _index(current)
+    report = {
+        level: {"aggiunti": [], "rimossi": []}
+        for level in ("film", "date", "orari")
+    }
+    report["film"]["modificati"] = []
+
+    for key in sorted(before.keys() | after.keys()):
+        cinema_name, title = key
+        film = {"cinema": cinema_name, "titolo": title}
+        if key not in before:
+            report["film"]["aggiunti"].append(film)
+            continue
+        if key not in after:
+            report["film"]["rimossi"].append(film)
+            continue
+
+        (old_dates, old_details), (new_dates, new_details) = before[key], after[key]
+        for field in DETAIL_FIELDS:
+            old_value, new_value = old_details.get(field), new_details.get(field)
+            if old_value != new_value:
+                report["film"]["modificati"].append(dict(film, campo=field, prima=old_value, dopo=new_value))
+        for date in sorted(old_dates.keys() | new_dates.keys()):
+            if date not in old_dates:
+                report["date"]["aggiunti"].append(dict(film, data=date))
+            elif date not in new_dates:
+                report["date"]["rimossi"].append(dict(film, data=date))
+            else:
+                for time in sorted(new_dates[date] - old_dates[date]):
+                    report["orari"]["aggiunti"].append(dict(film, data=date, orario=time))
+                for time in sorted(old_dates[date] - new_dates[date]):
+                    report["orari"]["rimossi"].append(dict(film, data=date, orario=time))
+
+    return report
+
+
+def has_changes(report: Dict[str, Dict[str, List[Dict[str, str]]]]) -> bool:
+    """True se il report contiene almeno una voce."""
+    return any(entries for level in report.values() for entries in level.values())
+
+
+def filter_report(report: Dict[str, Dict[str, List[Dict[str, str]]]],
+                  cinemas: AbstractSet[str]) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    """Solo le voci del report che riguardano i cinema indicati (es. quelli di una città)."""
+    return {
+        level: {kind: [entry for entry in entries if entry["cinema"] in cinemas] for kind, entries in kinds.items()}
+        for level, kinds in report.items()
+    }
+
+
+def summarize(report: Dict[str, Dict[str, List[Dict[str, str]]]]) -> Dict[str, int]:
+    """Numero di voci per livello e verso, es. {"film_aggiunti": 1, ...}."""
+    return {
+        f"{level}_{kind}": len(entries)
+        for level, kinds in report.items()
+        for kind, entries in kinds.items()
+    }
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, list):
+        return ", ".join(value) or "-"
+    return "-" if value is None else str(value)
+
+
+def format_changes(report: Dict[str, Dict[str, List[Dict[str, str]]]]) -> str:
+    """Descrizione leggibile del report, una riga per voce."""
+    if not has_changes(report):
+        return "Nessuna modifica rispetto all'esecuzione precedente"
+
+    lines = []
+    signs = {"aggiunti": "+", "rimossi": "-", "modificati": "~"}
+    for level, kinds in report.items():
+        for kind, entries in kinds.items():
+            for entry in entries:
+                if kind == "modificati":
+                    detail = f"{entry['campo']}: {_format_value(entry['prima'])} -> {_format_value(entry['dopo'])}"
+                else:
+                    detail = " ".join(entry[field] for field in ("data", "orario") if field in entry)
+                suffix = f" {detail}" if detail else ""
+                lines.append(f"{signs[kind]} [{level}] {entry['titolo']} ({entry['cinema']}){suffix}")
+    return "\n".join(lines)
+
+
+def record_run(cinemas: List[Dict[str, Any]],
+               path: Optional[str] = None) -> Optional[Dict[str, Dict[str, List[Dict[str, str]]]]]:
+    """
+    Confronta i cinema con quelli dell'esecuzione precedente e li salva
+    come nuovo riferimento.
+
+    Returns:
+        Il report di diff_cinemas, None se non c'è un'esecuzione precedente
+        (o se il salvataggio è disabilitato)
+    """
+    path = LAST_SNAPSHOT_PATH if path is None else path
+    if path in ("", "0"):
+        return None
+
+    with _lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cinemas, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    if previous is None:
+        return None
+    return diff_cinemas(previous, cinemas)
+
+
+# Versioni conservate in memoria per /api/films/changes
+SNAPSHOT_HISTORY = int(os.environ.get("SNAPSHOT_HISTORY", "48"))
+
+
+class _Version:
+    __slots__ = ("number", "timestamp", "recorded_at", "cinemas", "report")
+
+    def __init__(self, number: int, timestamp: str, cinemas: List[Dict[str, Any]],
+                 report: Optional[Dict[str, Dict[str, List[Dict[str, str]]]]] = None):
+        self.number = number
+        self.timestamp = timestamp
+        self.recorded_at = datetime.fromisoformat(timestamp)
+        self.cinemas = cinemas
+        self.report = report
+
+
+class VersionHistory:
+    """
+    Ultime versioni della programmazione servita dall'API.
+
+    Una versione identifica il contenuto (film, date, orari, sala e orari di
+    oggi): uno scraping
+    identico al precedente mantiene la versione corrente, uno diverso ne
+    crea una nuova. I numeri crescono anche tra un riavvio e l'altro
+    (partono dal timestamp Unix), quindi una versione di un processo
+    precedente non viene mai confusa con una attuale.
+    """
+
+    def __init__(self, size: int = SNAPSHOT_HISTORY):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._versions: List[_Version] = []
+        self._deltas: Dict[int, Dict[str, Dict[str, List[Dict[str, str]]]]] = {}
+
+    def record(self, cinemas: List[Dict[str, Any]], timestamp: str,
+               report: Optional[Callable[[], Optional[Dict[str, Dict[str, List[Dict[str, str]]]]]]] = None) -> int:
+        """
+        Registra il risultato di uno scraping e ne restituisce la versione.
+
+        report (es. record_run) viene chiamato solo quando il risultato crea
+        una nuova versione, e il suo valore resta associato a quella (vedi
+        report_of): gli snapshot che ricevono la stessa programmazione
+        condividono un solo report.
+        """
+        with self._lock:
+            latest = self._versions[-1] if self._versions else None
+            if latest is not None and not has_changes(diff_cinemas(latest.cinemas, cinemas)):
+                return latest.number
+
+            number = int(time.time())
+            if latest is not None:
+                number = max(number, latest.number + 1)
+            self._versions.append(_Version(number, timestamp, cinemas, report() if report is not None else None))
+            del self._versions[:-self.size]
+            self._deltas.clear()
+            return number
+
+    def report_of(self, number: int) -> Optional[Dict[str, Dict[str, List[Dict[str, str]]]]]:
+        """Report registrato con la versione, None se assente o se la versione non è conservata."""
+        with self._lock:
+            return next((v.report for v in self._versions if v.number == number), None)
+
+    @property
+    def current(self) -> Optional[int]:
+        with self._lock:
+            return self._versions[-1].number if self._versions else None
+
+    def version_at(self, when: datetime) -> Optional[int]:
+        """Versione in vigore all'istante indicato, None se precede quelle conservate."""
+        with self._lock:
+            found = None
+            for version in self._versions:
+                if version.recorded_at > when:
+                    break
+                found = version.number
+            return found
+
+    def delta(self, since: int) -> Optional[Tuple[int, str, Dict[str, Dict[str, List[Dict[str, str]]]]]]:
+        """
+        Modifiche dalla versione since a quella corrente.
+
+        Returns:
+            Tupla (versione corrente, suo timestamp, report di diff_cinemas),
+            None se la versione since non è (più) conservata
+        """
+        with self._lock:
+            if not self._versions:
+                return None
+            latest = self._versions[-1]
+            report = self._deltas.get(since)
+            if report is None:
+                base = next((v for v in self._versions if v.number == since), None)
+                if base is None:
+                    return None
+                report = diff_cinemas(base.cinemas, latest.cinemas)
+                self._deltas[since] = report
+            return latest.number, latest.timestamp, report
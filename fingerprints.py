@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Impronte del contenuto delle pagine per lo scraping incrementale.
+
+L'impronta di una pagina è l'hash del suo HTML normalizzato: script,
+stili, commenti, attributi nonce e differenze di spaziatura vengono
+ignorati, perché cambiano a ogni richiesta (token, timestamp, banner)
+senza toccare i dati estratti. http_cache conserva per ogni URL
+l'ultima impronta e il risultato dell'estrazione, così una pagina
+invariata non viene più analizzata.
+"""
+
+import hashlib
+import re
+
+# Parti della pagina che non contengono dati sulla programmazione
+_VOLATILE_RE = re.compile(
+    r'<script\b.*?</script\s*>'
+    r'|<style\b.*?</style\s*>'
+    r'|<noscript\b.*?</noscript\s*>'
+    r'|<!--.*?-->',
+    re.I | re.S,
+)
+_NONCE_RE = re.compile(r'\s+nonce\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)', re.I)
+_BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_html(html: str) -> str:
+    """Rimuove da una pagina le parti che cambiano senza modificare i dati."""
+    html = _VOLATILE_RE.sub('', html)
+    html = _NONCE_RE.sub('', html)
+    html = _BETWEEN_TAGS_RE.sub('><', html)
+    return _WHITESPACE_RE.sub(' ', html).strip()
+
+
+def fingerprint(html: str) -> str:
+    """Hash dell'HTML normalizzato."""
+    return hashlib.sha256(normalize_html(html).encode("utf-8")).hexdigest()
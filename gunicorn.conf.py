@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Configurazione di Gunicorn (caricata automaticamente da `gunicorn app:app`).
+
+Un solo processo con più thread: la cache degli snapshot e il controllo di
+ammissione sono in memoria e condivisi tra le richieste. I thread sono più
+degli scraping ammessi (MAX_CONCURRENT_SCRAPES + MAX_QUEUE_DEPTH), così
+/health e gli endpoint statici hanno sempre un thread libero.
+"""
+
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "12"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
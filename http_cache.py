@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache su disco delle pagine scaricate con richieste condizionali.
+
+Per ogni URL vengono salvati il corpo della risposta e i validatori
+(ETag / Last-Modified). Alle richieste successive si inviano
+If-None-Match / If-Modified-Since e, in caso di 304, si riusa il corpo
+salvato. Se il server non fornisce validatori la pagina viene
+considerata valida per CACHE_TTL secondi.
+
+Per ogni URL è salvato anche l'ultimo risultato del parsing con
+l'impronta della pagina (vedi fingerprints): una pagina invariata non
+viene nemmeno ri-analizzata.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import fingerprints
+import http_client
+
+# Directory della cache (vuota o "0" per disabilitarla) e TTL senza validatori
+CACHE_DIR = os.environ.get("SCRAPER_CACHE_DIR", ".cache/http")
+CACHE_TTL = int(os.environ.get("SCRAPER_CACHE_TTL", "3600"))
+
+
+class CachedPage:
+    """Corpo di una pagina con il suo hash e l'esito della cache."""
+
+    __slots__ = ("url", "text", "content_hash", "status")
+
+    def __init__(self, url: str, text: str, content_hash: str, status: str):
+        self.url = url
+        self.text = text
+        self.content_hash = content_hash
+        self.status = status  # "hit", "revalidated" o "miss"
+
+
+def _sha256(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: str, data: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HttpCache:
+    """Cache HTTP persistente con richieste condizionali e cache dei risultati di parsing."""
+
+    def __init__(self, directory: Optional[str], ttl: int = CACHE_TTL):
+        self.directory = directory or None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "parse_hits": 0,
+            "parse_misses": 0,
+            "fingerprint_hits": 0,
+        }
+        if self.directory:
+            os.makedirs(os.path.join(self.directory, "fingerprints"), exist_ok=True)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _entry_paths(self, url: str):
+        key = _sha256(url)
+        return (
+            os.path.join(self.directory, f"{key}.json"),
+            os.path.join(self.directory, f"{key}.body"),
+        )
+
+    def _fingerprint_path(self, url: str) -> str:
+        return os.path.join(self.directory, "fingerprints", f"{_sha256(url)}.json")
+
+    def _load(self, url: str) -> Optional[Dict[str, Any]]:
+        meta_path, body_path = self._entry_paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "r", encoding="utf-8") as f:
+                meta["text"] = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta
+
+    def _store(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str]) -> str:
+        content_hash = _sha256(text)
+        meta_path, body_path = self._entry_paths(url)
+        _write_atomic(body_path, text)
+        _write_atomic(meta_path, json.dumps({
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "content_hash": content_hash,
+        }))
+        return content_hash
+
+    def _touch(self, url: str, entry: Dict[str, Any]) -> None:
+        meta_path, _ = self._entry_paths(url)
+        meta = {k: v for k, v in entry.items() if k != "text"}
+        meta["stored_at"] = time.time()
+        _write_atomic(meta_path, json.dumps(meta))
+
+    def fetch(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> CachedPage:
+        """
+        Scarica una pagina usando la cache.
+
+        Raises:
+            requests.RequestException in caso di errore di rete o HTTP
+        """
+        if not self.directory:
+            response = http_client.fetch(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            self._count("misses")
+            return CachedPage(url, response.text, _sha256(response.text), "miss")
+
+        entry = self._load(url)
+        request_headers = dict(headers or {})
+
+        if entry is not None:
+            has_validators = entry.get("etag") or entry.get("last_modified")
+            if not has_validators and time.time() - entry.get("stored_at", 0) < self.ttl:
+                self._count("hits")
+                return CachedPage(url, entry["text"], entry["content_hash"], "hit")
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = http_client.fetch(url, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and entry is not None:
+            self._touch(url, entry)
+            self._count("revalidated")
+            return CachedPage(url, entry["text"], entry["content_hash"], "revalidated")
+
+        response.raise_for_status()
+        text = response.text
+        content_hash = self._store(
+            url, text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+        )
+        self._count("misses")
+        return CachedPage(url, text, content_hash, "miss")
+
+    def parsed(self, page: CachedPage, kind: str, parse: Callable[[str], Any]) -> Any:
+        """
+        Restituisce il risultato di parse(page.text), riusando quello salvato
+        per lo stesso URL se la pagina non è cambiata.
+
+        La pagina è invariata se il corpo è identico all'ultimo analizzato
+        oppure se lo è l'HTML normalizzato (fingerprints.fingerprint), cioè
+        se differiscono solo script, commenti o spaziatura.
+
+        Args:
+            page: Pagina restituita da fetch
+            kind: Tipo di parsing (un risultato di tipo diverso non viene riusato)
+            parse: Funzione che produce un risultato serializzabile in JSON
+        """
+        if not self.directory:
+            return parse(page.text)
+
+        found, result, page_fingerprint = self.lookup_parsed(page, kind)
+        if found:
+            return result
+        result = parse(page.text)
+        self.store_parsed(page, kind, result, page_fingerprint)
+        return result
+
+    def lookup_parsed(self, page: CachedPage, kind: str) -> Tuple[bool, Any, Optional[str]]:
+        """
+        Prima metà di parsed: cerca il risultato salvato senza analizzare la pagina.
+
+        Returns:
+            (trovato, risultato, impronta della pagina se già calcolata)
+        """
+        if not self.directory:
+            return False, None, None
+
+        path = self._fingerprint_path(page.url)
+        entry = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        page_fingerprint = None
+        if entry is not None and entry.get("url") == page.url and entry.get("kind") == kind:
+            if entry.get("content_hash") == page.content_hash:
+                self._count("parse_hits")
+                return True, entry["result"], None
+            page_fingerprint = fingerprints.fingerprint(page.text)
+            if entry.get("fingerprint") == page_fingerprint:
+                entry["content_hash"] = page.content_hash
+                _write_atomic(path, json.dumps(entry, ensure_ascii=False))
+                self._count("parse_hits")
+                self._count("fingerprint_hits")
+                return True, entry["result"], page_fingerprint
+        return False, None, page_fingerprint
+
+    def store_parsed(self, page: CachedPage, kind: str, result: Any,
+                     page_fingerprint: Optional[str] = None) -> None:
+        """Seconda metà di parsed: salva il risultato del parsing della pagina."""
+        if not self.directory:
+            return
+        if page_fingerprint is None:
+            page_fingerprint = fingerprints.fingerprint(page.text)
+        _write_atomic(self._fingerprint_path(page.url), json.dumps({
+            "url": page.url,
+            "kind": kind,
+            "content_hash": page.content_hash,
+            "fingerprint": page_fingerprint,
+            "result": result,
+        }, ensure_ascii=False))
+        self._count("parse_misses")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+_cache: Optional[HttpCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> HttpCache:
+    """Restituisce la cache condivisa configurata da SCRAPER_CACHE_DIR."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                directory = CACHE_DIR if CACHE_DIR not in ("", "0") else None
+                _cache = HttpCache(directory)
+    return _cache
+
+
+def configure(directory: Optional[str], ttl: int = CACHE_TTL) -> HttpCache:
+    """Sostituisce la cache condivisa (None disabilita la cache)."""
+    global _cache
+    with _cache_lock:
+        _cache = HttpCache(directory, ttl)
+    return _cache
+
+
+def get_stats() -> Dict[str, int]:
+    """Contatori hit/miss/revalidated e riuso dei risultati di parsing."""
+    return get_cache().stats()
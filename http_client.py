@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sessione HTTP condivisa usata da scraper e Trakt.
+
+- connessioni keep-alive riutilizzate tramite un pool per host;
+- compressione gzip/deflate (e brotli se il pacchetto ``brotli`` è installato);
+- retry con backoff esponenziale sugli errori transitori;
+- statistiche per host sui tempi di connessione e di trasferimento;
+- trasporto intercambiabile (rete, registrazione o replay, vedi transport).
+
+La Session è condivisa tra i thread: il pool di connessioni di urllib3 è
+thread-safe e le statistiche sono protette da un lock.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry, make_headers
+
+import metrics
+import transport
+
+# Numero di host tenuti nel pool e connessioni keep-alive per host
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+# Retry sugli errori transitori (connessione, 5xx) con backoff esponenziale;
+# i 429 vengono restituiti al chiamante
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.5"))
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# "gzip,deflate" più "br" quando brotli è disponibile per la decodifica
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+_local = threading.local()
+
+
+class _TimedConnectionMixin:
+    """Misura il tempo speso ad aprire nuove connessioni (TCP + TLS)."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _local.connect_time = getattr(_local, "connect_time", 0.0) + time.perf_counter() - start
+            _local.new_connections = getattr(_local, "new_connections", 0) + 1
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TransientRetry(Retry):
+    """Retry che non ripete i 429: il rate limiting è gestito dal chiamante (es. Trakt)."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter che usa connessioni strumentate per le statistiche."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class HttpStats:
+    """Statistiche cumulative per host (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, float]] = {}
+
+    def _host(self, host: str) -> Dict[str, float]:
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = {
+                "requests": 0,
+                "errors": 0,
+                "new_connections": 0,
+                "connect_time": 0.0,
+                "wait_time": 0.0,
+                "transfer_time": 0.0,
+                "bytes": 0,
+                "wire_bytes": 0,
+            }
+            self._hosts[host] = entry
+        return entry
+
+    def record(self, host: str, new_connections: int, connect_time: float,
+               wait_time: float, transfer_time: float, size: int, wire_size: int) -> None:
+        with self._lock:
+            entry = self._host(host)
+            entry["requests"] += 1
+            entry["new_connections"] += new_connections
+            entry["connect_time"] += connect_time
+            entry["wait_time"] += wait_time
+            entry["transfer_time"] += transfer_time
+            entry["bytes"] += size
+            entry["wire_bytes"] += wire_size
+
+    def record_error(self, host: str) -> None:
+        with self._lock:
+            self._host(host)["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Restituisce una copia delle statistiche con le medie per richiesta."""
+        with self._lock:
+            result = {}
+            for host, entry in self._hosts.items():
+                count = entry["requests"] or 1
+                result[host] = {
+                    "requests": entry["requests"],
+                    "errors": entry["errors"],
+                    "new_connections": entry["new_connections"],
+                    "bytes": entry["bytes"],
+                    "wire_bytes": entry["wire_bytes"],
+                    "connect_time_total": round(entry["connect_time"], 4),
+                    "wait_time_total": round(entry["wait_time"], 4),
+                    "transfer_time_total": round(entry["transfer_time"], 4),
+                    "avg_connect_ms": round(entry["connect_time"] / count * 1000, 2),
+                    "avg_wait_ms": round(entry["wait_time"] / count * 1000, 2),
+                    "avg_transfer_ms": round(entry["transfer_time"] / count * 1000, 2),
+                }
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hosts.clear()
+
+
+_stats = HttpStats()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# Trasporto della Session: modalità, archivio e latenza riprodotta in replay
+_transport = {
+    "mode": transport.TRANSPORT,
+    "archive": transport.ARCHIVE_DIR,
+    "latency": transport.REPLAY_LATENCY,
+}
+
+
+def _build_session() -> requests.Session:
+    retry = _TransientRetry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    mode = _transport["mode"]
+    if mode not in transport.MODES:
+        raise ValueError(f"Trasporto sconosciuto: {mode}")
+    if mode == transport.REPLAY:
+        adapter = transport.ReplayAdapter(_transport["archive"], _transport["latency"])
+    else:
+        adapter = _PooledAdapter(
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE,
+            max_retries=retry,
+        )
+        if mode == transport.RECORD:
+            adapter = transport.RecordingAdapter(adapter, _transport["archive"])
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def get_session() -> requests.Session:
+    """Restituisce la Session condivisa, creandola al primo utilizzo."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def set_transport(mode: str, archive: Optional[str] = None, latency: Optional[float] = None) -> None:
+    """
+    Cambia il trasporto della Session condivisa (live, record o replay).
+
+    Args:
+        mode: Una delle modalità di transport.MODES
+        archive: Directory dell'archivio (default: SCRAPER_TRANSPORT_ARCHIVE)
+        latency: Frazione della latenza registrata riprodotta in replay
+    """
+    global _session
+    if mode not in transport.MODES:
+        raise ValueError(f"Trasporto sconosciuto: {mode}")
+    with _session_lock:
+        _transport["mode"] = mode
+        if archive is not None:
+            _transport["archive"] = archive
+        if latency is not None:
+            _transport["latency"] = latency
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_transport() -> Dict[str, Any]:
+    """Modalità, archivio e latenza del trasporto corrente (argomenti di set_transport)."""
+    with _session_lock:
+        return dict(_transport)
+
+
+def fetch(url: str, params: Optional[Dict[str, Any]] = None,
+          headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> requests.Response:
+    """
+    Esegue una GET tramite la Session condivisa registrando i tempi.
+
+    Il tempo totale è diviso in: apertura di nuove connessioni (connect),
+    attesa degli header di risposta (wait) e download del corpo (transfer).
+    Vengono registrati sia i byte decompressi sia quelli trasferiti in rete.
+
+    Args:
+        url: URL da scaricare
+        params: Parametri della query string
+        headers: Header aggiuntivi
+        timeout: Timeout in secondi
+
+    Returns:
+        requests.Response con il corpo già scaricato
+
+    Raises:
+        requests.RequestException in caso di errore di rete
+    """
+    host = urlsplit(url).netloc
+    _local.connect_time = 0.0
+    _local.new_connections = 0
+
+    start = time.perf_counter()
+    try:
+        response = get_session().get(url, params=params, headers=headers, timeout=timeout, stream=True)
+        headers_received = time.perf_counter()
+        content = response.content
+    except requests.RequestException:
+        _stats.record_error(host)
+        metrics.FETCH_ERRORS.labels(host).inc()
+        metrics.FETCH_SECONDS.labels(host).observe(time.perf_counter() - start)
+        raise
+    finished = time.perf_counter()
+
+    connect_time = _local.connect_time
+    _stats.record(
+        host,
+        new_connections=_local.new_connections,
+        connect_time=connect_time,
+        wait_time=max(0.0, headers_received - start - connect_time),
+        transfer_time=finished - headers_received,
+        size=len(content),
+        wire_size=response.raw.tell() if response.raw is not None else len(content),
+    )
+    metrics.FETCH_SECONDS.labels(host).observe(finished - start)
+    metrics.FETCH_BYTES.labels(host).inc(len(content))
+    return response
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """Statistiche cumulative per host (richieste, connessioni nuove, tempi medi)."""
+    return _stats.snapshot()
+
+
+def reset_stats() -> None:
+    """Azzera le statistiche (utile nei benchmark)."""
+    _stats.reset()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contatori e istogrammi esposti su /metrics nel formato testuale di Prometheus.
+
+Ogni metrica ha un insieme fisso di etichette; labels(...) restituisce la
+serie per quei valori (creata alla prima occorrenza). Aggiornare una serie
+costa un lock e, per gli istogrammi, una ricerca binaria sui limiti dei
+bucket: abbastanza poco da lasciare la strumentazione attiva in
+produzione (METRICS_ENABLED=0 la disattiva del tutto).
+
+Le statistiche già raccolte altrove (cache HTTP, ammissione, risposte)
+vengono lette solo quando /metrics viene richiesto, con CallbackMetric.
+
+I processi di SCRAPER_PROCESSES e PIPELINE_PARSERS hanno contatori propri,
+che non vengono riportati nel processo del server.
+"""
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limiti dei bucket in secondi: da 1 ms (parsing di una pagina) a 30 s (scraping completo)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base comune: nome, descrizione, etichette e serie per valori delle etichette."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[LabelValues, object] = {}
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Serie per i valori delle etichette (nell'ordine di labelnames)."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: attese le etichette {self.labelnames}, ricevuti {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _items(self) -> List[Tuple[LabelValues, object]]:
+        with self._lock:
+            return sorted(self._series.items())
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterSeries:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Valore che può solo crescere (richieste, errori, byte)."""
+
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Incrementa la serie senza etichette."""
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(series.value)}"
+            for values, series in self._items()
+        ]
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # l'ultimo è +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager che osserva la durata del blocco."""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Timer:
+    __slots__ = ("series", "started")
+
+    def __init__(self, series: _HistogramSeries):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    """Distribuzione delle durate (o dimensioni) in bucket cumulativi, con somma e conteggio."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, series in self._items():
+            counts, total = series.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Metrica letta da una funzione al momento di /metrics, per le statistiche
+    già tenute da altri moduli.
+
+    func restituisce {valori delle etichette: valore}.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 func: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.func = func
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.func()
+        except Exception:
+            return []
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+            for values, value in sorted(samples.items())
+            if value is not None
+        ]
+
+
+_registry: List[_Metric] = []
+_registry_lock = threading.Lock()
+
+
+def register(metric: _Metric) -> _Metric:
+    with _registry_lock:
+        if any(existing.name == metric.name for existing in _registry):
+            raise ValueError(f"Metrica già registrata: {metric.name}")
+        _registry.append(metric)
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name: str, documentation: str, kind: str, labelnames: Sequence[str],
+             func: Callable[[], Dict[LabelValues, float]]) -> CallbackMetric:
+    return register(CallbackMetric(name, documentation, kind, labelnames, func))
+
+
+def timed(metric: Histogram, *values: str):
+    """Decoratore che osserva in metric (con le etichette values) la durata di ogni chiamata."""
+    series = metric.labels(*values)
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def render(metrics: Optional[Iterable[_Metric]] = None) -> str:
+    """Tutte le metriche registrate nel formato testuale di Prometheus."""
+    if metrics is None:
+        with _registry_lock:
+            metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metriche degli stadi condivise tra i moduli
+FETCH_SECONDS = histogram(
+    "scraper_fetch_duration_seconds", "Durata dei download delle pagine, per host", ("host",)
+)
+FETCH_BYTES = counter("scraper_fetch_bytes_total", "Byte scaricati (decompressi), per host", ("host",))
+FETCH_ERRORS = counter("scraper_fetch_errors_total", "Download falliti per errore di rete, per host", ("host",))
+PARSE_SECONDS = histogram(
+    "scraper_parse_duration_seconds", "Durata della costruzione dell'albero HTML, per tipo di pagina", ("page",)
+)
+EXTRACT_SECONDS = histogram(
+    "scraper_extract_duration_seconds", "Durata dell'estrazione dei dati dall'albero HTML, per tipo di pagina",
+    ("page",)
+)
+HEDGED_REQUESTS = counter(
+    "scraper_hedged_requests_total", "Download duplicati per lentezza, per tentativo che ha risposto per primo",
+    ("winner",)
+)
+INCOMPLETE_PAGES = counter(
+    "scraper_incomplete_pages_total", "Pagine non scaricate entro la scadenza dello scraping, per tipo", ("page",)
+)
+TRAKT_LOOKUP_SECONDS = histogram(
+    "trakt_lookup_duration_seconds", "Durata della risoluzione di un titolo su Trakt, per esito", ("result",)
+)
+TELEGRAM_RENDER_SECONDS = histogram(
+    "telegram_render_duration_seconds", "Durata della formattazione del messaggio Telegram, per passo", ("step",)
+)
+REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "Durata delle richieste all'API fino alla risposta, per route",
+    ("route", "method", "status")
+)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modello dati compatto per cinema, film e proiezioni.
+
+Cinema, Film e Screening sono record con __slots__ al posto dei dizionari
+annidati prodotti dallo scraper:
+
+- date e orari sono oggetti date/time condivisi tra i record: ogni data e
+  ogni lista di orari recente esiste una sola volta in memoria (le cache
+  sono LRU limitate, così il server non accumula le date e gli orari di
+  tutti gli snapshot passati);
+- nomi dei cinema, titoli, sale e giorni della settimana sono stringhe
+  internate;
+- from_dict/to_dict convertono da e verso lo schema JSON attuale senza
+  perdite: un orario o una data che non si possono ricostruire identici
+  dal valore tipizzato restano stringhe, i campi opzionali assenti (es.
+  "sala" o "orari") restano assenti e i campi aggiuntivi (tmdb, imdb,
+  trakt, dettagli, ...) vengono conservati in ordine.
+"""
+
+import functools
+import re
+import sys
+from datetime import date, time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+TimeValue = Union[time, str]
+DateValue = Union[date, str]
+
+_TIME_RE = re.compile(r'(\d{2})[.:](\d{2})')
+
+# Date e liste di orari già convertite, condivise tra i record: bastano per
+# qualche snapshot (alcune settimane di date, le liste di orari dei film in
+# programmazione); le meno usate di recente vengono scartate
+DATE_MEMO_SIZE = 1024
+TIMES_MEMO_SIZE = 8192
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+def _absent(data: Dict[str, Any], keys: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Campi opzionali che mancano in data (di solito nessuno), da non emettere in to_dict."""
+    return tuple(key for key in keys if key not in data)
+
+
+@functools.lru_cache(maxsize=DATE_MEMO_SIZE)
+def parse_date(text: str) -> DateValue:
+    """Data ISO come oggetto date condiviso (la stringa se non è una data ISO canonica)."""
+    try:
+        parsed = date.fromisoformat(text)
+    except ValueError:
+        return sys.intern(text)
+    return parsed if parsed.isoformat() == text else sys.intern(text)
+
+
+def parse_time(text: str, sep: str) -> TimeValue:
+    """
+    Orario "HH<sep>MM" come oggetto time.
+
+    Gli orari che non si ricostruiscono identici (es. "9.30" o "19:10 VO")
+    restano stringhe.
+    """
+    match = _TIME_RE.fullmatch(text)
+    if match and text[2] == sep:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour < 24 and minute < 60:
+            return time(hour, minute)
+    return sys.intern(text)
+
+
+@functools.lru_cache(maxsize=TIMES_MEMO_SIZE)
+def _parse_times(texts: Tuple[str, ...], sep: str) -> Tuple[TimeValue, ...]:
+    return tuple(parse_time(text, sep) for text in texts)
+
+
+def parse_times(texts: Iterable[str], sep: str) -> Tuple[TimeValue, ...]:
+    """Lista di orari come tupla condivisa di oggetti time."""
+    return _parse_times(tuple(texts), sep)
+
+
+def format_time(value: TimeValue, sep: str) -> str:
+    if isinstance(value, time):
+        return f"{value.hour:02d}{sep}{value.minute:02d}"
+    return value
+
+
+@functools.lru_cache(maxsize=TIMES_MEMO_SIZE)
+def format_times(values: Tuple[TimeValue, ...], sep: str) -> Tuple[str, ...]:
+    """Orari di una tupla nel formato "HH<sep>MM" (calcolati una volta per tupla)."""
+    return tuple(format_time(value, sep) for value in values)
+
+
+def format_date(value: DateValue) -> str:
+    return value.isoformat() if isinstance(value, date) else value
+
+
+class Screening:
+    """Orari di un film in una data ("programmazione" nel JSON)."""
+
+    __slots__ = ("date", "weekday", "times", "absent")
+
+    # Separatore degli orari nelle pagine ticket
+    SEP = ":"
+    OPTIONAL = ("giorno", "orari")
+
+    def __init__(self, date: DateValue, weekday: Optional[str], times: Tuple[TimeValue, ...],
+                 absent: Tuple[str, ...] = ()):
+        self.date = date
+        self.weekday = weekday
+        self.times = times
+        self.absent = absent  # Campi di OPTIONAL che mancavano nel JSON
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Screening":
+        return cls(
+            parse_date(data["data"]),
+            _intern(data.get("giorno")),
+            parse_times(data.get("orari", []), cls.SEP),
+            _absent(data, cls.OPTIONAL),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "data": format_date(self.date),
+            "giorno": self.weekday,
+            "orari": list(format_times(self.times, self.SEP)),
+        }
+        for key in self.absent:
+            del data[key]
+        return data
+
+
+class Film:
+    """Un film in un cinema: orari di oggi, sala e programmazione."""
+
+    __slots__ = ("title", "times", "room", "screenings", "extra", "absent")
+
+    # Separatore degli orari nella pagina del cinema
+    SEP = "."
+    OPTIONAL = ("orari", "sala", "programmazione")
+
+    def __init__(self, title: str, times: Tuple[TimeValue, ...], room: Optional[str],
+                 screenings: Tuple[Screening, ...], extra: Optional[Dict[str, Any]] = None,
+                 absent: Tuple[str, ...] = ()):
+        self.title = title
+        self.times = times
+        self.room = room
+        self.screenings = screenings
+        self.extra = extra  # Campi aggiuntivi del JSON (tmdb, imdb, trakt, ...)
+        self.absent = absent  # Campi di OPTIONAL che mancavano nel JSON
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Film":
+        extra = {
+            key: value for key, value in data.items()
+            if key not in ("titolo", "orari", "sala", "programmazione")
+        }
+        return cls(
+            sys.intern(data["titolo"]),
+            parse_times(data.get("orari", []), cls.SEP),
+            _intern(data.get("sala")),
+            tuple(Screening.from_dict(prog) for prog in data.get("programmazione", [])),
+            extra or None,
+            _absent(data, cls.OPTIONAL),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "titolo": self.title,
+            "orari": list(format_times(self.times, self.SEP)),
+            "sala": self.room,
+            "programmazione": [screening.to_dict() for screening in self.screenings],
+        }
+        for key in self.absent:
+            del data[key]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Cinema:
+    """Un cinema con i suoi film."""
+
+    __slots__ = ("name", "url", "films", "extra", "absent")
+
+    OPTIONAL = ("cinema", "url", "film")
+
+    def __init__(self, name: str, url: Optional[str], films: Tuple[Film, ...],
+                 extra: Optional[Dict[str, Any]] = None, absent: Tuple[str, ...] = ()):
+        self.name = name
+        self.url = url
+        self.films = films
+        self.extra = extra  # Campi aggiuntivi del JSON (es. incompleto)
+        self.absent = absent  # Campi di OPTIONAL che mancavano nel JSON
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Cinema":
+        extra = {key: value for key, value in data.items() if key not in cls.OPTIONAL}
+        return cls(
+            sys.intern(data.get("cinema", "")),
+            _intern(data.get("url")),
+            tuple(Film.from_dict(film) for film in data.get("film", [])),
+            extra or None,
+            _absent(data, cls.OPTIONAL),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "cinema": self.name,
+            "url": self.url,
+            "film": [film.to_dict() for film in self.films],
+        }
+        for key in self.absent:
+            del data[key]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def cinemas_from_json(cinemas: Iterable[Union[Dict[str, Any], Cinema]]) -> List[Cinema]:
+    """Converte una lista di cinema nel formato JSON (i Cinema restano invariati)."""
+    return [cinema if isinstance(cinema, Cinema) else Cinema.from_dict(cinema) for cinema in cinemas]
+
+
+def cinemas_to_json(cinemas: Iterable[Cinema]) -> List[Dict[str, Any]]:
+    """Lista di cinema nello schema JSON dello scraper."""
+    return [cinema.to_dict() for cinema in cinemas]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Strategie di parsing HTML per le pagine di comingsoon.it.
+
+- "full": albero completo con html.parser (comportamento originale);
+- "lxml": albero completo con lxml;
+- "strained": solo i sottoalberi usati dagli estrattori (SoupStrainer),
+  con lxml se installato, altrimenti html.parser.
+
+La strategia predefinita ("auto") usa "strained" per i tipi di pagina
+noti e "full" per le altre pagine, che restano analizzate come prima.
+"""
+
+import os
+import re
+import time
+from typing import Dict, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+import metrics
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# Backend più veloce disponibile
+BACKEND = "lxml" if HAS_LXML else "html.parser"
+
+# Strategia di parsing: auto, full, lxml o strained
+PARSER_STRATEGY = os.environ.get("SCRAPER_PARSER", "auto")
+
+STRATEGIES = ("full", "lxml", "strained")
+
+# Tipi di pagina e sottoalberi di cui hanno bisogno i rispettivi estrattori
+LISTING = "listing"
+TICKET = "ticket"
+
+LISTING_SECTION_RE = re.compile(r'header-scheda', re.I)
+TICKET_DAY_RE = re.compile(r'media.*mbm', re.I)
+
+_STRAINERS: Dict[str, SoupStrainer] = {
+    LISTING: SoupStrainer('div', class_=LISTING_SECTION_RE),
+    TICKET: SoupStrainer('div', class_=TICKET_DAY_RE),
+}
+
+
+def resolve_strategy(page_type: Optional[str] = None, strategy: Optional[str] = None) -> str:
+    """Restituisce la strategia effettiva per un tipo di pagina."""
+    strategy = strategy or PARSER_STRATEGY
+    if strategy == "auto":
+        return "strained" if page_type in _STRAINERS else "full"
+    if strategy == "lxml" and not HAS_LXML:
+        return "full"
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Strategia di parsing sconosciuta: {strategy}")
+    return strategy
+
+
+def make_soup(html: str, page_type: Optional[str] = None, strategy: Optional[str] = None) -> BeautifulSoup:
+    """
+    Costruisce l'albero BeautifulSoup di una pagina.
+
+    Args:
+        html: Testo della pagina
+        page_type: LISTING, TICKET o None (pagina generica)
+        strategy: Strategia da usare (default: PARSER_STRATEGY)
+
+    Returns:
+        BeautifulSoup object (parziale con la strategia "strained")
+    """
+    strategy = resolve_strategy(page_type, strategy)
+    started = time.perf_counter()
+    if strategy == "full":
+        soup = BeautifulSoup(html, 'html.parser')
+    elif strategy == "lxml":
+        soup = BeautifulSoup(html, 'lxml')
+    else:
+        soup = BeautifulSoup(html, BACKEND, parse_only=_STRAINERS.get(page_type))
+    metrics.PARSE_SECONDS.labels(page_type or "page").observe(time.perf_counter() - started)
+    return soup
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scraping a stadi: download, parsing e aggregazione separati.
+
+- fetch: PIPELINE_FETCHERS thread scaricano le pagine (con il limite per
+  host dello scraper) e mettono l'HTML in una coda limitata a
+  PIPELINE_QUEUE_SIZE pagine. Quando la coda è piena i fetcher si fermano
+  finché il parsing non la svuota: le pagine scaricate e non ancora
+  analizzate in memoria restano poche, qualunque sia il numero di cinema.
+- parse: un pool di PIPELINE_PARSERS processi analizza le pagine con
+  BeautifulSoup, fuori dal GIL del processo che scarica (con 0 il parsing
+  avviene in un thread del processo corrente). I processi vengono avviati
+  alla prima esecuzione e riusati dalle successive.
+- aggregate: il thread chiamante riceve i record, mette in coda le pagine
+  ticket di ogni film appena è analizzata la pagina del suo cinema e
+  ricompone la lista dei cinema nell'ordine richiesto.
+
+Le pagine invariate (cache HTTP e impronte di http_cache) passano dal
+fetch all'aggregazione senza essere analizzate di nuovo.
+
+Con una scadenza l'aggregazione smette di attendere quando passa: le
+pagine mancanti lasciano i film (o i cinema) con scraper.INCOMPLETE, come
+in scraper.scrape_all_cinemas.
+
+Ogni esecuzione registra per stadio il tempo di lavoro, le attese (coda
+vuota o coda piena) e l'utilizzo dei worker: vedi last_stats().
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import fingerprints
+import http_cache
+import metrics
+import parsing
+import profiling
+import scraper
+
+# Thread che scaricano le pagine
+PIPELINE_FETCHERS = int(os.environ.get("PIPELINE_FETCHERS", str(scraper.MAX_WORKERS)))
+# Processi che analizzano le pagine (0 = parsing nel processo corrente)
+PIPELINE_PARSERS = int(os.environ.get("PIPELINE_PARSERS", str(os.cpu_count() or 1)))
+# Pagine scaricate in attesa di parsing oltre le quali i fetcher si fermano
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "16"))
+
+LISTING = "listing"
+TICKET = "ticket"
+
+_STOP = None
+
+
+def _parse_page(kind: str, text: str, with_fingerprint: bool) -> Tuple[Any, Optional[str], float]:
+    """
+    Analizza una pagina (eseguita nei processi del parsing).
+
+    Returns:
+        (risultato, impronta per la cache se richiesta, secondi di lavoro)
+    """
+    started = time.perf_counter()
+    if kind == LISTING:
+        result = scraper._parse_listing_html(text)
+    else:
+        result = scraper.extract_dates_and_times_from_ticket_page(parsing.make_soup(text, parsing.TICKET))
+    page_fingerprint = fingerprints.fingerprint(text) if with_fingerprint else None
+    return result, page_fingerprint, time.perf_counter() - started
+
+
+class _Stage:
+    """Contatori di uno stadio: elementi elaborati, lavoro e attese dei suoi worker."""
+
+    __slots__ = ("workers", "items", "busy", "starved", "blocked", "_lock")
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0      # secondi di lavoro
+        self.starved = 0.0   # secondi in attesa di input (coda vuota)
+        self.blocked = 0.0   # secondi in attesa di spazio nella coda successiva
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, busy: float = 0.0, starved: float = 0.0, blocked: float = 0.0) -> None:
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        capacity = self.workers * elapsed
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "starved_seconds": round(self.starved, 3),
+            "blocked_seconds": round(self.blocked, 3),
+            "utilization": round(self.busy / capacity, 3) if capacity else 0.0,
+        }
+
+
+class _PageQueue:
+    """Coda limitata delle pagine da analizzare, con profondità e byte massimi raggiunti."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._queue: "queue.Queue" = queue.Queue(self.size)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.max_depth = 0
+        self.max_bytes = 0
+
+    def put(self, item: Any, size: int = 0) -> None:
+        # Si conta prima dell'inserimento: il consumatore può prenderla subito
+        with self._lock:
+            self._bytes += size
+        self._queue.put((item, size))
+        with self._lock:
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+            self.max_bytes = max(self.max_bytes, self._bytes)
+
+    def get(self) -> Any:
+        item, size = self._queue.get()
+        with self._lock:
+            self._bytes -= size
+        return item
+
+    def stats(self) -> Dict[str, int]:
+        return {"capacity": self.size, "max_depth": self.max_depth, "max_bytes": self.max_bytes}
+
+
+class Pipeline:
+    """Una esecuzione dello scraping a stadi (vedi il docstring del modulo)."""
+
+    def __init__(self, fetchers: Optional[int] = None, parsers: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        self.fetchers = max(1, fetchers or PIPELINE_FETCHERS)
+        self.parsers = PIPELINE_PARSERS if parsers is None else max(0, parsers)
+        # Con il pool, un thread in più per processo tiene il processo occupato mentre l'altro attende la risposta
+        self.feeders = 2 * self.parsers if self.parsers else 1
+        self.queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self._stages = {
+            "fetch": _Stage(self.fetchers),
+            "parse": _Stage(max(1, self.parsers)),
+            "aggregate": _Stage(1),
+        }
+        self._elapsed = 0.0
+        self._pages: Optional[_PageQueue] = None
+        self._deadline: Optional[float] = None
+
+    def _fetch_worker(self, todo: "queue.Queue", pages: _PageQueue, results: "queue.Queue",
+                      stopped: threading.Event) -> None:
+        stage = self._stages["fetch"]
+        cache = http_cache.get_cache()
+        while True:
+            waited = time.perf_counter()
+            item = todo.get()
+            started = time.perf_counter()
+            stage.add(starved=started - waited)
+            if item is _STOP:
+                return
+            kind, url, key = item
+            if stopped.is_set():
+                continue
+            try:
+                page = scraper._download(url, self._deadline)
+                if page is None:
+                    stage.add(items=1, busy=time.perf_counter() - started)
+                    results.put((kind, key, []))
+                    continue
+                cache_kind = self._cache_kind(kind)
+                found, result, page_fingerprint = cache.lookup_parsed(page, cache_kind)
+            except Exception as exc:
+                stage.add(items=1, busy=time.perf_counter() - started)
+                results.put((kind, key, exc))
+                continue
+            finished = time.perf_counter()
+            stage.add(items=1, busy=finished - started)
+            if found:
+                results.put((kind, key, result))
+            else:
+                pages.put((kind, key, page, page_fingerprint), len(page.text))
+                stage.add(blocked=time.perf_counter() - finished)
+
+    def _parse_worker(self, pages: _PageQueue, results: "queue.Queue", pool: Optional[ProcessPoolExecutor],
+                      stopped: threading.Event) -> None:
+        stage = self._stages["parse"]
+        cache = http_cache.get_cache()
+        while True:
+            waited = time.perf_counter()
+            item = pages.get()
+            stage.add(starved=time.perf_counter() - waited)
+            if item is _STOP:
+                return
+            kind, key, page, page_fingerprint = item
+            if stopped.is_set():
+                continue
+            try:
+                with_fingerprint = cache.directory is not None and page_fingerprint is None
+                if pool is not None:
+                    result, computed, seconds = pool.submit(_parse_page, kind, page.text, with_fingerprint).result()
+                else:
+                    result, computed, seconds = _parse_page(kind, page.text, with_fingerprint)
+                stage.add(items=1, busy=seconds)
+                cache.store_parsed(page, self._cache_kind(kind), result, page_fingerprint or computed)
+            except BrokenProcessPool as exc:
+                scraper.discard_process_pool("parse", pool)
+                result = exc
+            except Exception as exc:
+                result = exc
+            results.put((kind, key, result))
+
+    @staticmethod
+    def _cache_kind(kind: str) -> str:
+        # L'anno delle date dei ticket dipende dal giorno corrente (vedi scraper._scrape_ticket_page)
+        return kind if kind == LISTING else f"ticket-{datetime.now().date().isoformat()}"
+
+    def run(self, cinema_urls: Dict[str, str], details: str = scraper.DETAILS_ALL,
+            deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Scarica e analizza i cinema, entro la scadenza deadline (time.monotonic()) se indicata.
+
+        Returns:
+            Lista di dizionari con i dati dei cinema, nello stesso ordine di
+            cinema_urls (lo stesso risultato di scraper.scrape_all_cinemas)
+        """
+        if details not in scraper.DETAILS:
+            raise ValueError(f"Livello di dettaglio sconosciuto: {details}")
+        started = time.perf_counter()
+        self._deadline = deadline
+        todo: "queue.Queue" = queue.Queue()
+        pages = self._pages = _PageQueue(self.queue_size)
+        results: "queue.Queue" = queue.Queue()
+        stopped = threading.Event()
+
+        # Processi riusati tra un'esecuzione e l'altra (vedi scraper.process_pool)
+        pool = scraper.process_pool("parse", self.parsers) if self.parsers else None
+        fetchers = [
+            threading.Thread(target=profiling.bind(self._fetch_worker), args=(todo, pages, results, stopped), daemon=True)
+            for _ in range(self.fetchers)
+        ]
+        feeders = [
+            threading.Thread(target=profiling.bind(self._parse_worker), args=(pages, results, pool, stopped), daemon=True)
+            for _ in range(self.feeders)
+        ]
+        for thread in fetchers + feeders:
+            thread.start()
+
+        films: Dict[str, List[Tuple[Dict[str, Any], Optional[str]]]] = {}
+        error = None
+        try:
+            error = self._aggregate(cinema_urls, details, todo, results, films, deadline)
+        finally:
+            # Fetcher prima del parsing: un fetcher fermo sulla coda piena ha ancora chi la svuota
+            stopped.set()
+            for _ in fetchers:
+                todo.put(_STOP)
+            for thread in fetchers:
+                thread.join()
+            for _ in feeders:
+                pages.put(_STOP)
+            for thread in feeders:
+                thread.join()
+            self._elapsed = time.perf_counter() - started
+            _record(self.stats())
+        if error is not None:
+            raise error
+
+        cinemas = []
+        for name, url in cinema_urls.items():
+            entries = films.get(name)
+            if entries is None:
+                cinemas.append(scraper._incomplete_cinema(name, url))
+                continue
+            if details == scraper.DETAILS_TODAY:
+                for film, _ in entries:
+                    film["programmazione"] = scraper._today_programmazione(film)
+            cinemas.append({"cinema": name, "url": url, "film": [film for film, _ in entries]})
+        return cinemas
+
+    def _aggregate(self, cinema_urls: Dict[str, str], details: str, todo: "queue.Queue",
+                   results: "queue.Queue", films: Dict[str, List[Tuple[Dict[str, Any], Optional[str]]]],
+                   deadline: Optional[float] = None):
+        """
+        Riceve i record fino all'ultima pagina (o alla scadenza); restituisce
+        il primo errore (None se nessuno). I cinema senza pagina restano fuori
+        da films.
+        """
+        stage = self._stages["aggregate"]
+        outstanding = set()
+        for name, url in cinema_urls.items():
+            todo.put((LISTING, url, name))
+            outstanding.add((LISTING, name))
+
+        while outstanding:
+            waited = time.perf_counter()
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                kind, key, result = results.get(timeout=remaining)
+            except queue.Empty:
+                stage.add(starved=time.perf_counter() - waited)
+                for kind, key in outstanding:
+                    if kind == TICKET:
+                        self._mark_incomplete(films, key)
+                return None
+            started = time.perf_counter()
+            stage.add(starved=started - waited)
+            outstanding.discard((kind, key))
+            if isinstance(result, scraper.DeadlineExceeded):
+                if kind == TICKET:
+                    self._mark_incomplete(films, key)
+                continue
+            if isinstance(result, Exception):
+                return result
+
+            if kind == LISTING:
+                print(f"Scraping {key}...")
+                entries = films[key] = [(film, link) for film, link in result]
+                if details == scraper.DETAILS_ALL:
+                    for index, (film, link) in enumerate(entries):
+                        if link:
+                            print(f"  Scraping pagina dettagliata per '{film['titolo']}'...")
+                            todo.put((TICKET, link, (key, index)))
+                            outstanding.add((TICKET, (key, index)))
+            elif result:
+                name, index = key
+                films[name][index][0]["programmazione"] = result
+            stage.add(items=1, busy=time.perf_counter() - started)
+        return None
+
+    @staticmethod
+    def _mark_incomplete(films: Dict[str, List[Tuple[Dict[str, Any], Optional[str]]]],
+                         key: Tuple[str, int]) -> None:
+        name, index = key
+        films[name][index][0][scraper.INCOMPLETE] = True
+        metrics.INCOMPLETE_PAGES.labels(parsing.TICKET).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        """Lavoro, attese e utilizzo di ogni stadio, più l'occupazione della coda delle pagine."""
+        return {
+            "elapsed_seconds": round(self._elapsed, 3),
+            "stages": {name: stage.to_dict(self._elapsed) for name, stage in self._stages.items()},
+            "queue": self._pages.stats() if self._pages is not None else None,
+        }
+
+
+_lock = threading.Lock()
+_last_stats: Optional[Dict[str, Any]] = None
+
+
+def _record(stats: Dict[str, Any]) -> None:
+    global _last_stats
+    with _lock:
+        _last_stats = stats
+
+
+def last_stats() -> Optional[Dict[str, Any]]:
+    """Statistiche dell'ultima esecuzione della pipeline in questo processo (None se nessuna)."""
+    with _lock:
+        return _last_stats
+
+
+def scrape_all(cinema_urls: Dict[str, str], details: str = scraper.DETAILS_ALL,
+               fetchers: Optional[int] = None, parsers: Optional[int] = None,
+               deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Scraping di tutti i cinema con una nuova Pipeline."""
+    return Pipeline(fetchers=fetchers, parsers=parsers).run(cinema_urls, details, deadline)
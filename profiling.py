@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profilazione su richiesta di richieste all'API e di esecuzioni dello scraper.
+
+Una sessione attiva cProfile nel thread che la avvia e nei compiti che
+questo affida ai pool di thread (pagine dei ticket, download duplicati,
+ricerche Trakt, stadi della pipeline), poi unisce le statistiche e produce:
+
+- un albero delle chiamate testuale, con tempo cumulativo e percentuale;
+- gli stack "folded" (una riga "f1;f2;f3 microsecondi" per percorso),
+  da passare a flamegraph.pl o da aprire con speedscope;
+- il dump di pstats (profile.prof), per snakeviz o pstats.
+
+La sessione corrente è in una ContextVar: i pool passano i loro compiti
+da bind(), che li profila solo se chi li ha inviati è profilato. Le
+richieste concorrenti non profilate e gli altri lavori degli stessi pool
+restano fuori dal report, e ogni profiler si spegne a fine compito.
+
+Il tempo dei percorsi è ricavato dal grafo chiamante -> chiamato di
+cProfile, ripartendo il tempo di una funzione tra i chiamanti in
+proporzione: è esatto per le funzioni chiamate da un solo punto.
+
+I report vengono salvati in PROFILE_DIR, una directory per profilo, e
+vengono conservati gli ultimi PROFILE_KEEP.
+
+Uso da riga di comando (scraper.main() sulle fixture registrate):
+    python profiling.py scrape --repeat 5
+"""
+
+import argparse
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Token richiesto per ?profile= (senza token la profilazione via API è disabilitata)
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".cache/profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "comingsoon")
+
+# Formati dei report: albero delle chiamate, stack per flamegraph, dump di pstats
+TREE = "tree"
+FOLDED = "folded"
+PSTATS = "prof"
+FORMATS = {
+    TREE: ("tree.txt", "text/plain; charset=utf-8"),
+    FOLDED: ("stacks.folded", "text/plain; charset=utf-8"),
+    PSTATS: ("profile.prof", "application/octet-stream"),
+}
+
+# Rami sotto questa frazione del tempo totale non compaiono nell'albero / negli stack
+TREE_MIN_FRACTION = 0.005
+FOLDED_MIN_FRACTION = 0.0005
+MAX_DEPTH = 80
+
+Func = Tuple[str, int, str]
+
+
+class _Stats:
+    """Statistiche già raccolte, nel formato accettato da pstats.Stats."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Session:
+    """
+    Profilazione del thread corrente e dei compiti che affida ai pool (vedi bind).
+
+    Un compito ancora in corso quando la sessione termina contribuisce con
+    le statistiche raccolte fino a quel momento (snapshot_stats(), che a
+    differenza di create_stats() si può chiamare da un altro thread) e
+    spegne il suo profiler quando finisce.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.profile_id: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self._started = 0.0
+        self._profile = cProfile.Profile()
+        self._task_profiles: List[cProfile.Profile] = []
+        # Thread con un profiler della sessione attivo, e tutti quelli profilati
+        self._busy: Set[int] = set()
+        self._thread_ids: Set[int] = set()
+        self._active = False
+        self._lock = threading.Lock()
+        self._stats: Optional[pstats.Stats] = None
+        self._reports: Optional[Dict[str, bytes]] = None
+
+    def start(self) -> "Session":
+        ident = threading.get_ident()
+        with self._lock:
+            self._active = True
+            self._busy.add(ident)
+            self._thread_ids.add(ident)
+        _current.set(self)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def stop(self) -> pstats.Stats:
+        self._profile.disable()
+        self.elapsed = time.perf_counter() - self._started
+        if _current.get() is self:
+            _current.set(None)
+        with self._lock:
+            self._active = False
+            self._busy.discard(threading.get_ident())
+            profiles = list(self._task_profiles)
+        stats = pstats.Stats(self._profile)
+        for profile in profiles:
+            profile.snapshot_stats()
+            if profile.stats:
+                stats.add(_Stats(profile.stats))
+        self._stats = stats
+        return stats
+
+    def _run(self, func: Callable[..., Any], args, kwargs) -> Any:
+        """Esegue un compito della sessione con un profiler proprio, spento alla fine."""
+        ident = threading.get_ident()
+        with self._lock:
+            # Sessione finita, o thread già profilato (compito eseguito nel thread che lo invia)
+            if not self._active or ident in self._busy:
+                profile = None
+            else:
+                profile = cProfile.Profile()
+                self._task_profiles.append(profile)
+                self._busy.add(ident)
+                self._thread_ids.add(ident)
+        if profile is None:
+            return func(*args, **kwargs)
+
+        # I compiti che questo compito affida ad altri pool appartengono alla stessa sessione
+        token = _current.set(self)
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            _current.reset(token)
+            with self._lock:
+                self._busy.discard(ident)
+
+    @property
+    def threads(self) -> int:
+        """Thread profilati, compreso quello che ha avviato la sessione."""
+        with self._lock:
+            return len(self._thread_ids)
+
+    def reports(self) -> Dict[str, bytes]:
+        """Albero, stack folded e dump di pstats della sessione terminata."""
+        if self._reports is None:
+            stats = self._stats
+            header = f"{self.label}\n" if self.label else ""
+            header += f"{self.elapsed:.3f}s, {self.threads} thread profilati\n\n"
+            self._reports = {
+                TREE: (header + call_tree(stats)).encode("utf-8"),
+                FOLDED: folded_stacks(stats).encode("utf-8"),
+                # Stesso contenuto di pstats.Stats.dump_stats, che scrive solo su file
+                PSTATS: marshal.dumps(stats.stats),
+            }
+        return self._reports
+
+    def save(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP) -> str:
+        """Salva i report in directory/<id>/ e restituisce l'id."""
+        self.profile_id = self.profile_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        target = os.path.join(directory, self.profile_id)
+        os.makedirs(target, exist_ok=True)
+        for fmt, data in self.reports().items():
+            with open(os.path.join(target, FORMATS[fmt][0]), "wb") as f:
+                f.write(data)
+        _prune(directory, keep)
+        return self.profile_id
+
+
+# Sessione del contesto corrente (richiesta o compito di un pool), None se non profilato
+_current: contextvars.ContextVar[Optional[Session]] = contextvars.ContextVar("profiling_session", default=None)
+
+
+def bind(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Compito da affidare a un pool di thread: se il chiamante è profilato,
+    func viene profilata nella sua sessione in qualunque thread venga
+    eseguita. Senza sessione restituisce func invariata.
+    """
+    session = _current.get()
+    if session is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        return session._run(func, args, kwargs)
+    return run
+
+
+def _prune(directory: str, keep: int) -> None:
+    try:
+        entries = sorted(
+            (entry for entry in os.scandir(directory) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+    except FileNotFoundError:
+        return
+    for entry in entries[:max(0, len(entries) - keep)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_report(profile_id: str, fmt: str, directory: str = PROFILE_DIR) -> Optional[bytes]:
+    """Report salvato di un profilo, None se non esiste."""
+    if fmt not in FORMATS or os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+        return None
+    try:
+        with open(os.path.join(directory, profile_id, FORMATS[fmt][0]), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _frame_name(func: Func) -> str:
+    filename, line, name = func
+    if filename == "~" and line == 0:
+        # Funzione built-in, es. "<method 'search' of 're.Pattern' objects>"
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _graph(stats: pstats.Stats) -> Tuple[Dict[Func, Dict[Func, float]], List[Func], float]:
+    """Chiamati di ogni funzione con il tempo cumulativo dell'arco, radici e tempo totale."""
+    callees: Dict[Func, Dict[Func, float]] = {}
+    roots = []
+    for func, (_, _, _, cumulative, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            # edge = (chiamate primitive, chiamate, tempo proprio, tempo cumulativo)
+            callees.setdefault(caller, {})[func] = edge[3] if isinstance(edge, tuple) else 0.0
+    total = sum(stats.stats[func][3] for func in roots)
+    roots.sort(key=lambda func: stats.stats[func][3], reverse=True)
+    return callees, roots, total
+
+
+def _walk(stats: pstats.Stats, min_fraction: float, visit: Callable[[Tuple[Func, ...], float, float], None]) -> float:
+    """
+    Visita l'albero delle chiamate in profondità.
+
+    visit riceve (percorso, tempo cumulativo, tempo proprio) di ogni nodo;
+    i tempi di una funzione sono divisi tra i percorsi che la raggiungono
+    in proporzione al tempo di ogni arco.
+    """
+    callees, roots, total = _graph(stats)
+    threshold = total * min_fraction
+
+    def walk(path: Tuple[Func, ...], func: Func, budget: float) -> None:
+        own, cumulative = stats.stats[func][2], stats.stats[func][3]
+        ratio = budget / cumulative if cumulative else 0.0
+        path = path + (func,)
+        visit(path, budget, own * ratio)
+        if len(path) >= MAX_DEPTH:
+            return
+        children = sorted(callees.get(func, {}).items(), key=lambda item: item[1], reverse=True)
+        for child, edge_time in children:
+            child_budget = edge_time * ratio
+            if child_budget >= threshold and child not in path:
+                walk(path, child, child_budget)
+
+    for root in roots:
+        if stats.stats[root][3] >= threshold:
+            walk((), root, stats.stats[root][3])
+    return total
+
+
+def call_tree(stats: pstats.Stats, min_fraction: float = TREE_MIN_FRACTION) -> str:
+    """Albero delle chiamate con tempo cumulativo, percentuale sul totale e tempo proprio."""
+    lines: List[str] = []
+
+    def visit(path, cumulative, own):
+        percent = 100 * cumulative / total if total else 0.0
+        lines.append(
+            f"{percent:6.1f}% {cumulative:9.4f}s {own:9.4f}s  {'  ' * (len(path) - 1)}{_frame_name(path[-1])}"
+        )
+
+    total = _graph(stats)[2]
+    _walk(stats, min_fraction, visit)
+    header = (
+        f"{'totale':>7} {'cumul.':>10} {'proprio':>10}  funzione "
+        f"(tempi sommati su tutti i thread, rami sotto {min_fraction:.1%} omessi)\n"
+    )
+    return header + "\n".join(lines) + "\n"
+
+
+def folded_stacks(stats: pstats.Stats, min_fraction: float = FOLDED_MIN_FRACTION) -> str:
+    """Stack nel formato folded di flamegraph.pl: "f1;f2;f3 <microsecondi di tempo proprio>"."""
+    samples: Dict[str, int] = {}
+
+    def visit(path, cumulative, own):
+        micros = int(round(own * 1_000_000))
+        if micros > 0:
+            stack = ";".join(_frame_name(func).replace(";", ",") for func in path)
+            samples[stack] = samples.get(stack, 0) + micros
+
+    _walk(stats, min_fraction, visit)
+    return "".join(f"{stack} {micros}\n" for stack, micros in sorted(samples.items()))
+
+
+def _quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def profile_scrape(archive: Optional[str] = None, repeat: int = 1, quiet: bool = True) -> Session:
+    """
+    Profila scraper.main() servendo le pagine da un archivio di transport
+    (default: le fixture di fixtures/comingsoon), senza cache HTTP su disco.
+
+    L'esecuzione avviene in una directory temporanea, così i file prodotti
+    da main() (JSON, messaggio Telegram, ultimo snapshot) non toccano quelli
+    reali.
+    """
+    import http_cache
+    import http_client
+    import scraper
+    import transport
+
+    previous_transport = http_client.get_transport()
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        if archive is None:
+            archive = os.path.join(workdir, "archive")
+            transport.import_pages(FIXTURES_DIR, archive)
+        http_client.set_transport(transport.REPLAY, os.path.abspath(archive), 0)
+        http_cache.configure(None)
+        os.chdir(workdir)
+        session = Session(f"scraper.main() x{repeat} (archivio {archive})")
+        try:
+            session.start()
+            try:
+                for _ in range(repeat):
+                    with _quiet() if quiet else contextlib.nullcontext():
+                        scraper.main()
+            finally:
+                session.stop()
+        finally:
+            os.chdir(previous_cwd)
+            http_client.set_transport(
+                previous_transport["mode"], previous_transport["archive"], previous_transport["latency"]
+            )
+    return session
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Profilazione dello scraper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scrape = subparsers.add_parser("scrape", help="Profila scraper.main() sulle pagine registrate")
+    scrape.add_argument("--archive", help="Archivio di transport (default: fixture di fixtures/comingsoon)")
+    scrape.add_argument("--repeat", type=int, default=1, help="Esecuzioni di scraper.main()")
+    scrape.add_argument("--out", default=PROFILE_DIR, help="Directory dei report")
+    scrape.add_argument("--lines", type=int, default=40, help="Righe dell'albero da stampare")
+    scrape.add_argument("--verbose", action="store_true", help="Mostra l'output di scraper.main()")
+    args = parser.parse_args(argv)
+
+    session = profile_scrape(args.archive, args.repeat, quiet=not args.verbose)
+    profile_id = session.save(args.out)
+    tree = session.reports()[TREE].decode("utf-8").splitlines()
+    print("\n".join(tree[:args.lines]))
+    if len(tree) > args.lines:
+        print(f"... ({len(tree) - args.lines} righe in più)")
+    target = os.path.join(args.out, profile_id)
+    print(f"\nReport in {target}: {', '.join(name for name, _ in FORMATS.values())}")
+    print(f"Flamegraph: flamegraph.pl {os.path.join(target, FORMATS[FOLDED][0])} > flamegraph.svg")
+    return 0
+
+
+if __name__ == "__main__":
+    # Il modulo importato da scraper, non __main__: la sessione corrente è una sola
+    import profiling
+    sys.exit(profiling.main(sys.argv[1:]))
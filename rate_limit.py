@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Thread-safe token bucket used to respect third-party API rate limits."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second up to ``capacity``.
+
+    ``pause(seconds)`` blocks every caller until the given time has passed,
+    which is how a ``429 Too Many Requests`` with ``Retry-After`` is honoured
+    across all workers sharing the bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting at most ``timeout`` seconds (None = forever).
+
+        Returns:
+            True if a token was taken, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # Refill restarts only once the pause is over, so no burst follows a 429
+            self._tokens = 0.0
+            self._updated = self._paused_until
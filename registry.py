@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro dei cinema da seguire, letto da un file di configurazione.
+
+Il file (CINEMAS_FILE, default cinemas.json accanto al codice) elenca per
+ogni cinema la città, il nome usato nel JSON e negli URL dell'API, la
+pagina su comingsoon.it e il nome breve del messaggio Telegram:
+
+    {"cinema": [
+        {"citta": "Matera", "cinema": "Il Piccolo",
+         "url": "https://www.comingsoon.it/cinema/matera/il-piccolo/4976/",
+         "breve": "Piccolo"}
+    ]}
+
+Il nome identifica il cinema in tutta l'applicazione (snapshot, modifiche,
+/api/films/<cinema>), quindi deve essere unico anche tra città diverse.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+CINEMAS_FILE = os.environ.get(
+    "CINEMAS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cinemas.json")
+)
+
+
+class CinemaEntry:
+    """Un cinema del registro."""
+
+    __slots__ = ("city", "name", "url", "short")
+
+    def __init__(self, city: str, name: str, url: str, short: Optional[str] = None):
+        self.city = city
+        self.name = name
+        self.url = url
+        self.short = short or name
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"citta": self.city, "cinema": self.name, "url": self.url, "breve": self.short}
+
+
+class Registry:
+    """Cinema del registro nell'ordine del file, con gli indici per nome e per città."""
+
+    def __init__(self, entries: Iterable[CinemaEntry]):
+        self.entries: List[CinemaEntry] = list(entries)
+        self._by_name: Dict[str, CinemaEntry] = {}
+        self._by_city: Dict[str, List[CinemaEntry]] = {}
+        for entry in self.entries:
+            if entry.name in self._by_name:
+                raise ValueError(f"Cinema '{entry.name}' presente più volte nel registro")
+            self._by_name[entry.name] = entry
+            self._by_city.setdefault(entry.city, []).append(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[CinemaEntry]:
+        return iter(self.entries)
+
+    def get(self, name: str) -> Optional[CinemaEntry]:
+        return self._by_name.get(name)
+
+    def cities(self) -> List[str]:
+        """Città nell'ordine in cui compaiono nel registro."""
+        return list(self._by_city)
+
+    def urls(self, city: Optional[str] = None) -> Dict[str, str]:
+        """Dizionario nome -> URL (come CINEMA_URLS), di tutti i cinema o di una città."""
+        entries = self.entries if city is None else self._by_city.get(city, [])
+        return {entry.name: entry.url for entry in entries}
+
+    def city_of(self, name: str) -> Optional[str]:
+        entry = self._by_name.get(name)
+        return entry.city if entry is not None else None
+
+    def short_name(self, name: str) -> str:
+        """Nome breve del cinema (il nome completo se non è nel registro)."""
+        entry = self._by_name.get(name)
+        return entry.short if entry is not None else name
+
+    def partition(self, cinemas: Iterable[Dict[str, Any]]) -> Dict[Optional[str], List[Dict[str, Any]]]:
+        """
+        Cinema di uno snapshot divisi per città, nell'ordine del registro;
+        i cinema che non sono nel registro finiscono sotto None.
+        """
+        parts: Dict[Optional[str], List[Dict[str, Any]]] = {city: [] for city in self._by_city}
+        for cinema in cinemas:
+            parts.setdefault(self.city_of(cinema.get("cinema", "")), []).append(cinema)
+        return {city: items for city, items in parts.items() if items}
+
+
+def load_registry(path: str = CINEMAS_FILE) -> Registry:
+    """
+    Legge il registro dal file JSON.
+
+    Raises:
+        ValueError: se il file non è valido (campi mancanti, URL non http(s),
+            nomi ripetuti)
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"{path}: JSON non valido ({exc})") from None
+
+    items = data.get("cinema") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValueError(f"{path}: manca la lista \"cinema\"")
+
+    entries = []
+    for position, item in enumerate(items):
+        missing = [key for key in ("citta", "cinema", "url") if not isinstance(item, dict) or not item.get(key)]
+        if missing:
+            raise ValueError(f"{path}: cinema #{position + 1} senza {', '.join(missing)}")
+        if not item["url"].startswith(("http://", "https://")):
+            raise ValueError(f"{path}: URL non valido per '{item['cinema']}': {item['url']}")
+        entries.append(CinemaEntry(item["citta"], item["cinema"], item["url"], item.get("breve")))
+    try:
+        return Registry(entries)
+    except ValueError as exc:
+        raise ValueError(f"{path}: {exc}") from None
+
+
+_lock = threading.Lock()
+_default: Optional[Registry] = None
+
+
+def default() -> Registry:
+    """Registro di CINEMAS_FILE, letto al primo utilizzo."""
+    global _default
+    if _default is None:
+        with _lock:
+            if _default is None:
+                _default = load_registry()
+    return _default
+
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpi delle risposte dell'API: serializzazione, ETag e compressione.
+
+Il corpo di uno snapshot viene serializzato una sola volta (con orjson se
+installato, altrimenti con json) e conservato insieme al suo ETag forte e
+alle versioni compresse, create al primo client che le accetta. Finché lo
+snapshot non cambia, le richieste successive riusano gli stessi byte e una
+richiesta con If-None-Match corrispondente riceve un 304 senza corpo.
+
+Ogni codifica ha un proprio ETag ("<hash>", "<hash>-gzip", "<hash>-br"),
+come richiesto per gli ETag forti; per If-None-Match vale qualunque
+codifica dello stesso contenuto.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from flask import Response
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Corpi più piccoli non vengono compressi
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+# Corpi serializzati conservati (uno per snapshot e variante)
+ENCODED_CACHE_SIZE = int(os.environ.get("ENCODED_CACHE_SIZE", "64"))
+
+JSON_MIMETYPE = "application/json"
+TEXT_MIMETYPE = "text/plain; charset=utf-8"
+
+# Codifiche in ordine di preferenza a parità di qualità dichiarata dal client
+ENCODINGS = ("br", "gzip") if HAS_BROTLI else ("gzip",)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    JSON compatto in UTF-8 con le chiavi ordinate, come jsonify di Flask
+    (senza escape dei caratteri non ASCII).
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Corpo compresso con gzip o br (deterministico: nessun timestamp)."""
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class Encoded:
+    """Corpo serializzato di una risposta, con ETag e versioni compresse."""
+
+    __slots__ = ("source", "body", "mimetype", "digest", "_compressed", "_lock")
+
+    def __init__(self, source: Any, body: bytes, mimetype: str):
+        self.source = source  # mantiene vivo l'oggetto: il suo id resta univoco
+        self.body = body
+        self.mimetype = mimetype
+        self.digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._compressed: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        return self.digest if encoding is None else f"{self.digest}-{encoding}"
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, bool]:
+        """Corpo nella codifica indicata (None = non compresso) e se è stato appena compresso."""
+        if encoding is None:
+            return self.body, False
+        with self._lock:
+            data = self._compressed.get(encoding)
+            if data is not None:
+                return data, False
+            data = self._compressed[encoding] = compress(self.body, encoding)
+            return data, True
+
+
+class EncodedCache:
+    """
+    Corpi serializzati per (oggetto sorgente, variante), in ordine LRU.
+
+    La sorgente è uno snapshot condiviso e immutabile: un nuovo scraping
+    produce un nuovo oggetto e quindi una nuova voce.
+    """
+
+    def __init__(self, size: int = ENCODED_CACHE_SIZE):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[int, Hashable], Encoded]" = OrderedDict()
+        self._stats = {
+            "encoded": 0,
+            "reused": 0,
+            "not_modified": 0,
+            "compressed": 0,
+            "bytes_body": 0,
+            "bytes_sent": 0,
+        }
+
+    def get(self, source: Any, variant: Hashable,
+            build: Callable[[], Tuple[bytes, str]]) -> Encoded:
+        """
+        Corpo della variante per lo snapshot source; build() restituisce
+        (corpo, mimetype) ed è chiamata solo alla prima richiesta.
+        """
+        key = (id(source), variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.source is source:
+                self._entries.move_to_end(key)
+                self._stats["reused"] += 1
+                return entry
+
+        body, mimetype = build()
+        entry = Encoded(source, body, mimetype)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            self._stats["encoded"] += 1
+        return entry
+
+    def json(self, source: Any, variant: Hashable, build: Callable[[], Any]) -> Encoded:
+        """Come get, con build() che restituisce l'oggetto da serializzare in JSON."""
+        return self.get(source, variant, lambda: (dumps(build()), JSON_MIMETYPE))
+
+    def text(self, source: Any, variant: Hashable, build: Callable[[], str]) -> Encoded:
+        """Come get, con build() che restituisce il testo della risposta."""
+        return self.get(source, variant, lambda: (build().encode("utf-8"), TEXT_MIMETYPE))
+
+    def respond(self, entry: Encoded, request, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Risposta per la richiesta: 304 se If-None-Match corrisponde,
+        altrimenti il corpo nella codifica migliore accettata dal client.
+        """
+        encoding = None
+        if len(entry.body) >= COMPRESS_MIN_BYTES:
+            encoding = request.accept_encodings.best_match(ENCODINGS)
+
+        etags = request.if_none_match
+        if etags and (etags.star_tag or any(etags.contains_weak(entry.etag(e)) for e in (None,) + ENCODINGS)):
+            response = Response(status=304, headers=headers)
+            response.set_etag(entry.etag(encoding))
+            response.headers["Vary"] = "Accept-Encoding"
+            with self._lock:
+                self._stats["not_modified"] += 1
+            return response
+
+        data, compressed = entry.variant(encoding)
+        response = Response(data, content_type=entry.mimetype, headers=headers)
+        response.set_etag(entry.etag(encoding))
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        with self._lock:
+            self._stats["compressed"] += compressed
+            self._stats["bytes_body"] += len(entry.body)
+            self._stats["bytes_sent"] += len(data)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        stats["json_encoder"] = "orjson" if HAS_ORJSON else "json"
+        stats["encodings"] = list(ENCODINGS)
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
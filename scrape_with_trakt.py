@@ -7,11 +7,15 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 
-from scraper import CINEMA_URLS, scrape_cinema, format_telegram_message
+import changes
+import registry
+from scraper import CINEMA_URLS, city_output_file, film_slug, scrape_all_cinemas, format_telegram_message
 from trakt_enrich import enrich_with_trakt, MissingTraktCredentials
 
-OUTPUT_JSON = Path("programmazione_cinema_matera.json")
-OUTPUT_ENRICHED = Path("programmazione_cinema_matera_with_trakt.json")
+
+def city_enriched_file(city: str) -> Path:
+    """File JSON arricchito di una città, es. "programmazione_cinema_matera_with_trakt.json"."""
+    return Path(f"programmazione_cinema_{film_slug(city)}_with_trakt.json")
 
 
 def ensure_trakt_credentials() -> None:
@@ -32,17 +36,27 @@ def main() -> None:
     }
 
     # Scrape ciascun cinema
-    for cinema_name, url in CINEMA_URLS.items():
-        cinema_data = scrape_cinema(url, cinema_name)
+    for cinema_data in scrape_all_cinemas(CINEMA_URLS):
         all_data["cinema"].append(cinema_data)
-        print(f"- {cinema_name}: {len(cinema_data['film'])} film")
+        print(f"- {cinema_data['cinema']}: {len(cinema_data['film'])} film")
+
+    report = changes.record_run(all_data["cinema"])
+    if report is not None:
+        all_data["modifiche"] = report
+        print(f"\n{changes.format_changes(report)}")
 
-    # Salva dati raw
-    OUTPUT_JSON.write_text(json.dumps(all_data, ensure_ascii=False, indent=2))
+    # Salva dati raw, un file per città come scraper.py
+    by_city = registry.default().partition(all_data["cinema"])
+    for city, cinemas in by_city.items():
+        city_data = {"timestamp": all_data["timestamp"], "citta": city, "cinema": cinemas}
+        if report is not None:
+            city_data["modifiche"] = changes.filter_report(report, {cinema["cinema"] for cinema in cinemas})
+        Path(city_output_file(city)).write_text(json.dumps(city_data, ensure_ascii=False, indent=2))
 
     print("\nRicerca su Trakt per ogni film...")
+    cache_stats: Dict[str, Any] = {}
     try:
-        aggregated = enrich_with_trakt(all_data["cinema"])
+        aggregated = enrich_with_trakt(all_data["cinema"], stats=cache_stats)
     except MissingTraktCredentials as exc:
         raise SystemExit(str(exc)) from exc
 
@@ -50,14 +64,26 @@ def main() -> None:
         print(f"  ✅ {title}: TMDB {info.get('tmdb')} | IMDB {info.get('imdb')}")
 
     # Salva JSON arricchito
-    enriched = {
-        "timestamp": all_data.get("timestamp"),
-        "films": aggregated,
-    }
-    OUTPUT_ENRICHED.write_text(json.dumps(enriched, ensure_ascii=False, indent=2))
-
-    print(f"\nDati base salvati in {OUTPUT_JSON}")
-    print(f"Dati arricchiti salvati in {OUTPUT_ENRICHED}")
+    print(
+        f"\nCache Trakt: {cache_stats['hits']} hit, {cache_stats['negative_hits']} negativi, "
+        f"{cache_stats['trakt_calls']} chiamate a Trakt"
+    )
+
+    # Una sola ricerca su Trakt per tutte le città, poi un file per città con i suoi film
+    for city, cinemas in by_city.items():
+        names = {cinema["cinema"] for cinema in cinemas}
+        enriched = {
+            "timestamp": all_data.get("timestamp"),
+            "citta": city,
+            "films": {
+                title: info for title, info in aggregated.items()
+                if names.intersection(info["cinema"])
+            },
+            "trakt_cache": cache_stats,
+        }
+        city_enriched_file(city).write_text(json.dumps(enriched, ensure_ascii=False, indent=2))
+        print(f"\nDati base di {city} salvati in {city_output_file(city)}")
+        print(f"Dati arricchiti di {city} salvati in {city_enriched_file(city)}")
 
     # Aggiorna messaggio Telegram
     telegram_msg = format_telegram_message(all_data)
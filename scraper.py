@@ -1,45 +1,362 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Crawler per estrarre i film in programmazione nei cinema di Matera
-da comingsoon.it e salvarli in un file JSON.
+Crawler per estrarre i film in programmazione nei cinema del registro
+(cinemas.json) da comingsoon.it e salvarli in file JSON, uno per città.
 """
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+import changes
+import telegram_render
+import http_cache
+import http_client
+import metrics
+import parsing
+import profiling
+import registry
+import atexit
 import json
+import multiprocessing
+import os
 import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from urllib.parse import urlsplit
 
-# URL dei cinema di Matera
-CINEMA_URLS = {
-    "Cinema Comunale Guerrieri": "https://www.comingsoon.it/cinema/matera/cinema-comunale-guerrieri/2635/",
-    "Il Piccolo": "https://www.comingsoon.it/cinema/matera/il-piccolo/4976/",
-    "UCI Cinemas Red Carpet": "https://www.comingsoon.it/cinema/matera/uci-cinemas-red-carpet/5635/"
+# Cinema del registro (cinemas.json o CINEMAS_FILE): nome -> URL
+CINEMA_URLS = registry.default().urls()
+
+# Numero massimo di download in parallelo e limite di richieste contemporanee per host
+MAX_WORKERS = int(os.environ.get("SCRAPER_MAX_WORKERS", "8"))
+PER_HOST_CONCURRENCY = int(os.environ.get("SCRAPER_PER_HOST_CONCURRENCY", "4"))
+# Processi tra cui dividere i cinema di scrape_all_cinemas (1 = solo il processo corrente)
+PROCESSES = int(os.environ.get("SCRAPER_PROCESSES", "1"))
+# Scraping a stadi (download, parsing in processi separati, aggregazione): vedi pipeline.py
+PIPELINE = os.environ.get("SCRAPER_PIPELINE", "0").lower() in {"1", "true", "yes", "on"}
+# Timeout di una singola richiesta (ridotto al tempo rimasto quando c'è una scadenza)
+REQUEST_TIMEOUT = float(os.environ.get("SCRAPER_REQUEST_TIMEOUT", "10"))
+# Secondi dopo i quali un download ancora in corso viene duplicato (hedged request), 0 = mai.
+# Disattivato di default: ogni duplicato è una richiesta in più verso un sito di terzi
+HEDGE_AFTER = float(os.environ.get("SCRAPER_HEDGE_AFTER", "0"))
+# Duplicati contemporanei massimi verso lo stesso host, oltre a PER_HOST_CONCURRENCY
+HEDGE_MAX_PER_HOST = int(os.environ.get("SCRAPER_HEDGE_MAX_PER_HOST", "2"))
+
+# Segna i film (e i cinema) i cui dati non sono stati scaricati entro la scadenza
+INCOMPLETE = "incompleto"
+
+# Pattern precompilati usati dagli estrattori
+FILM_SECTION_RE = re.compile(r'header-scheda.*streaming', re.I)  # Blocco di un film
+FILM_BLOCK_RE = re.compile(r'header-scheda', re.I)
+FILM_HEADING_RE = re.compile(r'Film in programmazione', re.I)
+TITLE_RE = re.compile(r'tit_olo', re.I)
+SCHEDULE_RE = re.compile(r'cs-btn.*sala', re.I)
+SALA_RE = re.compile(r'Sala', re.I)
+SALA_NUMBER_RE = re.compile(r'Sala\s+(\d+)[^|]*')
+SALA_IN_TEXT_RE = re.compile(r'Sala\s+(\d+)')
+TIME_LIKE_RE = re.compile(r'\d{1,2}[.:]\d{2}')
+TIME_IN_TEXT_RE = re.compile(r'\b(\d{1,2}[.:]\d{2})\b')
+TICKET_HREF_RE = re.compile(r'ticket', re.I)
+TICKET_TEXT_RE = re.compile(r'Acquista.*biglietto', re.I)
+MEDIA_DAY_RE = re.compile(r'media.*mbm', re.I)  # Giorno nella pagina del ticket
+BTN_FAB_RE = re.compile(r'btn-fab', re.I)
+TIME_BUTTON_RE = re.compile(r'\d{1,2}:\d{2}')
+
+# Livelli di dettaglio della programmazione:
+# - "none": solo la pagina del cinema (orari e sala di oggi), nessuna pagina ticket;
+# - "today": come "none", con gli orari di oggi riportati anche in "programmazione";
+# - "all": tutte le date, scaricando la pagina ticket di ogni film.
+DETAILS_NONE = "none"
+DETAILS_TODAY = "today"
+DETAILS_ALL = "all"
+DETAILS = (DETAILS_NONE, DETAILS_TODAY, DETAILS_ALL)
+
+WEEKDAYS = ['Lun', 'Mar', 'Mer', 'Gio', 'Ven', 'Sab', 'Dom']
+
+# Mese abbreviato -> numero
+MONTH_MAP = {
+    'GEN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
+    'MAG': '05', 'GIU': '06', 'LUG': '07', 'AGO': '08',
+    'SET': '09', 'OTT': '10', 'NOV': '11', 'DIC': '12'
+}
+
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_hedge_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+def _host_semaphore(url: str, semaphores: Optional[Dict[str, threading.BoundedSemaphore]] = None,
+                    limit: Optional[int] = None) -> threading.BoundedSemaphore:
+    """Restituisce il semaforo che limita le richieste contemporanee verso l'host dell'URL."""
+    if semaphores is None:
+        semaphores, limit = _host_semaphores, PER_HOST_CONCURRENCY
+    host = urlsplit(url).netloc
+    with _host_semaphores_lock:
+        semaphore = semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max(1, limit))
+            semaphores[host] = semaphore
+    return semaphore
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
-def get_page(url: str) -> BeautifulSoup:
+class DeadlineExceeded(Exception):
+    """La scadenza dello scraping è passata prima che la pagina fosse scaricata."""
+
+def deadline_after(budget: Optional[float]) -> Optional[float]:
+    """Scadenza (in time.monotonic()) tra budget secondi; None se budget è None (nessun limite)."""
+    return None if budget is None else time.monotonic() + budget
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """Secondi che mancano alla scadenza (None senza scadenza, negativi se è passata)."""
+    return None if deadline is None else deadline - time.monotonic()
+
+def _request_timeout(deadline: Optional[float]) -> float:
+    remaining = _remaining(deadline)
+    if remaining is None:
+        return REQUEST_TIMEOUT
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(REQUEST_TIMEOUT, remaining)
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+def _attempts_executor() -> ThreadPoolExecutor:
+    """Pool dei tentativi di download quando l'hedging è attivo (i chiamanti attendono con un timeout)."""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=4 * MAX_WORKERS, thread_name_prefix="hedge")
+    return _hedge_executor
+
+def _submit_attempt(url: str, deadline: Optional[float]) -> Future:
+    """Avvia un tentativo di download nel pool dei tentativi."""
+    return _attempts_executor().submit(profiling.bind(
+        lambda: http_cache.get_cache().fetch(url, headers=HEADERS, timeout=_request_timeout(deadline))
+    ))
+
+def _release_after(futures: List[Future], semaphore: threading.BoundedSemaphore, count: int) -> None:
+    """Libera semaphore quando count dei tentativi in futures sono terminati."""
+    state = {"left": count}
+    lock = threading.Lock()
+    
+    def done(_):
+        with lock:
+            state["left"] -= 1
+            release = state["left"] == 0
+        if release:
+            semaphore.release()
+    
+    for future in futures:
+        future.add_done_callback(done)
+
+def _fetch_hedged(url: str, deadline: Optional[float], semaphore: threading.BoundedSemaphore) -> http_cache.CachedPage:
     """
-    Scarica una pagina web e restituisce un oggetto BeautifulSoup.
+    Scarica la pagina; se dopo HEDGE_AFTER secondi la risposta non è ancora
+    arrivata invia una seconda richiesta identica e usa la prima che
+    risponde.
+    
+    I duplicati non attendono il limite per host, che durante il fan-out è
+    sempre occupato, ma ne hanno uno proprio (HEDGE_MAX_PER_HOST): se è
+    esaurito la richiesta lenta non viene duplicata. Il posto nel limite
+    per host si libera appena un tentativo termina, quello dei duplicati
+    quando terminano entrambi: il tentativo perdente, che non si può
+    interrompere, conta come duplicato e non rallenta le altre pagine.
+    """
+    try:
+        primary = _submit_attempt(url, deadline)
+    except BaseException:
+        semaphore.release()
+        raise
+    attempts = [primary]
+    remaining = _remaining(deadline)
+    delay = HEDGE_AFTER if remaining is None else max(0.0, min(HEDGE_AFTER, remaining))
+    done, _ = wait(attempts, timeout=delay)
+    hedges = _host_semaphore(url, _hedge_semaphores, HEDGE_MAX_PER_HOST) if HEDGE_MAX_PER_HOST > 0 else None
+    if not done and hedges is not None and hedges.acquire(blocking=False):
+        try:
+            attempts.append(_submit_attempt(url, deadline))
+        except BaseException:
+            hedges.release()
+    _release_after(attempts, semaphore, 1)
+    if len(attempts) > 1:
+        _release_after(attempts, hedges, 2)
+    
+    pending = set(attempts)
+    error = None
+    while pending:
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(url)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if len(attempts) > 1:
+                    metrics.HEDGED_REQUESTS.labels("hedge" if future is attempts[1] else "primary").inc()
+                return future.result()
+            error = future.exception()
+    raise error
+
+def _download(url: str, deadline: Optional[float] = None) -> Optional[http_cache.CachedPage]:
+    """
+    Scarica una pagina passando dalla cache HTTP su disco.
     
     Args:
         url: URL della pagina da scaricare
+        deadline: Scadenza in time.monotonic(): l'attesa del limite per host
+            e il timeout della richiesta non la superano
         
     Returns:
-        BeautifulSoup object
+        CachedPage con il testo della pagina, o None in caso di errore
+        
+    Raises:
+        DeadlineExceeded: se la scadenza passa prima della risposta
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    semaphore = _host_semaphore(url)
+    remaining = _remaining(deadline)
+    if remaining is not None and (remaining <= 0 or not semaphore.acquire(timeout=remaining)):
+        raise DeadlineExceeded(url)
+    if remaining is None:
+        semaphore.acquire()
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        return BeautifulSoup(response.text, 'html.parser')
+        if HEDGE_AFTER > 0:
+            return _fetch_hedged(url, deadline, semaphore)
+        try:
+            return http_cache.get_cache().fetch(url, headers=HEADERS, timeout=_request_timeout(deadline))
+        finally:
+            semaphore.release()
     except requests.RequestException as e:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded(url) from e
         print(f"Errore nel caricare {url}: {e}")
         return None
 
+def get_page(url: str, page_type: Optional[str] = None) -> BeautifulSoup:
+    """
+    Scarica una pagina web e restituisce un oggetto BeautifulSoup.
+    
+    Args:
+        url: URL della pagina da scaricare
+        page_type: parsing.LISTING / parsing.TICKET per analizzare solo i
+            sottoalberi usati dal relativo estrattore (default: albero completo)
+        
+    Returns:
+        BeautifulSoup object
+    """
+    page = _download(url)
+    if page is None:
+        return None
+    return parsing.make_soup(page.text, page_type)
+
+def _map_concurrently(func, items: List[Any], max_workers: Optional[int] = None,
+                      deadline: Optional[float] = None) -> List[Any]:
+    """
+    Applica func a ogni elemento con un pool di thread limitato, mantenendo l'ordine.
+    
+    Con una scadenza func riceve anche deadline, e al posto del risultato
+    degli elementi non completati in tempo c'è un'istanza di DeadlineExceeded.
+    """
+    if not items:
+        return []
+    
+    workers = min(max_workers or MAX_WORKERS, len(items))
+    if deadline is None:
+        if workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(profiling.bind(func), items))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    task = profiling.bind(func)
+    futures = [executor.submit(task, item, deadline) for item in items]
+    wait(futures, timeout=max(0.0, _remaining(deadline)))
+    # I download ancora in corso terminano entro il loro timeout, già limitato alla scadenza
+    executor.shutdown(wait=False, cancel_futures=True)
+    results = []
+    for future in futures:
+        if not future.done() or future.cancelled():
+            results.append(DeadlineExceeded())
+        elif isinstance(future.exception(), DeadlineExceeded):
+            results.append(future.exception())
+        else:
+            results.append(future.result())
+    return results
+
+def fetch_pages(urls: List[str], max_workers: Optional[int] = None) -> List[Optional[BeautifulSoup]]:
+    """
+    Scarica più pagine in parallelo con un pool di thread limitato.
+    
+    Il numero di richieste contemporanee verso lo stesso host resta comunque
+    limitato da PER_HOST_CONCURRENCY.
+    
+    Args:
+        urls: Lista di URL da scaricare
+        max_workers: Dimensione del pool (default: MAX_WORKERS)
+        
+    Returns:
+        Lista di BeautifulSoup (o None in caso di errore) nello stesso ordine degli URL
+    """
+    return _map_concurrently(get_page, urls, max_workers=max_workers)
+
+def _class_matches(tag: Tag, pattern) -> bool:
+    """
+    Verifica la classe di un tag con la stessa semantica di find(class_=pattern):
+    ogni singola classe e poi l'intero attributo class.
+    """
+    classes = tag.get('class')
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        return pattern.search(classes) is not None
+    for css_class in classes:
+        if pattern.search(css_class):
+            return True
+    return len(classes) > 1 and pattern.search(' '.join(classes)) is not None
+
+def _has_class(tag: Tag, name: str) -> bool:
+    """Equivalente di find(class_=name) con una stringa."""
+    classes = tag.get('class')
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        return classes == name
+    return name in classes or ' '.join(classes) == name
+
+def _string_matches(tag: Tag, pattern) -> bool:
+    """Equivalente di find(string=pattern): confronta tag.string."""
+    string = tag.string
+    return string is not None and pattern.search(string) is not None
+
+def _subtree_end(tag: Tag):
+    """Primo nodo, in ordine di documento, che segue il sottoalbero di tag (None a fine documento)."""
+    node = tag
+    while node is not None:
+        if node.next_sibling is not None:
+            return node.next_sibling
+        node = node.parent
+    return None
+
+class _TicketDay:
+    """Stato di un blocco "media mbm" durante la visita della pagina del ticket."""
+    __slots__ = ('end', 'media_left', 'left_end', 'weekday', 'day', 'month',
+                 'media_body', 'body_end', 'times')
+
+    def __init__(self, elem: Tag):
+        self.end = _subtree_end(elem)
+        self.media_left = self.left_end = None
+        self.weekday = self.day = self.month = None
+        self.media_body = self.body_end = None
+        self.times = []
+
+@metrics.timed(metrics.EXTRACT_SECONDS, parsing.TICKET)
 def extract_dates_and_times_from_ticket_page(soup: BeautifulSoup) -> List[Dict[str, Any]]:
     """
     Estrae date e orari dalla pagina dettagliata del ticket.
@@ -48,6 +365,9 @@ def extract_dates_and_times_from_ticket_page(soup: BeautifulSoup) -> List[Dict[s
     - <div class="media-left"> contiene: weekday, day, month
     - <div class="media-body"> contiene: pulsanti <button class="btn-fab c"> con gli orari
     
+    La pagina viene visitata una sola volta: ogni nodo aggiorna i blocchi
+    "media mbm" aperti che lo contengono.
+    
     Args:
         soup: BeautifulSoup object della pagina del ticket
         
@@ -59,43 +379,74 @@ def extract_dates_and_times_from_ticket_page(soup: BeautifulSoup) -> List[Dict[s
     if soup is None:
         return dates_times
     
-    # Cerca tutti i div con classe "media mbm" che rappresentano un giorno
-    media_elements = soup.find_all('div', class_=re.compile(r'media.*mbm', re.I))
+    days = []
+    open_days = []
     
-    # Converti mese in numero
-    month_map = {
-        'GEN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
-        'MAG': '05', 'GIU': '06', 'LUG': '07', 'AGO': '08',
-        'SET': '09', 'OTT': '10', 'NOV': '11', 'DIC': '12'
-    }
+    for node in soup.descendants:
+        # Chiudi i blocchi il cui sottoalbero è terminato
+        while open_days and node is open_days[-1].end:
+            open_days.pop()
+        for day in open_days:
+            if node is day.left_end:
+                day.left_end = False
+            if node is day.body_end:
+                day.body_end = False
+        
+        if type(node) is not Tag:
+            continue
+        name = node.name
+        
+        if open_days:
+            if name == 'span':
+                for day in open_days:
+                    if day.media_left is None or day.left_end is False:
+                        continue
+                    if day.weekday is None and _has_class(node, 'weekday'):
+                        day.weekday = node
+                    if day.day is None and _has_class(node, 'day'):
+                        day.day = node
+                    if day.month is None and _has_class(node, 'month'):
+                        day.month = node
+            elif name == 'button':
+                if _class_matches(node, BTN_FAB_RE):
+                    text = None
+                    for day in open_days:
+                        if day.media_body is None or day.body_end is False:
+                            continue
+                        if text is None:
+                            text = node.get_text(strip=True)
+                        day.times.append(text)
+            elif name == 'div':
+                for day in open_days:
+                    if day.media_left is None and _has_class(node, 'media-left'):
+                        day.media_left = node
+                        day.left_end = _subtree_end(node)
+                    if day.media_body is None and _has_class(node, 'media-body'):
+                        day.media_body = node
+                        day.body_end = _subtree_end(node)
+        
+        if name == 'div' and _class_matches(node, MEDIA_DAY_RE):
+            day = _TicketDay(node)
+            days.append(day)
+            open_days.append(day)
+    
+    # Anno corrente; se il mese è già passato la data è dell'anno prossimo
+    now = datetime.now()
     
     # Usa un dict per raggruppare per data (evita duplicati)
     dates_dict = {}
     
-    for media_elem in media_elements:
-        # Estrai la data da media-left
-        media_left = media_elem.find('div', class_='media-left')
-        if not media_left:
-            continue
-        
-        weekday_elem = media_left.find('span', class_='weekday')
-        day_elem = media_left.find('span', class_='day')
-        month_elem = media_left.find('span', class_='month')
-        
-        if not (weekday_elem and day_elem and month_elem):
+    for day in days:
+        if day.media_left is None or not (day.weekday and day.day and day.month):
             continue
         
-        day_name = weekday_elem.get_text(strip=True)
-        day_num = day_elem.get_text(strip=True)
-        month = month_elem.get_text(strip=True)
+        day_name = day.weekday.get_text(strip=True)
+        day_num = day.day.get_text(strip=True)
+        month = day.month.get_text(strip=True)
         
-        # Converti mese
-        month_num = month_map.get(month.upper(), '01')
+        month_num = MONTH_MAP.get(month.upper(), '01')
         
-        # Costruisci la data (anno corrente)
-        current_year = datetime.now().year
-        now = datetime.now()
-        # Se il mese è passato rispetto ad oggi, probabilmente è dell'anno prossimo
+        current_year = now.year
         if int(month_num) < now.month:
             current_year += 1
         elif int(month_num) == now.month and int(day_num) < now.day:
@@ -103,23 +454,16 @@ def extract_dates_and_times_from_ticket_page(soup: BeautifulSoup) -> List[Dict[s
         
         date_str = f"{current_year}-{month_num}-{day_num.zfill(2)}"
         
-        # Estrai gli orari da media-body
-        media_body = media_elem.find('div', class_='media-body')
+        # Tieni solo gli orari validi nel formato HH:MM
         times = []
-        
-        if media_body:
-            # Cerca tutti i pulsanti con orari
-            time_buttons = media_body.find_all('button', class_=re.compile(r'btn-fab', re.I))
-            for btn in time_buttons:
-                btn_text = btn.get_text(strip=True)
-                # Estrai orari nel formato HH:MM
-                if re.match(r'\d{1,2}:\d{2}', btn_text):
-                    try:
-                        h, m = map(int, btn_text.split(':'))
-                        if 0 <= h < 24 and 0 <= m < 60:
-                            times.append(btn_text)
-                    except:
-                        continue
+        for btn_text in day.times:
+            if TIME_BUTTON_RE.match(btn_text):
+                try:
+                    h, m = map(int, btn_text.split(':'))
+                    if 0 <= h < 24 and 0 <= m < 60:
+                        times.append(btn_text)
+                except:
+                    continue
         
         # Raggruppa per data (unisce orari se stessa data appare più volte)
         if date_str in dates_dict:
@@ -155,9 +499,8 @@ def extract_times_from_text(text: str) -> List[str]:
     Returns:
         Lista di orari nel formato HH.MM
     """
-    # Pattern per trovare orari nel formato HH.MM o HH:MM
-    time_pattern = r'\b(\d{1,2}[.:]\d{2})\b'
-    matches = re.findall(time_pattern, text)
+    # Orari nel formato HH.MM o HH:MM
+    matches = TIME_IN_TEXT_RE.findall(text)
     
     # Pulisci gli orari e normalizza il formato
     cleaned_times = []
@@ -183,101 +526,151 @@ def extract_times_from_text(text: str) -> List[str]:
     
     return cleaned_times
 
-def extract_film_data(soup: BeautifulSoup, cinema_name: str) -> List[Dict[str, Any]]:
+class _FilmBlock:
+    """Stato di un blocco "header-scheda" durante la visita della pagina del cinema."""
+    __slots__ = ('section', 'end', 'streaming', 'title_elem', 'schedule_elem', 'schedule_end',
+                 'sala_span', 'time_span_text', 'ticket_href_elem', 'ticket_text_elem')
+
+    def __init__(self, section: Tag, streaming: bool):
+        self.section = section
+        self.end = _subtree_end(section)
+        self.streaming = streaming
+        self.title_elem = None
+        self.schedule_elem = self.schedule_end = None
+        self.sala_span = None
+        self.time_span_text = None
+        self.ticket_href_elem = None
+        self.ticket_text_elem = None
+
+def _scan_film_blocks(soup: BeautifulSoup):
     """
-    Estrae i dati dei film dalla pagina HTML.
+    Visita la pagina una sola volta raccogliendo, per ogni blocco "header-scheda",
+    gli elementi che servono all'estrazione (il primo di ogni tipo, come find()).
+    
+    Returns:
+        Tupla (blocchi in ordine di documento, primo <h2> "Film in programmazione")
+    """
+    blocks = []
+    open_blocks = []
+    heading = None
+    
+    for node in soup.descendants:
+        # Chiudi i blocchi il cui sottoalbero è terminato
+        while open_blocks and node is open_blocks[-1].end:
+            open_blocks.pop()
+        for block in open_blocks:
+            if node is block.schedule_end:
+                block.schedule_end = False
+        
+        if type(node) is not Tag:
+            continue
+        name = node.name
+        
+        if open_blocks:
+            if name == 'a':
+                for block in open_blocks:
+                    if block.title_elem is None and _class_matches(node, TITLE_RE):
+                        block.title_elem = node
+                    if block.ticket_href_elem is None:
+                        href = node.get('href')
+                        if href is not None and TICKET_HREF_RE.search(href):
+                            block.ticket_href_elem = node
+                    if block.ticket_text_elem is None and _string_matches(node, TICKET_TEXT_RE):
+                        block.ticket_text_elem = node
+            elif name == 'span':
+                for block in open_blocks:
+                    if block.schedule_elem is None or block.schedule_end is False:
+                        continue
+                    if block.sala_span is None and _string_matches(node, SALA_RE):
+                        block.sala_span = node
+                    if block.time_span_text is None:
+                        span_text = node.get_text(strip=True)
+                        if TIME_LIKE_RE.search(span_text):
+                            block.time_span_text = span_text
+            elif name == 'div':
+                for block in open_blocks:
+                    if block.schedule_elem is None and _class_matches(node, SCHEDULE_RE):
+                        block.schedule_elem = node
+                        block.schedule_end = _subtree_end(node)
+        
+        if name == 'div':
+            if _class_matches(node, FILM_BLOCK_RE):
+                block = _FilmBlock(node, _class_matches(node, FILM_SECTION_RE))
+                blocks.append(block)
+                open_blocks.append(block)
+        elif name == 'h2' and heading is None and _string_matches(node, FILM_HEADING_RE):
+            heading = node
+    
+    return blocks, heading
+
+@metrics.timed(metrics.EXTRACT_SECONDS, parsing.LISTING)
+def _parse_film_listing(soup: BeautifulSoup) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Estrae i film dalla pagina del cinema senza scaricare le pagine dei ticket.
     
     Args:
         soup: BeautifulSoup object della pagina
-        cinema_name: Nome del cinema
         
     Returns:
-        Lista di dizionari con i dati dei film
+        Lista di coppie (dati del film, link alla pagina del ticket o None)
     """
     films = []
     
     if soup is None:
         return films
     
-    # Cerca tutte le sezioni film usando la classe specifica identificata
+    blocks, film_heading = _scan_film_blocks(soup)
+    
     # Ogni film è in un div con classe "header-scheda streaming min no-bg container-fluid pbl"
-    film_sections = soup.find_all('div', class_=re.compile(r'header-scheda.*streaming', re.I))
-    
-    # Se non trova con quella classe, prova a cercare in modo diverso
-    if not film_sections:
-        # Cerca la sezione "Film in programmazione" e poi tutti i div seguenti
-        film_heading = soup.find('h2', string=re.compile(r'Film in programmazione', re.I))
-        if film_heading:
-            # Trova il section parent
-            section = film_heading.find_parent('section')
-            if section:
-                film_sections = section.find_all('div', class_=re.compile(r'header-scheda', re.I))
+    film_blocks = [block for block in blocks if block.streaming]
+    
+    # Se non trova con quella classe, usa i blocchi "header-scheda" della sezione "Film in programmazione"
+    if not film_blocks and film_heading:
+        section = film_heading.find_parent('section')
+        if section:
+            film_blocks = [block for block in blocks
+                           if any(parent is section for parent in block.section.parents)]
     
     # Processa ogni sezione film trovata
-    for section in film_sections:
-        # Estrai il titolo del film - è in un <a> con classe "tit_olo h1"
-        title_elem = section.find('a', class_=re.compile(r'tit_olo', re.I))
-        
-        if not title_elem:
+    for block in film_blocks:
+        # Il titolo del film è in un <a> con classe "tit_olo h1"
+        if not block.title_elem:
             continue
         
-        title = title_elem.get_text(strip=True)
+        title = block.title_elem.get_text(strip=True)
         
         if not title:
             continue
         
-        # Estrai gli orari e la sala
-        # Gli orari sono in un div con classe "cs-btn col primary ico sala"
-        schedule_elem = section.find('div', class_=re.compile(r'cs-btn.*sala', re.I))
-        
+        # Orari e sala sono in un div con classe "cs-btn col primary ico sala"
         times = []
         sala_info = None
         
-        if schedule_elem:
-            # Estrai la sala (prima dello span con clock)
-            sala_span = schedule_elem.find('span', string=re.compile(r'Sala', re.I))
-            if sala_span:
-                sala_text = sala_span.get_text(strip=True)
-                # Estrai "Sala X | Posti Y" o solo "Sala X"
-                sala_match = re.search(r'Sala\s+(\d+)[^|]*', sala_text)
+        if block.schedule_elem:
+            # Estrai "Sala X | Posti Y" o solo "Sala X"
+            if block.sala_span:
+                sala_match = SALA_NUMBER_RE.search(block.sala_span.get_text(strip=True))
                 if sala_match:
                     sala_info = f"Sala {sala_match.group(1)}"
             
-            # Estrai gli orari (dallo span con icona clock o qualsiasi span con orari)
-            spans = schedule_elem.find_all('span')
-            schedule_text = ""
-            
-            # Cerca lo span con gli orari (di solito il secondo span o quello con icona clock)
-            for span in spans:
-                span_text = span.get_text(strip=True)
-                # Se contiene pattern di orari, è quello che cerchiamo
-                if re.search(r'\d{1,2}[.:]\d{2}', span_text):
-                    schedule_text = span_text
-                    break
-            
-            # Se non trova in uno span specifico, prendi tutto il testo del div
-            if not schedule_text:
-                schedule_text = schedule_elem.get_text(strip=True)
+            # Lo span con gli orari, altrimenti tutto il testo del div
+            schedule_text = block.time_span_text or block.schedule_elem.get_text(strip=True)
             
             if schedule_text:
                 times = extract_times_from_text(schedule_text)
         
         # Se non ha trovato orari, prova a cercare in tutto il testo della sezione
         if not times:
-            all_text = section.get_text()
+            all_text = block.section.get_text()
             times = extract_times_from_text(all_text)
             # Cerca anche la sala nel testo completo
-            sala_match = re.search(r'Sala\s+(\d+)', all_text)
+            sala_match = SALA_IN_TEXT_RE.search(all_text)
             if sala_match:
                 sala_info = f"Sala {sala_match.group(1)}"
         
-        # Cerca il link "Acquista biglietto e vedi tutte le date"
+        # Link "Acquista biglietto e vedi tutte le date": per href, poi per testo
         ticket_link = None
-        # Prova prima con una ricerca per href che contiene "ticket"
-        ticket_elem = section.find('a', href=re.compile(r'ticket', re.I))
-        if not ticket_elem:
-            # Prova a cercare per testo (potrebbe essere su più righe)
-            ticket_elem = section.find('a', string=re.compile(r'Acquista.*biglietto', re.I))
+        ticket_elem = block.ticket_href_elem or block.ticket_text_elem
         
         if ticket_elem:
             ticket_href = ticket_elem.get('href', '')
@@ -290,41 +683,172 @@ def extract_film_data(soup: BeautifulSoup, cinema_name: str) -> List[Dict[str, A
                 else:
                     ticket_link = f"https://www.comingsoon.it{ticket_href}"
         
-        # Se c'è il link, scrapa la pagina dettagliata per date e orari
-        programmazione = []
-        if ticket_link:
-            print(f"  Scraping pagina dettagliata per '{title}'...")
-            ticket_soup = get_page(ticket_link)
-            if ticket_soup:
-                programmazione = extract_dates_and_times_from_ticket_page(ticket_soup)
-        
         # Crea struttura dati per il film
-        if title:  # Aggiungi anche se non ci sono orari (potrebbe essere programmazione futura)
-            film_data = {
-                "titolo": title,
-                "orari": times if times else [],  # Orari dalla pagina principale (per retrocompatibilità)
-                "sala": sala_info,
-                "programmazione": programmazione if programmazione else []  # Date e orari dettagliati
-            }
-            films.append(film_data)
+        # (la programmazione viene riempita dopo, scaricando le pagine dei ticket in parallelo)
+        film_data = {
+            "titolo": title,
+            "orari": times if times else [],  # Orari dalla pagina principale (per retrocompatibilità)
+            "sala": sala_info,
+            "programmazione": []  # Date e orari dettagliati
+        }
+        films.append((film_data, ticket_link))
     
     return films
 
-def scrape_cinema(url: str, cinema_name: str) -> Dict[str, Any]:
+def _fetch_programmazione(entries: List[Tuple[Dict[str, Any], Optional[str]]],
+                          max_workers: Optional[int] = None,
+                          deadline: Optional[float] = None) -> None:
+    """
+    Scarica in parallelo le pagine dei ticket e riempie la programmazione dei film.
+    
+    Args:
+        entries: Coppie (dati del film, link al ticket) prodotte da _parse_film_listing
+        max_workers: Dimensione del pool (default: MAX_WORKERS)
+        deadline: Scadenza in time.monotonic(): i film la cui pagina non è
+            arrivata in tempo restano con gli orari di oggi e INCOMPLETE
+    """
+    pending = [(film, link) for film, link in entries if link]
+    for film, _ in pending:
+        print(f"  Scraping pagina dettagliata per '{film['titolo']}'...")
+    
+    results = _map_concurrently(_scrape_ticket_page, [link for _, link in pending],
+                                max_workers=max_workers, deadline=deadline)
+    for (film, _), programmazione in zip(pending, results):
+        if isinstance(programmazione, DeadlineExceeded):
+            film[INCOMPLETE] = True
+            metrics.INCOMPLETE_PAGES.labels(parsing.TICKET).inc()
+        elif programmazione:
+            film["programmazione"] = programmazione
+
+def _parse_listing_html(html: str) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Analizza il testo della pagina di un cinema con la strategia di parsing configurata.
+    
+    Il parsing parziale conserva solo i blocchi "header-scheda": se mancano
+    quelli "streaming" serve la ricerca alternativa per sezione, quindi la
+    pagina viene rianalizzata per intero.
+    """
+    soup = parsing.make_soup(html, parsing.LISTING)
+    if (parsing.resolve_strategy(parsing.LISTING) == "strained"
+            and not soup.find('div', class_=FILM_SECTION_RE)):
+        soup = parsing.make_soup(html)
+    return _parse_film_listing(soup)
+
+def _scrape_listing_page(url: str, deadline: Optional[float] = None) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Scarica e analizza la pagina di un cinema, riusando il parsing se la pagina non è cambiata.
+    
+    Returns:
+        Coppie (dati del film, link al ticket) come _parse_film_listing
+        
+    Raises:
+        DeadlineExceeded: se la pagina non arriva entro la scadenza
+    """
+    page = _download(url, deadline)
+    if page is None:
+        return []
+    
+    entries = http_cache.get_cache().parsed(page, "listing", _parse_listing_html)
+    return [(film, link) for film, link in entries]
+
+def _scrape_ticket_page(url: str, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Scarica e analizza la pagina di un ticket, riusando il parsing se la pagina non è cambiata.
+    
+    L'anno delle date dipende dal giorno corrente, quindi il risultato è
+    riutilizzabile solo all'interno della stessa giornata.
+    
+    Raises:
+        DeadlineExceeded: se la pagina non arriva entro la scadenza
+    """
+    page = _download(url, deadline)
+    if page is None:
+        return []
+    
+    return http_cache.get_cache().parsed(
+        page, f"ticket-{datetime.now().date().isoformat()}",
+        lambda text: extract_dates_and_times_from_ticket_page(parsing.make_soup(text, parsing.TICKET))
+    )
+
+def extract_film_data(soup: BeautifulSoup, cinema_name: str,
+                      max_workers: Optional[int] = None,
+                      deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Estrae i dati dei film dalla pagina HTML.
+    
+    Le pagine dettagliate dei ticket vengono scaricate in parallelo; l'ordine
+    dei film resta quello della pagina del cinema.
+    
+    Args:
+        soup: BeautifulSoup object della pagina
+        cinema_name: Nome del cinema
+        max_workers: Dimensione del pool per le pagine dei ticket (default: MAX_WORKERS)
+        deadline: Scadenza in time.monotonic() (vedi deadline_after); i film
+            senza pagina del ticket entro la scadenza hanno INCOMPLETE
+        
+    Returns:
+        Lista di dizionari con i dati dei film
+    """
+    entries = _parse_film_listing(soup)
+    _fetch_programmazione(entries, max_workers=max_workers, deadline=deadline)
+    return [film for film, _ in entries]
+
+def film_slug(title: str) -> str:
+    """Identificativo di un film nell'URL, es. "Una battaglia dopo l'altra" -> "una-battaglia-dopo-l-altra"."""
+    ascii_title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', ascii_title.lower()).strip('-')
+
+def _today_programmazione(film: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Programmazione di oggi ricavata dagli orari della pagina del cinema."""
+    if not film["orari"]:
+        return []
+    today = datetime.now().date()
+    return [{
+        "data": today.isoformat(),
+        "giorno": WEEKDAYS[today.weekday()],
+        "orari": [time.replace('.', ':') for time in film["orari"]],
+    }]
+
+def _apply_details(entries: List[Tuple[Dict[str, Any], Optional[str]]], details: str,
+                   max_workers: Optional[int] = None, deadline: Optional[float] = None) -> None:
+    """Riempie la programmazione dei film secondo il livello di dettaglio."""
+    if details not in DETAILS:
+        raise ValueError(f"Livello di dettaglio sconosciuto: {details}")
+    if details == DETAILS_ALL:
+        _fetch_programmazione(entries, max_workers=max_workers, deadline=deadline)
+    elif details == DETAILS_TODAY:
+        for film, _ in entries:
+            film["programmazione"] = _today_programmazione(film)
+
+def _incomplete_cinema(cinema_name: str, url: str) -> Dict[str, Any]:
+    """Cinema la cui pagina non è arrivata entro la scadenza."""
+    metrics.INCOMPLETE_PAGES.labels(parsing.LISTING).inc()
+    return {"cinema": cinema_name, "url": url, "film": [], INCOMPLETE: True}
+
+def scrape_cinema(url: str, cinema_name: str, details: str = DETAILS_ALL,
+                  deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Scrape i dati di un singolo cinema.
     
     Args:
         url: URL della pagina del cinema
         cinema_name: Nome del cinema
+        details: DETAILS_NONE o DETAILS_TODAY per fermarsi alla pagina del
+            cinema (una sola richiesta), DETAILS_ALL per tutte le date
+        deadline: Scadenza in time.monotonic() (vedi deadline_after): allo
+            scadere il risultato è parziale, con INCOMPLETE sui film (o sul
+            cinema) rimasti senza dati
         
     Returns:
         Dizionario con i dati del cinema
     """
     print(f"Scraping {cinema_name}...")
-    soup = get_page(url)
-    
-    films = extract_film_data(soup, cinema_name)
+    try:
+        entries = _scrape_listing_page(url, deadline)
+    except DeadlineExceeded:
+        return _incomplete_cinema(cinema_name, url)
+    _apply_details(entries, details, deadline=deadline)
+    films = [film for film, _ in entries]
     
     return {
         "cinema": cinema_name,
@@ -332,140 +856,349 @@ def scrape_cinema(url: str, cinema_name: str) -> Dict[str, Any]:
         "film": films
     }
 
-def format_telegram_message(data: Dict[str, Any]) -> str:
-    """Format Telegram message grouped by film with compact date ranges."""
-    from collections import defaultdict, OrderedDict
-    from datetime import datetime as dt_class
-
-    lines = ["🎬 FILM IN PROGRAMMAZIONE - MATERA\n"]
+def scrape_film(url: str, cinema_name: str, slug: str,
+                deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Scrape la programmazione completa di un solo film di un cinema.
+    
+    Args:
+        url: URL della pagina del cinema
+        cinema_name: Nome del cinema
+        slug: Identificativo del film (film_slug del titolo)
+        deadline: Scadenza in time.monotonic(); se la pagina del ticket non
+            arriva in tempo il film ha INCOMPLETE
+        
+    Returns:
+        Dati del film con "cinema" e la programmazione di tutte le date,
+        None se il film non è in programmazione nel cinema
+        
+    Raises:
+        DeadlineExceeded: se la pagina del cinema non arriva entro la scadenza
+    """
+    for film, link in _scrape_listing_page(url, deadline):
+        if film_slug(film["titolo"]) == slug:
+            print(f"Scraping {film['titolo']} ({cinema_name})...")
+            _fetch_programmazione([(film, link)], max_workers=1, deadline=deadline)
+            return dict(film, cinema=cinema_name)
+    return None
 
-    cinema_short_names = {
-        "Cinema Comunale Guerrieri": "Guerrieri",
-        "Il Piccolo": "Piccolo",
-        "UCI Cinemas Red Carpet": "Red Carpet",
+def _shard_settings() -> Dict[str, Any]:
+    """Configurazione del processo corrente da replicare nei processi degli shard."""
+    cache = http_cache.get_cache()
+    return {
+        "per_host": PER_HOST_CONCURRENCY,
+        "cache": (cache.directory, cache.ttl),
+        "transport": http_client.get_transport(),
     }
 
-    mesi_italiano = {
-        '01': 'gennaio', '02': 'febbraio', '03': 'marzo', '04': 'aprile',
-        '05': 'maggio', '06': 'giugno', '07': 'luglio', '08': 'agosto',
-        '09': 'settembre', '10': 'ottobre', '11': 'novembre', '12': 'dicembre'
-    }
+def _init_shard_process(settings: Dict[str, Any]) -> None:
+    """Inizializza un processo degli shard con la configurazione del processo principale."""
+    global PER_HOST_CONCURRENCY
+    PER_HOST_CONCURRENCY = settings["per_host"]
+    http_cache.configure(*settings["cache"])
+    http_client.set_transport(**settings["transport"])
 
-    def format_date(date_str: str) -> str:
-        anno, mese, giorno = date_str.split('-')
-        return f"{int(giorno)} {mesi_italiano.get(mese, mese)}"
-
-    def format_range(start_date: str, end_date: str) -> str:
-        if start_date == end_date:
-            return format_date(start_date)
-        a_y, a_m, a_d = start_date.split('-')
-        b_y, b_m, b_d = end_date.split('-')
-        if a_y == b_y and a_m == b_m:
-            return f"{int(a_d)}-{int(b_d)} {mesi_italiano.get(a_m, a_m)}"
-        return f"{format_date(start_date)} → {format_date(end_date)}"
-
-    films = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-    film_meta = {}
-
-    for cinema in data.get('cinema', []):
-        cinema_name = cinema.get('cinema', '')
-        cinema_short = cinema_short_names.get(cinema_name, cinema_name)
-        for film in cinema.get('film', []):
-            title = film.get('titolo')
-            if not title:
-                continue
-            imdb_id = film.get('imdb')
-            imdb_url = film.get('imdb_url')
-            if imdb_url:
-                film_meta.setdefault(title, {})['imdb_url'] = imdb_url
-            elif imdb_id:
-                film_meta.setdefault(title, {})['imdb_url'] = f"https://www.imdb.com/title/{imdb_id}/"
-
-            for prog in film.get('programmazione', []):
-                date = prog.get('data')
-                for time in prog.get('orari', []):
-                    if not date or not time:
-                        continue
-                    films[title][cinema_short][date].add(time.replace('.', ':'))
+_process_pools: Dict[str, Tuple[Tuple[int, Any], ProcessPoolExecutor]] = {}
+_process_pools_lock = threading.Lock()
 
-    for title in sorted(films):
-        imdb_url = film_meta.get(title, {}).get('imdb_url')
-        if imdb_url:
-            lines.append(f"📽️ {title} · {imdb_url}")
-        else:
-            lines.append(f"📽️ {title}")
-
-        cinema_map = films[title]
-        for cinema_short in sorted(cinema_map):
-            date_map = cinema_map[cinema_short]
-            ordered_dates = sorted(date_map)
-            normalized = OrderedDict((d, sorted(date_map[d])) for d in ordered_dates)
-
-            groups = []
-            current_start = current_end = None
-            current_times = None
-            for date in normalized:
-                times = normalized[date]
-                date_obj = dt_class.fromisoformat(date)
-                if current_times is None:
-                    current_start = current_end = date
-                    current_times = times
-                elif times == current_times and (date_obj - dt_class.fromisoformat(current_end)).days == 1:
-                    current_end = date
+def process_pool(name: str, workers: int, initializer=None, settings: Any = None) -> ProcessPoolExecutor:
+    """
+    Pool di processi condiviso dagli scraping, creato al primo uso e chiuso all'uscita.
+    
+    Avviare i processi (spawn) e reimportare bs4, lxml e requests costa più
+    del parsing di pochi cinema: il pool resta attivo tra uno scraping e
+    l'altro. Viene ricreato solo se cambiano il numero di processi o la
+    configurazione passata a initializer (settings).
+    
+    Args:
+        name: Uso del pool (es. "shards"), ognuno con il proprio pool
+        workers: Numero di processi
+        initializer: Funzione eseguita all'avvio di ogni processo, con settings
+        settings: Configurazione da passare a initializer
+    """
+    key = (workers, settings)
+    with _process_pools_lock:
+        current = _process_pools.get(name)
+        if current is not None and current[0] == key:
+            return current[1]
+        if current is not None:
+            # Gli scraping che lo stanno usando terminano normalmente
+            current[1].shutdown(wait=False)
+        # spawn: i processi non ereditano thread, lock e connessioni aperte dal server
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=initializer, initargs=() if initializer is None else (settings,))
+        _process_pools[name] = (key, pool)
+        return pool
+
+def discard_process_pool(name: str, pool: ProcessPoolExecutor) -> None:
+    """Scarta un pool di process_pool non più utilizzabile (es. un processo è terminato)."""
+    with _process_pools_lock:
+        current = _process_pools.get(name)
+        if current is not None and current[1] is pool:
+            del _process_pools[name]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@atexit.register
+def _shutdown_process_pools() -> None:
+    with _process_pools_lock:
+        pools = [pool for _, pool in _process_pools.values()]
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+def _scrape_shard(cinema_urls: Dict[str, str], max_workers: Optional[int],
+                  details: str, expires_at: Optional[float] = None) -> List[Dict[str, Any]]:
+    # La scadenza arriva come time.time(): time.monotonic() vale solo nel processo che la calcola,
+    # e contare i secondi rimasti dall'avvio del processo ignorerebbe il tempo di spawn
+    deadline = None if expires_at is None else deadline_after(expires_at - time.time())
+    return _scrape_threaded(cinema_urls, max_workers, details, deadline)
+
+def _scrape_sharded(cinema_urls: Dict[str, str], processes: int,
+                    max_workers: Optional[int], details: str,
+                    deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Divide i cinema in uno shard per processo e ne unisce i risultati.
+    
+    Gli shard si alternano sull'ordine del registro (il primo cinema al
+    primo processo, il secondo al secondo, ...), così i cinema di una
+    stessa città finiscono in processi diversi. Ogni processo ha il suo
+    pool di thread, la sua Session e il suo limite per host: verso lo
+    stesso host arrivano fino a processes * PER_HOST_CONCURRENCY richieste
+    contemporanee. I processi sono quelli di process_pool("shards"),
+    riusati tra uno scraping e l'altro.
+    """
+    names = list(cinema_urls)
+    shards = [{name: cinema_urls[name] for name in names[i::processes]} for i in range(processes)]
+    remaining = _remaining(deadline)
+    expires_at = None if remaining is None else time.time() + remaining
+    executor = process_pool("shards", processes, _init_shard_process, _shard_settings())
+    try:
+        futures = [
+            executor.submit(_scrape_shard, shard, max_workers, details, expires_at)
+            for shard in shards
+        ]
+        # Con una scadenza i download rimasti in sospeso in un processo
+        # terminano entro il loro timeout, già limitato alla scadenza
+        results = {cinema["cinema"]: cinema for future in futures for cinema in future.result()}
+    except BrokenProcessPool:
+        discard_process_pool("shards", executor)
+        raise
+    return [results[name] for name in names]
+
+def scrape_all_cinemas(cinema_urls: Optional[Dict[str, str]] = None,
+                       max_workers: Optional[int] = None,
+                       details: str = DETAILS_ALL,
+                       processes: Optional[int] = None,
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Scrape tutti i cinema: prima tutte le pagine dei cinema in parallelo,
+    poi tutte le pagine dei ticket in parallelo.
+    
+    Con più processi i cinema vengono divisi in shard, ognuno scaricato e
+    analizzato da un processo con il proprio pool di thread: l'analisi
+    delle pagine non è più limitata a un solo core. Con PIPELINE (e un
+    solo processo) download e parsing sono invece stadi separati, collegati
+    da una coda limitata (vedi pipeline.py).
+    
+    Con una scadenza (deadline_after) il risultato arriva entro quella:
+    i film la cui pagina del ticket non è arrivata in tempo hanno
+    INCOMPLETE e solo gli orari di oggi, i cinema senza pagina hanno
+    INCOMPLETE e nessun film.
+    
+    Args:
+        cinema_urls: Dizionario nome -> URL (default: CINEMA_URLS)
+        max_workers: Dimensione del pool di thread di ogni processo, o dei
+            fetcher della pipeline (default: MAX_WORKERS, 1 = seriale)
+        details: Livello di dettaglio della programmazione (vedi DETAILS)
+        processes: Numero di processi (default: PROCESSES, 1 = solo il processo corrente)
+        deadline: Scadenza in time.monotonic() (default: nessuna)
+        
+    Returns:
+        Lista di dizionari con i dati dei cinema, nello stesso ordine di cinema_urls
+    """
+    if cinema_urls is None:
+        cinema_urls = CINEMA_URLS
+    
+    processes = min(processes or PROCESSES, len(cinema_urls))
+    if processes > 1:
+        return _scrape_sharded(cinema_urls, processes, max_workers, details, deadline)
+    if PIPELINE:
+        import pipeline  # pipeline importa scraper
+        return pipeline.scrape_all(cinema_urls, details=details, fetchers=max_workers, deadline=deadline)
+    return _scrape_threaded(cinema_urls, max_workers, details, deadline)
+
+def _scrape_threaded(cinema_urls: Dict[str, str], max_workers: Optional[int],
+                     details: str, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Pagine dei cinema e poi pagine dei ticket con un pool di thread, nel processo corrente."""
+    names = list(cinema_urls)
+    listings = _map_concurrently(_scrape_listing_page, [cinema_urls[name] for name in names],
+                                 max_workers=max_workers, deadline=deadline)
+    
+    cinemas = []
+    all_entries = []
+    for cinema_name, entries in zip(names, listings):
+        print(f"Scraping {cinema_name}...")
+        if isinstance(entries, DeadlineExceeded):
+            cinemas.append(_incomplete_cinema(cinema_name, cinema_urls[cinema_name]))
+            continue
+        all_entries.extend(entries)
+        cinemas.append({
+            "cinema": cinema_name,
+            "url": cinema_urls[cinema_name],
+            "film": [film for film, _ in entries]
+        })
+    
+    _apply_details(all_entries, details, max_workers=max_workers, deadline=deadline)
+    return cinemas
+
+def iter_scrape(cinema_urls: Optional[Dict[str, str]] = None,
+                max_workers: Optional[int] = None,
+                deadline: Optional[float] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Scrape tutti i cinema restituendo i risultati appena sono pronti.
+    
+    Pagine dei cinema e dei ticket condividono un unico pool: le pagine dei
+    ticket di un cinema vengono richieste appena la sua pagina è stata
+    analizzata, senza attendere gli altri cinema.
+    
+    Args:
+        cinema_urls: Dizionario nome -> URL (default: CINEMA_URLS)
+        max_workers: Dimensione del pool (default: MAX_WORKERS)
+        deadline: Scadenza in time.monotonic(): come in scrape_all_cinemas,
+            i film e i cinema le cui pagine non arrivano in tempo vengono
+            restituiti alla scadenza con INCOMPLETE
+        
+    Yields:
+        ("film", {"cinema", "film"}) per ogni film con la programmazione completa,
+        ("cinema", {"cinema", "url", "film"}) quando tutti i film di un cinema
+        sono pronti (film nell'ordine della pagina). L'ordine tra film e cinema
+        diversi è quello di completamento.
+    """
+    if cinema_urls is None:
+        cinema_urls = CINEMA_URLS
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers or MAX_WORKERS))
+    scrape_listing, scrape_ticket = profiling.bind(_scrape_listing_page), profiling.bind(_scrape_ticket_page)
+    try:
+        pending = {
+            executor.submit(scrape_listing, url, deadline): ("listing", name, None)
+            for name, url in cinema_urls.items()
+        }
+        films: Dict[str, List[Dict[str, Any]]] = {}
+        remaining: Dict[str, int] = {}
+        
+        while pending:
+            remaining_time = _remaining(deadline)
+            done, _ = wait(pending, timeout=None if remaining_time is None else max(0.0, remaining_time),
+                           return_when=FIRST_COMPLETED)
+            # Scadenza passata: le pagine ancora in corso risultano mancanti
+            expired = not done
+            for future in done or list(pending):
+                kind, cinema_name, film = pending.pop(future)
+                missing = expired
+                if not expired:
+                    try:
+                        result = future.result()
+                    except DeadlineExceeded:
+                        missing = True
+                
+                if kind == "listing":
+                    print(f"Scraping {cinema_name}...")
+                    if missing:
+                        yield "cinema", _incomplete_cinema(cinema_name, cinema_urls[cinema_name])
+                        continue
+                    entries = result
+                    films[cinema_name] = [entry for entry, _ in entries]
+                    remaining[cinema_name] = 0
+                    for entry, link in entries:
+                        if link:
+                            remaining[cinema_name] += 1
+                            pending[executor.submit(scrape_ticket, link, deadline)] = ("ticket", cinema_name, entry)
+                        else:
+                            yield "film", {"cinema": cinema_name, "film": entry}
                 else:
-                    groups.append((current_start, current_end, current_times))
-                    current_start = current_end = date
-                    current_times = times
-            if current_times is not None:
-                groups.append((current_start, current_end, current_times))
-
-            for start_date, end_date, times in groups:
-                date_label = format_range(start_date, end_date)
-                orari_str = " • ".join(times)
-                lines.append(f"   📅 {date_label} · {cinema_short}")
-                lines.append(f"      🕐 {orari_str}")
-        lines.append("")
-
-    timestamp = data.get('timestamp')
-    if timestamp:
-        try:
-            dt_obj = dt_class.fromisoformat(timestamp.replace('Z', '+00:00'))
-            lines.append(f"Aggiornato il {dt_obj.strftime('%d/%m/%Y alle %H:%M')}")
-        except Exception:
-            pass
+                    if missing:
+                        film[INCOMPLETE] = True
+                        metrics.INCOMPLETE_PAGES.labels(parsing.TICKET).inc()
+                    elif result:
+                        film["programmazione"] = result
+                    remaining[cinema_name] -= 1
+                    yield "film", {"cinema": cinema_name, "film": film}
+                
+                if remaining[cinema_name] == 0:
+                    del remaining[cinema_name]
+                    yield "cinema", {
+                        "cinema": cinema_name,
+                        "url": cinema_urls[cinema_name],
+                        "film": films.pop(cinema_name),
+                    }
+    finally:
+        # Se il consumatore si interrompe (es. client disconnesso) le pagine non ancora richieste vengono scartate
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    return "\n".join(lines)
+def format_telegram_message(data: Dict[str, Any]) -> str:
+    """
+    Format Telegram message grouped by film with compact date ranges.
+
+    Per varianti (un cinema, un giorno, senza link) e per la divisione in
+    messaggi entro il limite di Telegram vedi telegram_render.
+    """
+    return telegram_render.TelegramRenderer(data).render()
+
+def city_output_file(city: str) -> str:
+    """File JSON della programmazione di una città, es. "programmazione_cinema_matera.json"."""
+    return f"programmazione_cinema_{film_slug(city)}.json"
 
 def main():
     """
-    Funzione principale che esegue lo scraping di tutti i cinema.
+    Funzione principale che esegue lo scraping di tutti i cinema del registro.
+    
+    I risultati vengono salvati in un file JSON per città; il messaggio
+    Telegram copre tutte le città, con un messaggio per città in più quando
+    il registro ne contiene più di una.
     """
-    print("Inizio scraping dei cinema di Matera...")
+    cities = registry.default().cities()
+    print(f"Inizio scraping dei cinema di {', '.join(cities)}...")
     
     all_data = {
         "timestamp": datetime.now().isoformat(),
         "cinema": []
     }
     
-    for cinema_name, url in CINEMA_URLS.items():
-        cinema_data = scrape_cinema(url, cinema_name)
+    for cinema_data in scrape_all_cinemas():
         all_data["cinema"].append(cinema_data)
-        print(f"Trovati {len(cinema_data['film'])} film per {cinema_name}")
+        print(f"Trovati {len(cinema_data['film'])} film per {cinema_data['cinema']}")
+    
+    # Confronta con l'esecuzione precedente
+    report = changes.record_run(all_data["cinema"])
+    if report is not None:
+        all_data["modifiche"] = report
+        print(f"\n{changes.format_changes(report)}")
     
-    # Salva i dati in JSON
-    output_file = "programmazione_cinema_matera.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+    # Salva i dati in JSON, un file per città
+    by_city = registry.default().partition(all_data["cinema"])
+    for city, cinemas in by_city.items():
+        city_data = {"timestamp": all_data["timestamp"], "citta": city, "cinema": cinemas}
+        if report is not None:
+            city_data["modifiche"] = changes.filter_report(report, {cinema["cinema"] for cinema in cinemas})
+        output_file = city_output_file(city)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(city_data, f, ensure_ascii=False, indent=2)
+        print(f"\nDati di {city} salvati in {output_file}")
     
-    print(f"\nDati salvati in {output_file}")
     print(f"Totale cinema: {len(all_data['cinema'])}")
     print(f"Totale film: {sum(len(c['film']) for c in all_data['cinema'])}")
     
     # Genera messaggio Telegram
-    telegram_msg = format_telegram_message(all_data)
+    renderer = telegram_render.TelegramRenderer(all_data)
+    telegram_msg = renderer.render()
     telegram_file = "messaggio_telegram.txt"
     with open(telegram_file, 'w', encoding='utf-8') as f:
         f.write(telegram_msg)
+    if len(by_city) > 1:
+        for city in by_city:
+            with open(f"messaggio_telegram_{film_slug(city)}.txt", 'w', encoding='utf-8') as f:
+                f.write(renderer.render(city=city))
     
     print(f"\nMessaggio Telegram salvato in {telegram_file}")
     print("\n" + "="*50)
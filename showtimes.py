@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indice in memoria delle proiezioni per /api/showtimes.
+
+L'indice viene costruito una volta per snapshot: tutte le proiezioni
+ordinate per data e ora (poi cinema e titolo), più gli stessi elenchi
+ordinati per cinema, per città, per data e per titolo. Una query sceglie l'elenco più
+piccolo che soddisfa i filtri e ne estrae l'intervallo orario con una
+ricerca binaria, senza scorrere la programmazione di ogni film.
+"""
+
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time
+from heapq import merge
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import models
+import registry
+from scraper import film_slug
+
+_TIME_RE = re.compile(r'(\d{1,2})[.:](\d{2})')
+
+
+def parse_clock(text: str, strict: bool = False) -> Optional[time]:
+    """
+    Orario "H:MM", "HH:MM" o "HH.MM", None se non valido.
+
+    Gli orari delle pagine possono essere seguiti da altro testo (es.
+    "19:10 VO"); con strict il testo deve essere solo l'orario.
+    """
+    match = _TIME_RE.fullmatch(text) if strict else _TIME_RE.match(text)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+class Showtime:
+    """Una proiezione: film, cinema, sala, data e ora di inizio."""
+
+    __slots__ = ("start", "cinema", "title", "slug", "room", "weekday")
+
+    def __init__(self, start: datetime, cinema: str, title: str, slug: str,
+                 room: Optional[str], weekday: Optional[str]):
+        self.start = start
+        self.cinema = cinema
+        self.title = title
+        self.slug = slug
+        self.room = room
+        self.weekday = weekday
+
+    def sort_key(self) -> Tuple[datetime, str, str]:
+        return self.start, self.cinema, self.title
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "data": self.start.date().isoformat(),
+            "giorno": self.weekday,
+            "orario": f"{self.start.hour:02d}:{self.start.minute:02d}",
+            "cinema": self.cinema,
+            "titolo": self.title,
+            "sala": self.room,
+        }
+
+
+class _Bucket:
+    """Proiezioni ordinate per inizio, con le chiavi per la ricerca binaria."""
+
+    __slots__ = ("starts", "showtimes")
+
+    def __init__(self, showtimes: Optional[List[Showtime]] = None):
+        self.showtimes: List[Showtime] = showtimes or []
+        self.starts: List[datetime] = [showtime.start for showtime in self.showtimes]
+
+    def between(self, lo: Optional[datetime], hi: Optional[datetime]) -> List[Showtime]:
+        """Proiezioni con lo <= inizio <= hi (estremi None = illimitati)."""
+        first = 0 if lo is None else bisect_left(self.starts, lo)
+        last = len(self.starts) if hi is None else bisect_right(self.starts, hi)
+        return self.showtimes[first:last]
+
+
+class ShowtimeIndex:
+    """Proiezioni di uno snapshot, interrogabili per data, fascia oraria, cinema, città e titolo."""
+
+    def __init__(self, cinemas: Iterable[Any], city_of: Optional[Callable[[str], Optional[str]]] = None):
+        """
+        Args:
+            cinemas: Cinema dello snapshot (dizionari JSON o record di models)
+            city_of: Città di un cinema (es. registry.default().city_of), per
+                le query con city; None se il cinema non ha una città
+        """
+        showtimes = []
+        slugs: Dict[str, str] = {}
+        for cinema in models.cinemas_from_json(cinemas):
+            for film in cinema.films:
+                if not film.title:
+                    continue
+                slug = slugs.get(film.title)
+                if slug is None:
+                    slug = slugs[film.title] = film_slug(film.title)
+                for screening in film.screenings:
+                    if not isinstance(screening.date, date):
+                        continue
+                    for value in screening.times:
+                        clock = value if isinstance(value, time) else parse_clock(value)
+                        if clock is None:
+                            continue
+                        showtimes.append(Showtime(
+                            datetime.combine(screening.date, clock),
+                            cinema.name, film.title, slug, film.room, screening.weekday,
+                        ))
+        showtimes.sort(key=Showtime.sort_key)
+
+        by_cinema = defaultdict(list)
+        by_date = defaultdict(list)
+        by_title = defaultdict(list)
+        for showtime in showtimes:
+            by_cinema[showtime.cinema].append(showtime)
+            by_date[showtime.start.date()].append(showtime)
+            by_title[showtime.slug].append(showtime)
+
+        self.all = _Bucket(showtimes)
+        self.by_cinema: Dict[str, _Bucket] = {key: _Bucket(items) for key, items in by_cinema.items()}
+        self.by_date: Dict[date, _Bucket] = {key: _Bucket(items) for key, items in by_date.items()}
+        self.by_title: Dict[str, _Bucket] = {key: _Bucket(items) for key, items in by_title.items()}
+        self.dates = sorted(self.by_date)
+
+        # Cinema e proiezioni di ogni città, uniti una volta qui invece che a ogni query
+        self.city_cinemas: Dict[str, AbstractSet[str]] = {}
+        if city_of is not None:
+            names_by_city = defaultdict(set)
+            for name in by_cinema:
+                city = city_of(name)
+                if city is not None:
+                    names_by_city[city].add(name)
+            self.city_cinemas = {city: frozenset(names) for city, names in names_by_city.items()}
+        self.by_city: Dict[str, _Bucket] = {
+            city: _Bucket([showtime for showtime in showtimes if showtime.cinema in names])
+            for city, names in self.city_cinemas.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.all.showtimes)
+
+    def _title_bucket(self, title: str) -> _Bucket:
+        """Proiezioni dei titoli che contengono title (confronto sugli slug)."""
+        slug = film_slug(title)
+        bucket = self.by_title.get(slug)
+        if bucket is not None:
+            return bucket
+        matches = [self.by_title[key] for key in self.by_title if slug in key]
+        if len(matches) == 1:
+            return matches[0]
+        return _Bucket(list(merge(*(bucket.showtimes for bucket in matches), key=Showtime.sort_key)))
+
+    def query(self, day: Optional[date] = None, start: Optional[time] = None, end: Optional[time] = None,
+              cinema: Optional[str] = None, title: Optional[str] = None,
+              city: Optional[str] = None) -> List[Showtime]:
+        """
+        Proiezioni ordinate per data e ora che soddisfano tutti i filtri.
+
+        Args:
+            day: solo questa data
+            start, end: fascia oraria (estremi inclusi), su ogni data se day è None
+            cinema: nome esatto del cinema
+            title: titolo o parte di esso (maiuscole, accenti e punteggiatura ignorati)
+            city: solo i cinema di questa città (vedi city_of)
+        """
+        if title:
+            bucket = self._title_bucket(title)
+        elif cinema is not None:
+            bucket = self.by_cinema.get(cinema, _Bucket())
+        elif city is not None:
+            bucket = self.by_city.get(city, _Bucket())
+        elif day is not None:
+            bucket = self.by_date.get(day, _Bucket())
+        else:
+            bucket = self.all
+
+        if day is not None:
+            days = [day]
+        elif start is not None or end is not None:
+            days = self.dates
+        else:
+            days = None
+
+        if days is None:
+            results = list(bucket.showtimes)
+        else:
+            results = []
+            for current in days:
+                results.extend(bucket.between(
+                    datetime.combine(current, start or time.min),
+                    datetime.combine(current, end or time.max),
+                ))
+
+        if title and cinema is not None:
+            results = [showtime for showtime in results if showtime.cinema == cinema]
+        if city is not None and (title or cinema is not None):
+            cinemas = self.city_cinemas.get(city, frozenset())
+            results = [showtime for showtime in results if showtime.cinema in cinemas]
+        return results
+
+
+_lock = threading.Lock()
+_last: Tuple[Any, Optional[ShowtimeIndex]] = (None, None)
+
+
+def index_for(source: Dict[str, Any]) -> ShowtimeIndex:
+    """
+    Indice dello snapshot source (nel formato di /api/films), costruito alla
+    prima richiesta, con le città del registro dei cinema.
+    """
+    global _last
+    with _lock:
+        cached_source, index = _last
+        if cached_source is source:
+            return index
+    index = ShowtimeIndex(source.get("cinema", []), registry.default().city_of)
+    with _lock:
+        _last = (source, index)
+    return index
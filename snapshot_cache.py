@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache in memoria degli ultimi risultati dello scraping (stale-while-revalidate).
+
+- entro il TTL lo snapshot viene servito così com'è (HIT);
+- oltre il TTL viene servito subito l'ultimo risultato valido e un thread
+  in background lo aggiorna (STALE);
+- se non esiste ancora uno snapshot la richiesta attende lo scraping (MISS).
+
+Le richieste concorrenti per la stessa chiave vengono unite (single-flight):
+per ogni chiave è in corso al massimo uno scraping alla volta. Come le
+altre richieste attendono lo scraping in corso lo decide follower_wait
+(nell'API: in coda nel controllo di ammissione, fino alla scadenza della richiesta).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+SNAPSHOT_TTL = int(os.environ.get("SNAPSHOT_TTL", "600"))
+
+HIT = "HIT"
+STALE = "STALE"
+MISS = "MISS"
+
+
+class _Snapshot:
+    __slots__ = ("value", "created_at", "stale")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.created_at = time.monotonic()
+        # Da aggiornare alla prossima richiesta anche se entro il TTL (vedi invalidate)
+        self.stale = False
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class _Flight:
+    """Scraping in corso per una chiave, condiviso dai chiamanti concorrenti."""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SnapshotCache:
+    """Cache stale-while-revalidate con single-flight per chiave."""
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL,
+                 follower_wait: Optional[Callable[[threading.Event], None]] = None):
+        """
+        Args:
+            ttl: Secondi entro cui uno snapshot è servito senza aggiornarlo
+            follower_wait: Attesa dello scraping avviato da un'altra richiesta
+                (riceve l'Event che lo segnala, può sollevare eccezioni);
+                default: attesa senza limite
+        """
+        self.ttl = ttl
+        self.follower_wait = follower_wait or (lambda event: event.wait())
+        self._lock = threading.Lock()
+        self._snapshots: Dict[Hashable, _Snapshot] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], wait: bool = True) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            if not wait:
+                return None
+            self.follower_wait(flight.event)
+        else:
+            try:
+                flight.value = loader()
+                with self._lock:
+                    self._snapshots[key] = _Snapshot(flight.value)
+            except BaseException as exc:
+                flight.error = exc
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.event.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._flights:
+                return
+
+        def refresh():
+            try:
+                self._load(key, loader, wait=False)
+            except Exception as exc:
+                # Si continua a servire l'ultimo snapshot valido
+                print(f"Aggiornamento in background di {key} fallito: {exc}")
+
+        threading.Thread(target=refresh, name=f"snapshot-refresh-{key}", daemon=True).start()
+
+    def get(self, key: Hashable, loader: Callable[[], Any],
+            refresh: Optional[Callable[[], Any]] = None) -> Tuple[Any, float, str]:
+        """
+        Restituisce lo snapshot per la chiave, caricandolo con loader se necessario.
+
+        Il valore restituito è condiviso tra le richieste e non va modificato.
+
+        Args:
+            key: Chiave dello snapshot
+            loader: Caricamento quando la richiesta deve attendere lo snapshot
+            refresh: Caricamento per gli aggiornamenti in background, che
+                nessuno attende (default: loader)
+
+        Returns:
+            Tupla (valore, età dello snapshot in secondi, stato HIT/STALE/MISS)
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+
+        if snapshot is not None:
+            age = snapshot.age
+            if age < self.ttl and not snapshot.stale:
+                return snapshot.value, age, HIT
+            self._refresh_in_background(key, refresh or loader)
+            return snapshot.value, age, STALE
+
+        return self._load(key, loader), 0.0, MISS
+
+    def reload(self, key: Hashable, loader: Callable[[], Any]) -> Tuple[Any, float, str]:
+        """Come get, ma carica sempre un nuovo snapshot (unendosi a uno scraping già in corso)."""
+        return self._load(key, loader), 0.0, MISS
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Segna lo snapshot come da aggiornare: continua a essere servito, ma la
+        prossima richiesta avvia l'aggiornamento in background (es. snapshot
+        parziale perché lo scraping ha raggiunto la scadenza).
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                snapshot.stale = True
+
+    def peek(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Snapshot fresco (entro il TTL) per la chiave, senza avviare scraping."""
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if snapshot is None or snapshot.stale or snapshot.age >= self.ttl:
+            return None
+        return snapshot.value, snapshot.age
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
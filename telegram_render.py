@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Messaggio Telegram della programmazione, con varianti e suddivisione.
+
+TelegramRenderer costruisce una volta la rappresentazione intermedia di uno
+snapshot (per ogni film: link IMDb e, per cinema, date e orari già
+ordinati e raggruppati in intervalli) e da quella produce le varianti:
+tutti i cinema o uno solo, tutte le date o un solo giorno, con o senza link
+IMDb, tutte le città del registro o una sola. Ogni variante viene
+formattata una sola volta.
+
+Telegram rifiuta i messaggi oltre TELEGRAM_MAX_LENGTH caratteri (contati
+in unità UTF-16, come fa Telegram): chunks() divide il testo in messaggi
+che rispettano il limite, andando a capo tra un film e l'altro.
+"""
+
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import models
+import registry
+
+TELEGRAM_MAX_LENGTH = int(os.environ.get("TELEGRAM_MAX_LENGTH", "4096"))
+
+HEADER = "🎬 FILM IN PROGRAMMAZIONE"
+
+_MESI = ('gennaio', 'febbraio', 'marzo', 'aprile', 'maggio', 'giugno', 'luglio',
+         'agosto', 'settembre', 'ottobre', 'novembre', 'dicembre')
+_GIORNI = ('lunedì', 'martedì', 'mercoledì', 'giovedì', 'venerdì', 'sabato', 'domenica')
+
+
+def short_name(cinema: str) -> str:
+    """Nome breve del cinema usato nel messaggio (campo "breve" del registro)."""
+    return registry.default().short_name(cinema)
+
+
+def _format_day(day: models.DateValue) -> str:
+    if isinstance(day, date):
+        return f"{day.day} {_MESI[day.month - 1]}"
+    # Data non ISO conservata come stringa
+    anno, mese, giorno = day.split('-')
+    mesi = {f"{i:02d}": nome for i, nome in enumerate(_MESI, 1)}
+    return f"{int(giorno)} {mesi.get(mese, mese)}"
+
+
+def _format_range(start: models.DateValue, end: models.DateValue) -> str:
+    if start == end:
+        return _format_day(start)
+    a_y, a_m, a_d = models.format_date(start).split('-')
+    b_y, b_m, b_d = models.format_date(end).split('-')
+    if a_y == b_y and a_m == b_m:
+        return f"{int(a_d)}-{_format_day(end)}"
+    return f"{_format_day(start)} → {_format_day(end)}"
+
+
+def _as_date(day: models.DateValue) -> date:
+    return day if isinstance(day, date) else datetime.fromisoformat(day).date()
+
+
+def _group(days: List[Tuple[models.DateValue, List[str]]]) -> List[Tuple[str, str]]:
+    """Righe (intervallo di date, orari) con le date consecutive con gli stessi orari unite."""
+    groups = []
+    for day, times in days:
+        if groups and times == groups[-1][2] and (_as_date(day) - _as_date(groups[-1][1])).days == 1:
+            groups[-1][1] = day
+        else:
+            groups.append([day, day, times])
+    return [(_format_range(start, end), ' • '.join(times)) for start, end, times in groups]
+
+
+def message_length(text: str) -> int:
+    """Lunghezza del testo in unità UTF-16, come la conta Telegram."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _split_long(block: str, limit: int) -> List[str]:
+    """Divide un blocco più lungo del limite tra una riga e l'altra (le righe troppo lunghe vengono tagliate)."""
+    pieces = []
+    current: List[str] = []
+    size = 0
+    for line in block.split("\n"):
+        while message_length(line) > limit:
+            cut = limit
+            while message_length(line[:cut]) > limit:
+                cut -= 1
+            pieces.append(line[:cut])
+            line = line[cut:]
+        added = message_length(line) + (1 if current else 0)
+        if current and size + added > limit:
+            pieces.append("\n".join(current))
+            current, size, added = [], 0, message_length(line)
+        current.append(line)
+        size += added
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def chunk_blocks(blocks: List[str], limit: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+    """
+    Unisce i blocchi (intestazione, un blocco per film, piè di pagina) in
+    messaggi di al massimo limit caratteri, senza spezzare un film se non
+    è più lungo di un intero messaggio.
+    """
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for block in blocks:
+        pieces = [block] if message_length(block) <= limit else _split_long(block, limit)
+        for piece in pieces:
+            added = message_length(piece) + (1 if current else 0)
+            if current and size + added > limit:
+                chunks.append("\n".join(current).rstrip("\n"))
+                current, size, added = [], 0, message_length(piece)
+            current.append(piece)
+            size += added
+    if current:
+        chunks.append("\n".join(current).rstrip("\n"))
+    return [chunk for chunk in chunks if chunk]
+
+
+class _Film:
+    """Un film nella rappresentazione intermedia."""
+
+    __slots__ = ("title", "imdb_url", "cinemas", "groups")
+
+    def __init__(self, title: str):
+        self.title = title
+        self.imdb_url: Optional[str] = None
+        # nome breve del cinema -> [(data, orari "HH:MM" ordinati)] in ordine di data
+        self.cinemas: Dict[str, List[Tuple[models.DateValue, List[str]]]] = {}
+        # nome breve del cinema -> righe (intervallo, orari) con tutte le date
+        self.groups: Dict[str, List[Tuple[str, str]]] = {}
+
+
+Variant = Tuple[Optional[str], Optional[date], bool, Optional[str]]
+
+
+class TelegramRenderer:
+    """Messaggi Telegram di uno snapshot, formattati una volta per variante."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.timestamp = data.get('timestamp')
+        # nome breve del cinema -> città del registro (None se il cinema non è nel registro)
+        self.cities: Dict[str, Optional[str]] = {}
+        with metrics.TELEGRAM_RENDER_SECONDS.labels("build").time():
+            self.films: List[_Film] = self._build(data.get('cinema', []), self.cities)
+        self._lock = threading.Lock()
+        self._blocks: Dict[Variant, List[str]] = {}
+        self._chunks: Dict[Tuple[Variant, int], List[str]] = {}
+
+    @staticmethod
+    def _build(cinemas, cities: Dict[str, Optional[str]]) -> List[_Film]:
+        films: Dict[str, _Film] = {}
+        # titolo -> cinema -> data -> orari "HH:MM"
+        schedule: Dict[str, Dict[str, Dict[models.DateValue, frozenset]]] = {}
+        # Le tuple di orari sono condivise tra i record: testi e ordinamenti si calcolano una volta
+        time_texts: Dict[tuple, frozenset] = {}
+        sorted_times: Dict[frozenset, List[str]] = {}
+
+        for cinema in models.cinemas_from_json(cinemas):
+            cinema_short = short_name(cinema.name)
+            cities[cinema_short] = registry.default().city_of(cinema.name)
+            for film in cinema.films:
+                title = film.title
+                if not title:
+                    continue
+                entry = films.get(title)
+                if entry is None:
+                    entry = films[title] = _Film(title)
+                extra = film.extra
+                if extra:
+                    if extra.get('imdb_url'):
+                        entry.imdb_url = extra['imdb_url']
+                    elif extra.get('imdb'):
+                        entry.imdb_url = f"https://www.imdb.com/title/{extra['imdb']}/"
+
+                date_map = None
+                for screening in film.screenings:
+                    if not screening.date or not screening.times:
+                        continue
+                    texts = time_texts.get(screening.times)
+                    if texts is None:
+                        texts = time_texts[screening.times] = frozenset(
+                            text.replace('.', ':') for text in models.format_times(screening.times, ':') if text
+                        )
+                    if not texts:
+                        continue
+                    if date_map is None:
+                        date_map = schedule.setdefault(title, {}).setdefault(cinema_short, {})
+                    current = date_map.get(screening.date)
+                    date_map[screening.date] = texts if current is None else current | texts
+
+        result = []
+        for title in sorted(schedule):
+            entry = films[title]
+            for cinema_short in sorted(schedule[title]):
+                date_map = schedule[title][cinema_short]
+                try:
+                    days = sorted(date_map)
+                except TypeError:
+                    # Date non ISO conservate come stringhe accanto a oggetti date
+                    days = sorted(date_map, key=models.format_date)
+                ordered = []
+                for day in days:
+                    texts = date_map[day]
+                    times = sorted_times.get(texts)
+                    if times is None:
+                        times = sorted_times[texts] = sorted(texts)
+                    ordered.append((day, times))
+                entry.cinemas[cinema_short] = ordered
+                entry.groups[cinema_short] = _group(ordered)
+            result.append(entry)
+        return result
+
+    def _header(self, cinema: Optional[str], day: Optional[date], city: Optional[str]) -> str:
+        if city is None:
+            # Senza filtro la città compare solo se lo snapshot ne contiene una sola
+            known = {value for value in self.cities.values() if value is not None}
+            cities = known or set(registry.default().cities())
+            city = next(iter(cities)) if len(cities) == 1 else None
+        parts = [f"{HEADER} - {city.upper()}" if city else HEADER]
+        if cinema is not None:
+            parts.append(short_name(cinema))
+        if day is not None:
+            parts.append(f"{_GIORNI[day.weekday()]} {_format_day(day)}")
+        return " · ".join(parts) + "\n"
+
+    def _footer(self) -> Optional[str]:
+        if not self.timestamp:
+            return None
+        try:
+            dt_obj = datetime.fromisoformat(self.timestamp.replace('Z', '+00:00'))
+        except Exception:
+            return None
+        return f"Aggiornato il {dt_obj.strftime('%d/%m/%Y alle %H:%M')}"
+
+    def _film_block(self, film: _Film, cinema: Optional[str], day: Optional[date], links: bool,
+                    city: Optional[str]) -> Optional[str]:
+        lines = []
+        for cinema_short, groups in film.groups.items():
+            if cinema is not None and cinema_short != cinema:
+                continue
+            if city is not None and self.cities.get(cinema_short) != city:
+                continue
+            if day is not None:
+                times = next((times for d, times in film.cinemas[cinema_short] if d == day), None)
+                groups = [(_format_day(day), ' • '.join(times))] if times else []
+            for label, times in groups:
+                lines.append(f"   📅 {label} · {cinema_short}")
+                lines.append(f"      🕐 {times}")
+        if not lines:
+            return None
+        title = f"📽️ {film.title} · {film.imdb_url}" if links and film.imdb_url else f"📽️ {film.title}"
+        return "\n".join([title] + lines + [""])
+
+    def blocks(self, cinema: Optional[str] = None, day: Optional[date] = None, links: bool = True,
+               city: Optional[str] = None) -> List[str]:
+        """Intestazione, un blocco per film e piè di pagina della variante."""
+        variant = (cinema, day, links, city)
+        with self._lock:
+            blocks = self._blocks.get(variant)
+        if blocks is None:
+            with metrics.TELEGRAM_RENDER_SECONDS.labels("blocks").time():
+                cinema_short = short_name(cinema) if cinema is not None else None
+                if city is None and cinema is not None:
+                    city = registry.default().city_of(cinema)
+                blocks = [self._header(cinema, day, city)]
+                for film in self.films:
+                    block = self._film_block(film, cinema_short, day, links, city)
+                    if block is not None:
+                        blocks.append(block)
+                footer = self._footer()
+                if footer is not None:
+                    blocks.append(footer)
+            with self._lock:
+                self._blocks[variant] = blocks
+        return blocks
+
+    def render(self, cinema: Optional[str] = None, day: Optional[date] = None, links: bool = True,
+               city: Optional[str] = None) -> str:
+        """
+        Messaggio completo della variante.
+
+        Args:
+            cinema: solo questo cinema (nome completo o breve)
+            day: solo questa data
+            links: includere i link IMDb dei film arricchiti
+            city: solo i cinema di questa città del registro
+        """
+        return "\n".join(self.blocks(cinema, day, links, city))
+
+    def chunks(self, cinema: Optional[str] = None, day: Optional[date] = None, links: bool = True,
+               city: Optional[str] = None, limit: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+        """Messaggio della variante diviso in messaggi di al massimo limit caratteri."""
+        key = ((cinema, day, links, city), limit)
+        with self._lock:
+            chunks = self._chunks.get(key)
+        if chunks is None:
+            blocks = self.blocks(cinema, day, links, city)
+            with metrics.TELEGRAM_RENDER_SECONDS.labels("chunks").time():
+                chunks = chunk_blocks(blocks, limit)
+            with self._lock:
+                self._chunks[key] = chunks
+        return chunks
+
+
+# Renderer degli snapshot serviti più di recente (es. con e senza ?enrich=1)
+RENDERER_CACHE_SIZE = 4
+
+_lock = threading.Lock()
+_recent: List[Tuple[Any, TelegramRenderer]] = []
+
+
+def renderer_for(source: Dict[str, Any]) -> TelegramRenderer:
+    """Renderer dello snapshot source (nel formato di /api/films), costruito alla prima richiesta."""
+    with _lock:
+        for cached_source, renderer in _recent:
+            if cached_source is source:
+                return renderer
+    renderer = TelegramRenderer(source)
+    with _lock:
+        _recent.insert(0, (source, renderer))
+        del _recent[RENDERER_CACHE_SIZE:]
+    return renderer
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ricerca approssimata dei titoli in programmazione per /api/films/search.
+
+I titoli vengono normalizzati come gli slug di scraper.film_slug (niente
+accenti, maiuscole e punteggiatura, numeri romani come cifre) e scomposti
+nei trigrammi di ogni parola ("  gl", " gla", ...). Un indice invertito
+trigramma -> titoli, costruito una volta per snapshot, trova i candidati
+senza confrontare la query con ogni titolo; il punteggio premia i titoli
+che contengono quasi tutti i trigrammi della query (titoli parziali) e,
+a parità, quelli che non ne hanno molti altri (errori di battitura).
+"""
+
+import os
+import threading
+from collections import Counter
+from heapq import nlargest
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from scraper import film_slug
+
+# Punteggio minimo (0-1) di un risultato
+SEARCH_MIN_SCORE = float(os.environ.get("SEARCH_MIN_SCORE", "0.35"))
+# Peso della copertura della query rispetto alla somiglianza complessiva
+_COVERAGE_WEIGHT = 0.6
+
+# "Il gladiatore II" e "il gladiatore 2" sono lo stesso titolo ("i" resta un articolo)
+_ROMAN = {"ii": "2", "iii": "3", "iv": "4", "v": "5", "vi": "6", "vii": "7", "viii": "8", "ix": "9", "x": "10"}
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Trigrammi delle parole del testo normalizzato."""
+    grams = set()
+    for word in film_slug(text).split('-'):
+        if not word:
+            continue
+        padded = f"  {_ROMAN.get(word, word)} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TitleIndex:
+    """Indice a trigrammi dei titoli di uno snapshot."""
+
+    def __init__(self, cinemas: Iterable[Dict[str, Any]]):
+        self.titles: List[str] = []
+        self.slugs: List[str] = []
+        self.cinemas: List[List[str]] = []
+        self.sizes: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+
+        positions: Dict[str, int] = {}
+        for cinema in cinemas:
+            for film in cinema.get("film", []):
+                title = film.get("titolo")
+                if not title:
+                    continue
+                slug = film_slug(title)
+                position = positions.get(slug)
+                if position is None:
+                    position = positions[slug] = len(self.titles)
+                    grams = trigrams(title)
+                    self.titles.append(title)
+                    self.slugs.append(slug)
+                    self.cinemas.append([])
+                    self.sizes.append(len(grams))
+                    for gram in grams:
+                        self.postings.setdefault(gram, []).append(position)
+                if cinema.get("cinema") not in self.cinemas[position]:
+                    self.cinemas[position].append(cinema.get("cinema"))
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def search(self, query: str, limit: int = 10,
+               min_score: float = SEARCH_MIN_SCORE) -> List[Tuple[float, int]]:
+        """
+        Titoli più simili alla query, dal più simile.
+
+        Returns:
+            Lista di (punteggio 0-1, posizione del titolo in titles/slugs/cinemas)
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            titles = self.postings.get(gram)
+            if titles:
+                shared.update(titles)
+
+        # Il punteggio non supera la copertura della query: gli altri candidati si scartano subito
+        total = len(grams)
+        required = min_score * total
+        sizes = self.sizes
+        scored = [
+            (_COVERAGE_WEIGHT * count / total + (1 - _COVERAGE_WEIGHT) * count / (total + sizes[position] - count),
+             position)
+            for position, count in shared.items() if count >= required
+        ]
+        return nlargest(limit, (item for item in scored if item[0] >= min_score),
+                        key=lambda item: (item[0], -item[1]))
+
+
+_lock = threading.Lock()
+_last: Tuple[Any, Optional[TitleIndex]] = (None, None)
+
+
+def index_for(source: Dict[str, Any]) -> TitleIndex:
+    """Indice dei titoli dello snapshot source (nel formato di /api/films), costruito alla prima richiesta."""
+    global _last
+    with _lock:
+        cached_source, index = _last
+        if cached_source is source:
+            return index
+    index = TitleIndex(source.get("cinema", []))
+    with _lock:
+        _last = (source, index)
+    return index
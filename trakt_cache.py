@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Persistent SQLite cache for Trakt lookups.
+
+Lookups are keyed by normalized title and optional year. Positive results
+never expire (TMDB/IMDB ids of a film do not change), while "not found" and
+error results are kept only for a short TTL so they are retried later.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+TRAKT_CACHE_PATH = os.getenv("TRAKT_CACHE_PATH", ".cache/trakt.sqlite3")
+TRAKT_NOT_FOUND_TTL = int(os.getenv("TRAKT_NOT_FOUND_TTL", "21600"))
+TRAKT_ERROR_TTL = int(os.getenv("TRAKT_ERROR_TTL", "600"))
+
+FOUND = "found"
+NOT_FOUND = "not_found"
+ERROR = "error"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a title for use as cache key (Unicode form, case, whitespace)."""
+    title = unicodedata.normalize("NFKC", title)
+    return _WHITESPACE_RE.sub(" ", title).strip().casefold()
+
+
+class CachedLookup:
+    """A cached lookup outcome: ``status`` is one of found/not_found/error."""
+
+    __slots__ = ("status", "payload")
+
+    def __init__(self, status: str, payload: Optional[Dict[str, Any]]):
+        self.status = status
+        self.payload = payload
+
+
+class TraktCache:
+    """SQLite-backed cache of Trakt search results (thread-safe)."""
+
+    def __init__(self, path: str = TRAKT_CACHE_PATH,
+                 not_found_ttl: int = TRAKT_NOT_FOUND_TTL,
+                 error_ttl: int = TRAKT_ERROR_TTL):
+        self.path = path
+        self.not_found_ttl = not_found_ttl
+        self.error_ttl = error_ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS lookups (
+                    key TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    expires_at REAL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def _key(title: str, year: Optional[int]) -> str:
+        return f"{normalize_title(title)}|{year or ''}"
+
+    def get(self, title: str, year: Optional[int] = None) -> Optional[CachedLookup]:
+        """Return the cached outcome for a title, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, payload, expires_at FROM lookups WHERE key = ?",
+                (self._key(title, year),),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status, payload, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return CachedLookup(status, json.loads(payload) if payload else None)
+
+    def _put(self, title: str, year: Optional[int], status: str,
+             payload: Optional[Dict[str, Any]], ttl: Optional[int]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lookups (key, status, payload, expires_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    self._key(title, year),
+                    status,
+                    json.dumps(payload) if payload is not None else None,
+                    now + ttl if ttl is not None else None,
+                    now,
+                ),
+            )
+
+    def put_found(self, title: str, result: Dict[str, Any], year: Optional[int] = None) -> None:
+        """Store a positive result; it never expires."""
+        self._put(title, year, FOUND, result, None)
+
+    def put_not_found(self, title: str, year: Optional[int] = None) -> None:
+        """Store a "not found" outcome for ``not_found_ttl`` seconds."""
+        self._put(title, year, NOT_FOUND, None, self.not_found_ttl)
+
+    def put_error(self, title: str, status_code: Optional[int], message: str,
+                  year: Optional[int] = None) -> None:
+        """Store an error outcome for ``error_ttl`` seconds."""
+        self._put(title, year, ERROR, {"status": status_code, "message": message}, self.error_ttl)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of stored (non-expired) entries per status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM lookups "
+                "WHERE expires_at IS NULL OR expires_at > ? GROUP BY status",
+                (time.time(),),
+            ).fetchall()
+        counts = {FOUND: 0, NOT_FOUND: 0, ERROR: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+_cache: Optional[TraktCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TraktCache:
+    """Return the shared cache stored at TRAKT_CACHE_PATH."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TraktCache()
+    return _cache
@@ -3,24 +3,167 @@
 
 from __future__ import annotations
 
-from typing import Dict, Any, List, Tuple
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional, Tuple
 
-from trakt_search import search_movie, TraktError
+import requests
+
+import metrics
+import profiling
+from rate_limit import TokenBucket
+from trakt_cache import TraktCache, get_cache, normalize_title, FOUND, NOT_FOUND
+from trakt_search import search_movie, get_trakt_client_id, TraktError
+
+# Trakt allows 1000 GET calls every 5 minutes per application
+TRAKT_RATE_LIMIT = int(os.getenv("TRAKT_RATE_LIMIT", "1000"))
+TRAKT_RATE_PERIOD = float(os.getenv("TRAKT_RATE_PERIOD", "300"))
+TRAKT_RATE_BURST = int(os.getenv("TRAKT_RATE_BURST", "10"))
+TRAKT_MAX_WORKERS = int(os.getenv("TRAKT_MAX_WORKERS", "4"))
+TRAKT_MAX_RETRIES = int(os.getenv("TRAKT_MAX_RETRIES", "3"))
+TRAKT_TIMEOUT = float(os.getenv("TRAKT_TIMEOUT", "15"))
+# Overall time budget for one enrichment, in seconds
+TRAKT_DEADLINE = float(os.getenv("TRAKT_DEADLINE", "20"))
+
+DEADLINE_ERROR = {"status": None, "message": "deadline exceeded"}
+
+# Shared by every enrichment so concurrent requests respect the same limit
+_limiter = TokenBucket(TRAKT_RATE_LIMIT / TRAKT_RATE_PERIOD, TRAKT_RATE_BURST)
 
 
 class MissingTraktCredentials(RuntimeError):
     """Raised when the Trakt client ID is not configured."""
 
 
-def enrich_with_trakt(cinemas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+def _cached_lookup(title: str, cache: TraktCache) -> Optional[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """Resolve a title from the cache only.
+
+    Returns:
+        ``(result, None)`` or ``(None, error)`` when cached, None on a cache miss.
+    """
+    cached = cache.get(title)
+    if cached is None:
+        return None
+    if cached.status == FOUND:
+        return cached.payload, None
+    if cached.status == NOT_FOUND:
+        return None, {"status": None, "message": "not found"}
+    return None, cached.payload
+
+
+def _search(title: str, cache: TraktCache, limiter: TokenBucket,
+            deadline: Optional[float]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], int, int]:
+    """Query Trakt for a title within the rate limit and the overall deadline
+    (a ``time.monotonic()`` value, or None for no deadline).
+
+    A ``429`` pauses the shared limiter for ``Retry-After`` seconds and the
+    request is retried (at most ``TRAKT_MAX_RETRIES`` times). Only definitive
+    outcomes are cached: a 429 left after the retries, a timeout or the
+    deadline return an error that is not stored, so the next enrichment
+    tries the title again.
+
+    Returns:
+        ``(result, error, calls, rate_limited)`` with the number of requests
+        sent and how many of them got a 429.
+    """
+    calls = rate_limited = 0
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return None, dict(DEADLINE_ERROR), calls, rate_limited
+        if not limiter.acquire(timeout=remaining):
+            return None, dict(DEADLINE_ERROR), calls, rate_limited
+
+        calls += 1
+        try:
+            timeout = TRAKT_TIMEOUT if remaining is None else min(TRAKT_TIMEOUT, remaining)
+            results = search_movie(title, limit=1, timeout=timeout)
+        except TraktError as exc:
+            if exc.status_code == 429:
+                rate_limited += 1
+                if rate_limited <= TRAKT_MAX_RETRIES:
+                    limiter.pause(exc.retry_after if exc.retry_after is not None else 1.0)
+                    continue
+            else:
+                cache.put_error(title, exc.status_code, exc.message)
+            return None, {"status": exc.status_code, "message": exc.message}, calls, rate_limited
+        except requests.RequestException as exc:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None, dict(DEADLINE_ERROR), calls, rate_limited
+            return None, {"status": None, "message": str(exc)}, calls, rate_limited
+
+        if not results:
+            cache.put_not_found(title)
+            return None, {"status": None, "message": "not found"}, calls, rate_limited
+
+        cache.put_found(title, results[0])
+        return results[0], None, calls, rate_limited
+
+
+def _timed_search(title: str, cache: TraktCache, limiter: TokenBucket,
+                  deadline: Optional[float]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], int, int]:
+    """``_search`` recording its duration in ``trakt_lookup_duration_seconds`` by outcome."""
+    started = time.perf_counter()
+    outcome = _search(title, cache, limiter, deadline)
+    result, error = outcome[0], outcome[1]
+    if result is not None:
+        label = "found"
+    elif error.get("message") == DEADLINE_ERROR["message"]:
+        label = "deadline"
+    elif error.get("message") == "not found":
+        label = "not_found"
+    else:
+        label = "error"
+    metrics.TRAKT_LOOKUP_SECONDS.labels(label).observe(time.perf_counter() - started)
+    return outcome
+
+
+def enrich_with_trakt(cinemas: List[Dict[str, Any]],
+                      cache: Optional[TraktCache] = None,
+                      stats: Optional[Dict[str, Any]] = None,
+                      deadline: Optional[float] = None,
+                      max_workers: Optional[int] = None,
+                      limiter: Optional[TokenBucket] = None) -> Dict[str, Dict[str, Any]]:
     """Enrich the scraped programmazione with Trakt data.
 
+    Lookups go through a persistent cache first, so films already seen
+    cause no Trakt calls. Cache misses are resolved concurrently behind a
+    token-bucket limiter. Titles not resolved within ``deadline`` seconds
+    are returned with ``trakt_error`` "deadline exceeded" and
+    ``trakt_incomplete`` set, instead of failing the whole enrichment.
+
     Args:
         cinemas: list of cinema dicts as produced by ``scrape_cinema``
+        cache: lookup cache (defaults to the shared ``trakt_cache`` instance)
+        stats: optional dict filled with cache statistics for this call
+        deadline: overall time budget in seconds (default: no deadline; the
+            API passes ``TRAKT_DEADLINE`` or what is left of the request's)
+        max_workers: concurrent Trakt requests (default ``TRAKT_MAX_WORKERS``)
+        limiter: rate limiter (defaults to the shared Trakt limiter)
 
     Returns:
         A dictionary keyed by film title with aggregated metadata (tmdb, imdb, etc.).
     """
+    try:
+        get_trakt_client_id()
+    except ValueError as exc:
+        raise MissingTraktCredentials(str(exc)) from exc
+
+    if cache is None:
+        cache = get_cache()
+    if limiter is None:
+        limiter = _limiter
+    expires_at = None if deadline is None else time.monotonic() + deadline
+    counters = {
+        "hits": 0,
+        "negative_hits": 0,
+        "misses": 0,
+        "trakt_calls": 0,
+        "rate_limited": 0,
+        "incomplete": 0,
+    }
+
     # Collect unique films keeping references to the original film entries
     films: Dict[str, Dict[str, Any]] = {}
 
@@ -49,21 +192,61 @@ def enrich_with_trakt(cinemas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]
             entry["programmazione"].extend(film.get("programmazione", []))
             entry["refs"].append(film)
 
-    # Query Trakt for each film and propagate ids
-    for title, info in films.items():
-        try:
-            results = search_movie(title, limit=1)
-        except ValueError as exc:
-            raise MissingTraktCredentials(str(exc)) from exc
-        except TraktError as exc:
-            info["trakt_error"] = {"status": exc.status_code, "message": exc.message}
+    # Resolve each title from the cache, then query Trakt concurrently for the misses
+    outcomes: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+    misses: List[str] = []
+    for title in films:
+        started = time.perf_counter()
+        outcome = _cached_lookup(title, cache)
+        if outcome is None:
+            misses.append(title)
             continue
+        kind = "hits" if outcome[0] is not None else "negative_hits"
+        counters[kind] += 1
+        metrics.TRAKT_LOOKUP_SECONDS.labels(
+            "cache_hit" if kind == "hits" else "cache_negative"
+        ).observe(time.perf_counter() - started)
+        outcomes[title] = outcome
 
-        if not results:
-            info["trakt_error"] = {"status": None, "message": "not found"}
+    # Titles that differ only by case/spacing share a single Trakt request
+    pending: Dict[str, List[str]] = {}
+    for title in misses:
+        pending.setdefault(normalize_title(title), []).append(title)
+
+    counters["misses"] = len(misses)
+    if pending:
+        workers = min(max_workers or TRAKT_MAX_WORKERS, len(pending))
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        search = profiling.bind(_timed_search)
+        futures = {
+            executor.submit(search, titles[0], cache, limiter, expires_at): titles
+            for titles in pending.values()
+        }
+        timeout = None if expires_at is None else max(0.0, expires_at - time.monotonic())
+        done, _ = wait(futures, timeout=timeout)
+        # Lookups still running finish in the background and only fill the cache
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for future, titles in futures.items():
+            if future in done:
+                result, error, calls, rate_limited = future.result()
+                counters["trakt_calls"] += calls
+                counters["rate_limited"] += rate_limited
+            else:
+                result, error = None, dict(DEADLINE_ERROR)
+            for title in titles:
+                outcomes[title] = (result, error)
+
+    # Propagate ids in the original film order
+    for title, info in films.items():
+        result, error = outcomes[title]
+        if error is not None:
+            info["trakt_error"] = error
+            if error == DEADLINE_ERROR:
+                info["trakt_incomplete"] = True
+                counters["incomplete"] += 1
             continue
 
-        result = results[0]
         info["tmdb"] = result.get("tmdb")
         info["imdb"] = result.get("imdb")
         info["trakt"] = result.get("trakt") or result.get("slug")
@@ -95,6 +278,12 @@ def enrich_with_trakt(cinemas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]
         }
         if "trakt_error" in info:
             aggregated[title]["trakt_error"] = info["trakt_error"]
+        if info.get("trakt_incomplete"):
+            aggregated[title]["trakt_incomplete"] = True
+
+    if stats is not None:
+        stats.update(counters)
+        stats["stored"] = cache.stats()
 
     return aggregated
 
@@ -4,18 +4,30 @@
 import os
 import sys
 import argparse
-import requests
 from typing import List, Dict, Any, Optional
 
-TRAKT_API_URL = "https://api.trakt.tv"
+import http_client
+
+TRAKT_API_URL = os.getenv("TRAKT_API_URL", "https://api.trakt.tv")
 TRAKT_API_VERSION = "2"
 
 class TraktError(Exception):
     """Errore generico durante la chiamata a Trakt."""
-    def __init__(self, status_code: int, message: str):
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
         super().__init__(message)
         self.status_code = status_code
         self.message = message
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Interpreta l'header Retry-After (secondi); None se assente o non numerico."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
 
 
 def get_trakt_client_id() -> str:
@@ -33,13 +45,15 @@ def get_trakt_client_id() -> str:
     return client_id
 
 
-def search_movie(query: str, year: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+def search_movie(query: str, year: Optional[int] = None, limit: int = 10,
+                 timeout: float = 15) -> List[Dict[str, Any]]:
     """Esegue una ricerca film su Trakt.
 
     Args:
         query: stringa da cercare (titolo del film)
         year: opzionale, anno per restringere la ricerca
         limit: numero massimo di risultati da restituire (default 10)
+        timeout: timeout della richiesta in secondi (default 15)
 
     Returns:
         Lista di risultati con informazioni su titolo, anno, tmdb, imdb, slug, score.
@@ -61,15 +75,19 @@ def search_movie(query: str, year: Optional[int] = None, limit: int = 10) -> Lis
         "trakt-api-key": client_id,
     }
 
-    response = requests.get(
+    response = http_client.fetch(
         f"{TRAKT_API_URL}/search/movie",
         params=params,
         headers=headers,
-        timeout=15,
+        timeout=timeout,
     )
 
     if not response.ok:
-        raise TraktError(response.status_code, response.text)
+        raise TraktError(
+            response.status_code,
+            response.text,
+            retry_after=_parse_retry_after(response.headers.get("Retry-After")),
+        )
 
     data = response.json()
 
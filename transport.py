@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trasporto HTTP intercambiabile per la Session condivisa di http_client.
+
+- "live": richieste verso la rete (default);
+- "record": come live, ma ogni risposta (URL, stato, header, corpo e
+  durata) viene salvata nell'archivio;
+- "replay": le risposte vengono servite dall'archivio senza accedere alla
+  rete, opzionalmente riproducendo la latenza registrata.
+
+L'archivio è una directory con un file JSON per richiesta (metodo + URL),
+così la registrazione da più thread non richiede coordinamento. Un
+archivio può anche essere costruito da pagine già salvate, ad esempio le
+fixture: python transport.py import fixtures/comingsoon .cache/transport
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+from http import HTTPStatus
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (LIVE, RECORD, REPLAY)
+
+TRANSPORT = os.environ.get("SCRAPER_TRANSPORT", LIVE)
+ARCHIVE_DIR = os.environ.get("SCRAPER_TRANSPORT_ARCHIVE", ".cache/transport")
+# Frazione della latenza registrata riprodotta in replay (0 = massima velocità, 1 = originale)
+REPLAY_LATENCY = float(os.environ.get("SCRAPER_REPLAY_LATENCY", "0"))
+
+# Header che descrivono la codifica sul filo: il corpo archiviato è già decodificato
+_WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+_STATUSES = {status.value for status in HTTPStatus}
+
+
+def _entry_path(directory: str, method: str, url: str) -> str:
+    key = hashlib.sha256(f"{method.upper()} {url}".encode("utf-8")).hexdigest()
+    return os.path.join(directory, f"{key}.json")
+
+
+def _write_atomic(path: str, data: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_entry(directory: str, method: str, url: str, status: int, headers: Dict[str, str],
+               body: bytes, elapsed: float = 0.0) -> None:
+    """Salva una risposta nell'archivio (un 304 non sostituisce un corpo già registrato)."""
+    path = _entry_path(directory, method, url)
+    if status == 304 and os.path.exists(path):
+        return
+    try:
+        text, body_encoding = body.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        text, body_encoding = base64.b64encode(body).decode("ascii"), "base64"
+    _write_atomic(path, json.dumps({
+        "method": method.upper(),
+        "url": url,
+        "status": status,
+        "headers": {k: v for k, v in headers.items() if k.lower() not in _WIRE_HEADERS},
+        "body": text,
+        "body_encoding": body_encoding,
+        "elapsed": elapsed,
+        "recorded_at": time.time(),
+    }, ensure_ascii=False))
+
+
+def load_entry(directory: str, method: str, url: str) -> Optional[Dict[str, Any]]:
+    """Risposta registrata per metodo e URL, None se assente."""
+    try:
+        with open(_entry_path(directory, method, url), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("url") != url:
+        return None
+    return entry
+
+
+class RecordingAdapter(BaseAdapter):
+    """Inoltra le richieste a un altro adapter e ne archivia le risposte."""
+
+    def __init__(self, inner: BaseAdapter, directory: str = ARCHIVE_DIR):
+        super().__init__()
+        self.inner = inner
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = self.inner.send(request, **kwargs)
+        body = response.content  # resta disponibile al chiamante
+        elapsed = time.perf_counter() - start
+        save_entry(self.directory, request.method, request.url,
+                   response.status_code, dict(response.headers), body, elapsed)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serve le risposte dall'archivio.
+
+    Le richieste condizionali ricevono 304 se l'ETag registrato coincide;
+    un URL assente dall'archivio produce requests.ConnectionError, come
+    un host irraggiungibile.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, latency: float = REPLAY_LATENCY):
+        super().__init__()
+        self.directory = directory
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        entry = load_entry(self.directory, request.method, request.url)
+        if entry is None:
+            raise requests.ConnectionError(f"Nessuna risposta registrata per {request.url}", request=request)
+
+        if self.latency > 0:
+            time.sleep(entry.get("elapsed", 0.0) * self.latency)
+
+        headers = CaseInsensitiveDict(entry.get("headers", {}))
+        status = entry["status"]
+        if entry.get("body_encoding") == "base64":
+            body = base64.b64decode(entry["body"])
+        else:
+            body = entry["body"].encode("utf-8")
+
+        etag = headers.get("ETag")
+        if etag and request.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = headers
+        response._content = body
+        response.encoding = get_encoding_from_headers(headers)
+        response.url = request.url
+        response.request = request
+        response.reason = HTTPStatus(status).phrase if status in _STATUSES else ""
+        response.elapsed = timedelta(seconds=entry.get("elapsed", 0.0) * self.latency)
+        return response
+
+    def close(self):
+        pass
+
+
+def import_pages(source_dir: str, directory: str = ARCHIVE_DIR) -> int:
+    """
+    Aggiunge all'archivio le pagine di una directory con index.json (URL -> file),
+    come fixtures/comingsoon.
+
+    Returns:
+        Numero di pagine importate
+    """
+    with open(os.path.join(source_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    os.makedirs(directory, exist_ok=True)
+    for url, filename in index.items():
+        with open(os.path.join(source_dir, filename), "rb") as f:
+            body = f.read()
+        save_entry(directory, "GET", url, 200, {"Content-Type": "text/html; charset=utf-8"}, body)
+    return len(index)
+
+
+def main(argv) -> int:
+    if len(argv) not in (2, 3) or argv[0] != "import":
+        print("Uso: python transport.py import <directory con index.json> [archivio]")
+        return 2
+    directory = argv[2] if len(argv) == 3 else ARCHIVE_DIR
+    count = import_pages(argv[1], directory)
+    print(f"{count} pagine importate in {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))